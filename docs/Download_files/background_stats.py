@@ -0,0 +1,300 @@
+"""
+Background Statistics for Hyperspectral Detectors
+Mean / covariance of a cube computed once and shared by RX, ACE and MF
+"""
+
+import numpy as np
+from typing import Optional
+import logging
+from scipy import linalg
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundStatistics:
+    """
+    Gaussian background model of a hyperspectral cube
+    
+    Holds the mean, covariance, inverse covariance and the lower Cholesky
+    factor (cov = L @ L.T). The inverse is derived from the Cholesky
+    factor, so one O(N * B^2) pass and one B x B factorization serve every
+    detector that needs the background.
+    
+    A singular covariance (duplicated or dead bands, fewer pixels than
+    bands) is shrunk toward a scaled identity until it factorizes; if even
+    that fails, the pseudo-inverse is used and cholesky is None.
+    """
+    
+    # Pixels per block for the streamed passes (bounds temporary memory)
+    CHUNK_PIXELS = 16384
+    
+    # Shrinkage intensities tried, in order, for a singular covariance
+    SHRINKAGE_STEPS = (1e-6, 1e-4, 1e-2)
+    
+    def __init__(
+        self,
+        mean: np.ndarray,
+        cov: np.ndarray,
+        nsamples: int,
+        shrinkage: float = 0.0
+    ):
+        """
+        Args:
+            mean: (B,) background mean
+            cov: (B, B) background covariance
+            nsamples: Number of pixels the statistics come from
+            shrinkage: Intensity in [0, 1] of shrinkage toward
+                       trace(cov) / B * I, applied up front
+        """
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.nsamples = nsamples
+        self.shrinkage = shrinkage
+        
+        # cov is the (possibly shrunk) covariance every detector sees
+        self.cov = self._shrink(np.asarray(cov, dtype=np.float64), shrinkage)
+        self.cholesky, self.inv_cov = self._factorize(np.asarray(cov, dtype=np.float64))
+        
+        self._gaussian_stats = None
+    
+    @property
+    def num_bands(self) -> int:
+        return len(self.mean)
+    
+    @classmethod
+    def from_image(
+        cls,
+        img: np.ndarray,
+        chunk_size: Optional[int] = None,
+        shrinkage: float = 0.0
+    ) -> 'BackgroundStatistics':
+        """
+        Estimate statistics from a (rows, cols, bands) cube
+        
+        The covariance is accumulated over blocks of chunk_size pixels in
+        float64, so memory stays bounded for large cubes.
+        """
+        n, mean, gram = _moments(img, chunk_size or cls.CHUNK_PIXELS)
+        
+        return cls(mean, gram / max(n - 1, 1), n, shrinkage=shrinkage)
+    
+    @property
+    def gaussian_stats(self):
+        """
+        Equivalent spy.GaussianStats (built once)
+        
+        SPy caches derived matrices (sqrt_inv_cov, eigenvectors) on the
+        stats object, so sharing one instance lets ACE and the matched
+        filter reuse them.
+        """
+        if self._gaussian_stats is None:
+            import spectral as spy
+            
+            self._gaussian_stats = spy.GaussianStats(
+                mean=self.mean,
+                cov=self.cov,
+                nsamples=self.nsamples,
+                inv_cov=self.inv_cov
+            )
+        
+        return self._gaussian_stats
+    
+    def transform(self, matrix: np.ndarray, offset: Optional[np.ndarray] = None) -> 'BackgroundStatistics':
+        """
+        Statistics of the linearly transformed data y = matrix @ (x + offset)
+        
+        Used to move the background into a reduced (e.g. MNF) space
+        without another pass over the pixels.
+        """
+        shifted = self.mean if offset is None else self.mean + offset
+        
+        return BackgroundStatistics(
+            matrix @ shifted,
+            matrix @ self.cov @ matrix.T,
+            self.nsamples
+        )
+    
+    def mahalanobis(
+        self,
+        img: np.ndarray,
+        squared: bool = False,
+        chunk_size: Optional[int] = None
+    ) -> np.ndarray:
+        """
+        Mahalanobis distance of every pixel from the background
+        
+        Pixels are processed in blocks of chunk_size. With a Cholesky
+        factor, each block is whitened by one triangular solve
+        (z = L^-1 (x - mean), d^2 = |z|^2); otherwise the
+        pseudo-inverse quadratic form is evaluated block-wise.
+        
+        Args:
+            img: (rows, cols, bands) cube or (n, bands) pixels
+            squared: Return d^2 (the RX statistic) instead of d
+            chunk_size: Pixels per block (default: CHUNK_PIXELS)
+        
+        Returns:
+            Distances with the image's spatial shape
+        """
+        chunk_size = chunk_size or self.CHUNK_PIXELS
+        pixels = img.reshape(-1, img.shape[-1])
+        distances = np.empty(len(pixels))
+        
+        for start in range(0, len(pixels), chunk_size):
+            diff = pixels[start:start + chunk_size].astype(np.float64) - self.mean
+            
+            if self.cholesky is not None:
+                whitened = linalg.solve_triangular(self.cholesky, diff.T, lower=True, check_finite=False)
+                distances[start:start + chunk_size] = np.einsum('ij,ij->j', whitened, whitened)
+            else:
+                distances[start:start + chunk_size] = np.einsum('ij,jk,ik->i', diff, self.inv_cov, diff)
+        
+        # Round-off can leave tiny negative values on the pseudo-inverse path
+        np.maximum(distances, 0, out=distances)
+        
+        if not squared:
+            np.sqrt(distances, out=distances)
+        
+        return distances.reshape(img.shape[:-1])
+    
+    def target_projection(
+        self,
+        img: np.ndarray,
+        target: np.ndarray,
+        dtype=np.float32,
+        with_distance: bool = False,
+        chunk_size: Optional[int] = None
+    ):
+        """
+        Whitened target projection of every pixel, block by block
+        
+        Computes v = (x - mean)^T C^-1 d with d = target - mean, and
+        optionally the squared Mahalanobis distance of x, without
+        materializing a full-size float64 copy of the cube. Blocks are
+        evaluated in float64; only the (rows, cols) outputs use dtype.
+        
+        Returns:
+            (v, d^T C^-1 d) or (v, d^T C^-1 d, distance^2)
+        """
+        chunk_size = chunk_size or self.CHUNK_PIXELS
+        pixels = img.reshape(-1, img.shape[-1])
+        
+        d = np.asarray(target, dtype=np.float64) - self.mean
+        weights = self.inv_cov @ d
+        target_norm = float(d @ weights)
+        
+        projection = np.empty(len(pixels), dtype=dtype)
+        distances = np.empty(len(pixels), dtype=dtype) if with_distance else None
+        
+        for start in range(0, len(pixels), chunk_size):
+            diff = pixels[start:start + chunk_size].astype(np.float64) - self.mean
+            projection[start:start + chunk_size] = diff @ weights
+            
+            if with_distance:
+                if self.cholesky is not None:
+                    whitened = linalg.solve_triangular(self.cholesky, diff.T, lower=True, check_finite=False)
+                    distances[start:start + chunk_size] = np.einsum('ij,ij->j', whitened, whitened)
+                else:
+                    distances[start:start + chunk_size] = np.einsum('ij,jk,ik->i', diff, self.inv_cov, diff)
+        
+        shape = img.shape[:-1]
+        
+        if with_distance:
+            return projection.reshape(shape), target_norm, distances.reshape(shape)
+        
+        return projection.reshape(shape), target_norm
+    
+    # Private methods
+    
+    def _factorize(self, raw_cov: np.ndarray):
+        """Cholesky factor and inverse of cov, shrinking it if singular"""
+        num_bands = len(raw_cov)
+        
+        try:
+            cholesky = linalg.cholesky(self.cov, lower=True)
+            return cholesky, linalg.cho_solve((cholesky, True), np.eye(num_bands))
+        except linalg.LinAlgError:
+            pass
+        
+        for shrinkage in self.SHRINKAGE_STEPS:
+            if shrinkage <= self.shrinkage:
+                continue
+            
+            cov = self._shrink(raw_cov, shrinkage)
+            
+            try:
+                cholesky = linalg.cholesky(cov, lower=True)
+            except linalg.LinAlgError:
+                continue
+            
+            logger.warning(f"Background covariance is singular; shrinking toward identity ({shrinkage:g})")
+            self.cov, self.shrinkage = cov, shrinkage
+            
+            return cholesky, linalg.cho_solve((cholesky, True), np.eye(num_bands))
+        
+        logger.warning("Background covariance is singular; using pseudo-inverse")
+        
+        return None, np.linalg.pinv(self.cov, hermitian=True)
+    
+    @staticmethod
+    def _shrink(cov: np.ndarray, shrinkage: float) -> np.ndarray:
+        """(1 - a) * cov + a * trace(cov) / B * I"""
+        if shrinkage <= 0:
+            return cov
+        
+        target = np.trace(cov) / len(cov)
+        
+        return (1 - shrinkage) * cov + shrinkage * target * np.eye(len(cov))
+
+
+class RunningStatistics:
+    """
+    Streaming mean / covariance accumulator
+    
+    Blocks of pixels are merged with the pairwise (Chan et al.) update,
+    so statistics of a cube can be gathered one block at a time without
+    holding it in memory.
+    """
+    
+    def __init__(self, num_bands: int):
+        self.count = 0
+        self.mean = np.zeros(num_bands)
+        self.m2 = np.zeros((num_bands, num_bands))
+    
+    def update(self, pixels: np.ndarray):
+        """Add a block of (..., bands) pixels"""
+        n, mean, m2 = _moments(pixels, BackgroundStatistics.CHUNK_PIXELS)
+        
+        if n == 0:
+            return
+        
+        total = self.count + n
+        delta = mean - self.mean
+        
+        self.mean = self.mean + delta * (n / total)
+        self.m2 += m2 + np.outer(delta, delta) * (self.count * n / total)
+        self.count = total
+    
+    def finalize(self, shrinkage: float = 0.0) -> BackgroundStatistics:
+        """Statistics of everything seen so far"""
+        return BackgroundStatistics(self.mean, self.m2 / max(self.count - 1, 1), self.count, shrinkage=shrinkage)
+
+
+def _moments(img: np.ndarray, chunk_size: int):
+    """Pixel count, mean and centered Gram matrix of (..., bands) data, in chunks"""
+    pixels = img.reshape(-1, img.shape[-1])
+    n, num_bands = pixels.shape
+    
+    if n == 0:
+        return 0, np.zeros(num_bands), np.zeros((num_bands, num_bands))
+    
+    total = np.zeros(num_bands)
+    for start in range(0, n, chunk_size):
+        total += pixels[start:start + chunk_size].sum(axis=0, dtype=np.float64)
+    mean = total / n
+    
+    gram = np.zeros((num_bands, num_bands))
+    for start in range(0, n, chunk_size):
+        centered = pixels[start:start + chunk_size].astype(np.float64) - mean
+        gram += centered.T @ centered
+    
+    return n, mean, gram
@@ -0,0 +1,102 @@
+"""
+Sensor Band Lookup
+Nearest-band tables built from ENVI header wavelengths, shared per sensor
+"""
+
+import numpy as np
+from typing import Dict, Optional, Any, Sequence
+import logging
+import hashlib
+
+logger = logging.getLogger(__name__)
+
+# Wavelength unit names (ENVI "wavelength units") -> factor to nanometers
+WAVELENGTH_UNITS = {
+    'nanometers': 1.0,
+    'nm': 1.0,
+    'micrometers': 1000.0,
+    'microns': 1000.0,
+    'um': 1000.0
+}
+
+# Band centers assumed when the image carries no wavelengths (400-2500 nm)
+DEFAULT_RANGE = (400.0, 2500.0)
+
+
+class BandLookup:
+    """
+    Band centers of one sensor and memoized nearest-band indices
+    
+    Tables are cached per header hash (a digest of the wavelength list),
+    so every image from the same sensor - and every index computed on
+    it - shares one table.
+    """
+    
+    _cache: Dict[str, 'BandLookup'] = {}
+    
+    def __init__(self, wavelengths: Sequence[float], key: Optional[str] = None):
+        """
+        Args:
+            wavelengths: Band centers in nanometers
+            key: Header hash the table is cached under
+        """
+        self.wavelengths = np.asarray(wavelengths, dtype=np.float64)
+        self.key = key or self.header_hash(self.wavelengths)
+        self._indices: Dict[float, int] = {}
+    
+    @property
+    def num_bands(self) -> int:
+        return len(self.wavelengths)
+    
+    @classmethod
+    def from_wavelengths(cls, wavelengths: Sequence[float], units: Optional[str] = None) -> 'BandLookup':
+        """Cached table for a wavelength list (units default to nanometers)"""
+        scale = WAVELENGTH_UNITS.get(str(units).strip().lower(), 1.0) if units else 1.0
+        wavelengths = np.asarray([float(w) for w in wavelengths]) * scale
+        
+        key = cls.header_hash(wavelengths)
+        lookup = cls._cache.get(key)
+        
+        if lookup is None:
+            lookup = cls._cache[key] = cls(wavelengths, key)
+            logger.debug(f"Band lookup built for {len(wavelengths)} bands ({key[:12]})")
+        
+        return lookup
+    
+    @classmethod
+    def from_metadata(cls, metadata: Dict[str, Any]) -> Optional['BandLookup']:
+        """Table from an ENVI header dict (spy image .metadata), or None without wavelengths"""
+        if not metadata or 'wavelength' not in metadata:
+            return None
+        
+        return cls.from_wavelengths(metadata['wavelength'], metadata.get('wavelength units'))
+    
+    @classmethod
+    def from_header(cls, header_path: str) -> Optional['BandLookup']:
+        """Table from an ENVI .hdr file"""
+        import spectral as spy
+        
+        return cls.from_metadata(spy.envi.read_envi_header(header_path))
+    
+    @classmethod
+    def default(cls, num_bands: int) -> 'BandLookup':
+        """Evenly spaced 400-2500 nm bands (no sensor metadata)"""
+        return cls.from_wavelengths(np.linspace(*DEFAULT_RANGE, num_bands))
+    
+    @staticmethod
+    def header_hash(wavelengths: np.ndarray) -> str:
+        """Digest identifying a sensor's band layout"""
+        return hashlib.sha1(np.ascontiguousarray(wavelengths, dtype=np.float64).tobytes()).hexdigest()
+    
+    def index(self, target_wavelength: float) -> int:
+        """Band closest to target_wavelength (nm)"""
+        idx = self._indices.get(target_wavelength)
+        
+        if idx is None:
+            idx = self._indices[target_wavelength] = int(np.argmin(np.abs(self.wavelengths - target_wavelength)))
+        
+        return idx
+    
+    def indices(self, target_wavelengths: Sequence[float]) -> np.ndarray:
+        """Closest bands for several targets"""
+        return np.array([self.index(w) for w in target_wavelengths], dtype=np.int64)
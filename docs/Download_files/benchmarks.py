@@ -0,0 +1,413 @@
+"""
+WPDD Performance Benchmarks
+Synthetic-scene benchmarks for the detection and fusion pipeline
+"""
+
+import numpy as np
+from typing import Dict, Any, List, Optional, Sequence
+import argparse
+import logging
+import time
+import json
+
+from models.fusion_engine import DetectionFusionEngine
+from models.local_rx import IntegralLocalRX
+
+logger = logging.getLogger(__name__)
+
+
+def make_synthetic_scene(
+    num_boxes: int = 10_000,
+    scene_size: float = 20_000.0,
+    seed: int = 0
+) -> Dict[str, np.ndarray]:
+    """
+    Create visual and spectral boxes for a synthetic dense scene
+    
+    Spectral boxes are jittered copies of a subset of the visual boxes
+    plus unrelated clutter, so both matched and unmatched pairs occur.
+    
+    Returns:
+        Dictionary with 'visual' and 'spectral' (n, 4) box arrays
+    """
+    rng = np.random.default_rng(seed)
+    
+    xy = rng.uniform(0, scene_size, (num_boxes, 2))
+    wh = rng.uniform(8, 64, (num_boxes, 2))
+    visual = np.hstack([xy, xy + wh])
+    
+    num_echo = num_boxes // 2
+    echo = visual[rng.choice(num_boxes, num_echo, replace=False)]
+    echo = echo + rng.normal(0, 4, echo.shape)
+    
+    clutter_xy = rng.uniform(0, scene_size, (num_boxes - num_echo, 2))
+    clutter_wh = rng.uniform(8, 64, (num_boxes - num_echo, 2))
+    clutter = np.hstack([clutter_xy, clutter_xy + clutter_wh])
+    
+    spectral = np.vstack([echo, clutter])
+    spectral = spectral[rng.permutation(len(spectral))]
+    
+    return {'visual': visual, 'spectral': spectral}
+
+
+def benchmark_fusion_assignment(
+    num_boxes: int = 10_000,
+    repeats: int = 3,
+    seed: int = 0
+) -> Dict[str, Any]:
+    """
+    Compare greedy and optimal visual/spectral assignment modes
+    
+    Args:
+        num_boxes: Number of visual and of spectral boxes in the scene
+        repeats: Timed runs per mode (best run is reported)
+        seed: Random seed for the synthetic scene
+    
+    Returns:
+        Per-mode timing and matching statistics
+    """
+    scene = make_synthetic_scene(num_boxes=num_boxes, seed=seed)
+    results = {'num_boxes': num_boxes}
+    
+    for mode in DetectionFusionEngine.ASSIGNMENT_MODES:
+        engine = DetectionFusionEngine(assignment_mode=mode)
+        timings = []
+        
+        for _ in range(repeats):
+            start = time.perf_counter()
+            match_idx, match_iou = engine._match_visual_spectral(
+                scene['visual'],
+                scene['spectral']
+            )
+            timings.append(time.perf_counter() - start)
+        
+        matched = match_idx[match_idx >= 0]
+        
+        results[mode] = {
+            'best_seconds': min(timings),
+            'matched_pairs': int(len(matched)),
+            'duplicate_spectral_matches': int(len(matched) - len(np.unique(matched))),
+            'total_iou': float(match_iou.sum())
+        }
+        
+        logger.info(f"{mode}: {results[mode]}")
+    
+    return results
+
+
+def make_benchmark_tiles(
+    image_path: Optional[str] = None,
+    tile_size: int = 640,
+    num_tiles: int = 32,
+    seed: int = 0
+) -> List[np.ndarray]:
+    """
+    RGB tiles for inference benchmarks
+    
+    Tiles are cut from image_path when given (so detections are
+    meaningful), otherwise filled with random noise.
+    """
+    if image_path is None:
+        rng = np.random.default_rng(seed)
+        return [rng.integers(0, 256, (tile_size, tile_size, 3), dtype=np.uint8) for _ in range(num_tiles)]
+    
+    import cv2
+    from models.yolo_detector import YOLODetector
+    
+    image = cv2.cvtColor(cv2.imread(image_path), cv2.COLOR_BGR2RGB)
+    detector = YOLODetector()
+    origins = detector._tile_origins(image.shape[0], image.shape[1], tile_size, 0)
+    
+    return [
+        np.ascontiguousarray(image[y:y + tile_size, x:x + tile_size])
+        for x, y in origins[:num_tiles]
+    ]
+
+
+def benchmark_inference_backends(
+    model_path: str = "yolov8x.pt",
+    image_path: Optional[str] = None,
+    backends: Sequence[str] = ('pytorch', 'onnx'),
+    tile_size: int = 640,
+    num_tiles: int = 32,
+    batch_size: int = 8,
+    num_threads: Optional[int] = None,
+    repeats: int = 3
+) -> Dict[str, Any]:
+    """
+    Compare CPU latency and throughput of YOLODetector inference backends
+    
+    Every backend runs the same tiles in the same batches through the
+    same predict() contract used by detect_tiles.
+    
+    Args:
+        model_path: .pt weights (exported to ONNX for the ONNX backends)
+        image_path: Image to cut tiles from (random tiles if None)
+        backends: Backend names from YOLODetector.BACKENDS
+        tile_size: Tile edge length in pixels
+        num_tiles: Number of tiles per run
+        batch_size: Tiles per predict() call
+        num_threads: ONNX Runtime intra-op threads
+        repeats: Timed runs per backend (best run is reported)
+    
+    Returns:
+        Per-backend latency, throughput and detection counts
+    """
+    from models.yolo_detector import YOLODetector
+    
+    tiles = make_benchmark_tiles(image_path, tile_size=tile_size, num_tiles=num_tiles)
+    batches = [tiles[i:i + batch_size] for i in range(0, len(tiles), batch_size)]
+    results = {'num_tiles': len(tiles), 'tile_size': tile_size, 'batch_size': batch_size}
+    
+    for backend in backends:
+        detector = YOLODetector(model_path, backend=backend, num_threads=num_threads, device='cpu')
+        detector.load_model()
+        
+        def run() -> int:
+            count = 0
+            for batch in batches:
+                outputs = detector.backend.predict(
+                    batch,
+                    conf=detector.conf_threshold,
+                    iou=detector.iou_threshold,
+                    max_det=detector.max_det
+                )
+                count += sum(len(output) for output in outputs)
+            return count
+        
+        # Warm-up (graph optimization, allocator growth)
+        run()
+        
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            num_detections = run()
+            timings.append(time.perf_counter() - start)
+        
+        best = min(timings)
+        
+        results[backend] = {
+            'best_seconds': best,
+            'latency_ms_per_tile': 1000.0 * best / len(tiles),
+            'latency_ms_per_batch': 1000.0 * best / len(batches),
+            'tiles_per_second': len(tiles) / best,
+            'detections': num_detections,
+            # Execution providers the session actually runs on (ONNX backends)
+            'providers': detector.backend.session.get_providers() if hasattr(detector.backend, 'session') else None
+        }
+        
+        logger.info(f"{backend}: {results[backend]}")
+    
+    return results
+
+
+def benchmark_quantization(
+    model_path: str,
+    dataset_dir: str,
+    quantization: str = 'dynamic',
+    backend: str = 'onnx',
+    num_threads: Optional[int] = None,
+    max_images: Optional[int] = None,
+    num_calibration: int = 32,
+    conf: float = 0.001
+) -> Dict[str, Any]:
+    """
+    Accuracy / throughput trade-off of a quantized detector
+    
+    Runs the full-precision and the quantized model of the same backend
+    over a labeled YOLO-format sample set and reports the per-class AP
+    delta (classes from YOLODetector.classes) next to the images/sec gain.
+    
+    Args:
+        model_path: .pt weights or exported .onnx model
+        dataset_dir: Directory with images/ and labels/ (YOLO format)
+        quantization: 'dynamic', 'static' or 'fp16'
+        backend: 'onnx' or 'openvino'
+        num_threads: ONNX Runtime intra-op threads
+        max_images: Limit on evaluated samples
+        num_calibration: Sample images used to calibrate static INT8
+        conf: Detection confidence floor for AP computation
+    
+    Returns:
+        Per-variant mAP and throughput, per-class AP deltas and speedup
+    """
+    from models.yolo_detector import YOLODetector
+    from models.detection_metrics import load_yolo_samples, evaluate_detections
+    
+    samples = load_yolo_samples(dataset_dir, max_images=max_images)
+    calibration = [sample['path'] for sample in samples[:num_calibration]]
+    
+    variants = {'full_precision': None, quantization: quantization}
+    results = {'num_images': len(samples), 'backend': backend, 'quantization': quantization}
+    evaluations = {}
+    
+    for variant, mode in variants.items():
+        detector = YOLODetector(
+            model_path,
+            backend=backend,
+            num_threads=num_threads,
+            quantization=mode,
+            calibration_images=calibration if mode == 'static' else None
+        )
+        detector.load_model()
+        
+        # Warm-up
+        detector.detect(samples[0]['image'], conf=conf, as_batch=True)
+        
+        start = time.perf_counter()
+        predictions = [detector.detect(sample['image'], conf=conf, as_batch=True) for sample in samples]
+        elapsed = time.perf_counter() - start
+        
+        evaluations[variant] = evaluate_detections(predictions, samples, detector.classes)
+        
+        results[variant] = {
+            'images_per_second': len(samples) / elapsed,
+            'map50': evaluations[variant]['map50'],
+            'map50_95': evaluations[variant]['map50_95']
+        }
+        
+        logger.info(f"{variant}: {results[variant]}")
+    
+    def delta(metric: str, name: str) -> Optional[float]:
+        full = evaluations['full_precision']['per_class'][name][metric]
+        reduced = evaluations[quantization]['per_class'][name][metric]
+        return None if full is None else reduced - full
+    
+    results['per_class'] = {
+        name: {
+            'num_labels': metrics['num_labels'],
+            'ap50_full': metrics['ap50'],
+            'ap50_quantized': evaluations[quantization]['per_class'][name]['ap50'],
+            'ap50_delta': delta('ap50', name),
+            'ap50_95_delta': delta('ap50_95', name)
+        }
+        for name, metrics in evaluations['full_precision']['per_class'].items()
+    }
+    
+    results['speedup'] = (
+        results[quantization]['images_per_second'] /
+        results['full_precision']['images_per_second']
+    )
+    
+    return results
+
+
+def benchmark_local_rx(
+    shape: tuple = (128, 128, 20),
+    inner: int = 3,
+    outer_windows: Sequence[int] = (25, 51, 101),
+    local_covariance: bool = True,
+    repeats: int = 1,
+    seed: int = 0
+) -> Dict[str, Any]:
+    """
+    Compare spy.rx windowed RX with the integral-image engine
+    
+    Args:
+        shape: Synthetic cube shape (rows, cols, bands) - e.g. MNF-reduced
+        inner: Inner (guard) window width
+        outer_windows: Outer window widths to time
+        local_covariance: Estimate a covariance per window (otherwise the
+                          global covariance is shared, local mean only)
+        repeats: Timed runs per engine and window (best run is reported)
+        seed: Random seed for the synthetic cube
+    
+    Returns:
+        Per-window timings, speedup and maximum relative score difference
+    """
+    import spectral as spy
+    
+    rng = np.random.default_rng(seed)
+    rows, cols, num_bands = shape
+    
+    # Correlated bands plus a few implanted anomalies
+    mixing = rng.normal(0, 1, (num_bands, num_bands))
+    cube = rng.normal(0, 1, (rows * cols, num_bands)) @ mixing + 100.0
+    anomalies = rng.choice(rows * cols, max(rows * cols // 1000, 1), replace=False)
+    cube[anomalies] += 5 * mixing[0]
+    cube = cube.reshape(rows, cols, num_bands).astype(np.float32)
+    
+    cov = None if local_covariance else np.cov(cube.reshape(-1, num_bands), rowvar=False)
+    results = {'shape': list(shape), 'inner': inner, 'local_covariance': local_covariance}
+    
+    def best_of(run):
+        timings = []
+        for _ in range(max(1, repeats)):
+            start = time.perf_counter()
+            output = run()
+            timings.append(time.perf_counter() - start)
+        return output, min(timings)
+    
+    for outer in outer_windows:
+        reference, spy_seconds = best_of(lambda: spy.rx(cube, window=(inner, outer), cov=cov))
+        scores, integral_seconds = best_of(lambda: IntegralLocalRX(inner, outer, cov=cov)(cube))
+        
+        results[f"outer_{outer}"] = {
+            'spy_seconds': spy_seconds,
+            'integral_seconds': integral_seconds,
+            'speedup': spy_seconds / integral_seconds,
+            'max_relative_difference': float(
+                np.max(np.abs(scores - reference)) / (np.max(np.abs(reference)) + 1e-12)
+            )
+        }
+        
+        logger.info(f"outer={outer}: {results[f'outer_{outer}']}")
+    
+    return results
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    
+    parser = argparse.ArgumentParser(description="WPDD performance benchmarks")
+    parser.add_argument("--benchmark", choices=['fusion', 'backends', 'quantization', 'local_rx'], default='fusion')
+    parser.add_argument("--boxes", type=int, default=10_000)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--model", default="yolov8x.pt")
+    parser.add_argument("--image", default=None)
+    parser.add_argument("--backends", nargs='+', default=['pytorch', 'onnx'])
+    parser.add_argument("--tiles", type=int, default=32)
+    parser.add_argument("--tile-size", type=int, default=640)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--dataset", default=None)
+    parser.add_argument("--quantization", choices=['dynamic', 'static', 'fp16'], default='dynamic')
+    parser.add_argument("--max-images", type=int, default=None)
+    parser.add_argument("--rx-shape", type=int, nargs=3, default=[128, 128, 20], metavar=('ROWS', 'COLS', 'BANDS'))
+    parser.add_argument("--rx-inner", type=int, default=3)
+    parser.add_argument("--rx-outer", type=int, nargs='+', default=[25, 51, 101])
+    parser.add_argument("--rx-global-cov", action='store_true')
+    args = parser.parse_args()
+    
+    if args.benchmark == 'backends':
+        report = benchmark_inference_backends(
+            model_path=args.model,
+            image_path=args.image,
+            backends=args.backends,
+            tile_size=args.tile_size,
+            num_tiles=args.tiles,
+            batch_size=args.batch_size,
+            num_threads=args.threads,
+            repeats=args.repeats
+        )
+    elif args.benchmark == 'local_rx':
+        report = benchmark_local_rx(
+            shape=tuple(args.rx_shape),
+            inner=args.rx_inner,
+            outer_windows=args.rx_outer,
+            local_covariance=not args.rx_global_cov,
+            repeats=args.repeats
+        )
+    elif args.benchmark == 'quantization':
+        report = benchmark_quantization(
+            model_path=args.model,
+            dataset_dir=args.dataset,
+            quantization=args.quantization,
+            backend=args.backends[0] if args.backends[0] != 'pytorch' else 'onnx',
+            num_threads=args.threads,
+            max_images=args.max_images
+        )
+    else:
+        report = benchmark_fusion_assignment(num_boxes=args.boxes, repeats=args.repeats)
+    
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,184 @@
+"""
+Columnar Detection Batch
+NumPy-backed container for detections passed between pipeline stages
+"""
+
+import numpy as np
+from typing import List, Dict, Any, Optional, Sequence
+
+
+class DetectionBatch:
+    """
+    Detections stored as parallel NumPy arrays instead of per-detection dicts
+    
+    Core columns are bbox (n, 4) x1, y1, x2, y2, confidence, class_id,
+    area and center (n, 2). Stages may attach extra per-detection arrays
+    in `columns` (first dimension n). Dicts are only built by to_dicts()
+    at the API boundary.
+    """
+    
+    def __init__(
+        self,
+        bbox: np.ndarray,
+        confidence: np.ndarray,
+        class_id: Optional[np.ndarray] = None,
+        area: Optional[np.ndarray] = None,
+        center: Optional[np.ndarray] = None,
+        columns: Optional[Dict[str, np.ndarray]] = None,
+        image_shape: Optional[tuple] = None,
+        source: str = 'unknown',
+        class_names: Optional[Dict[int, str]] = None
+    ):
+        self.bbox = np.asarray(bbox, dtype=np.float64).reshape(-1, 4)
+        self.confidence = np.asarray(confidence, dtype=np.float64).reshape(-1)
+        
+        n = len(self.bbox)
+        
+        if class_id is None:
+            class_id = np.full(n, -1)
+        self.class_id = np.asarray(class_id, dtype=np.int32).reshape(-1)
+        
+        if area is None:
+            area = (self.bbox[:, 2] - self.bbox[:, 0]) * (self.bbox[:, 3] - self.bbox[:, 1])
+        self.area = np.asarray(area, dtype=np.float64).reshape(-1)
+        
+        if center is None:
+            center = (self.bbox[:, :2] + self.bbox[:, 2:]) / 2
+        self.center = np.asarray(center, dtype=np.float64).reshape(-1, 2)
+        
+        self.columns = {name: np.asarray(values) for name, values in (columns or {}).items()}
+        
+        # Batch-level metadata shared by every detection
+        self.image_shape = image_shape
+        self.source = source
+        self.class_names = class_names or {}
+        
+        for name, values in [
+            ('confidence', self.confidence),
+            ('class_id', self.class_id),
+            ('area', self.area),
+            ('center', self.center),
+            *self.columns.items()
+        ]:
+            if len(values) != n:
+                raise ValueError(f"Column '{name}' has {len(values)} rows, expected {n}")
+    
+    def __len__(self) -> int:
+        return len(self.bbox)
+    
+    @classmethod
+    def empty(cls, **kwargs) -> 'DetectionBatch':
+        """Batch with no detections"""
+        return cls(bbox=np.zeros((0, 4)), confidence=np.zeros(0), **kwargs)
+    
+    @classmethod
+    def concatenate(cls, batches: Sequence['DetectionBatch']) -> 'DetectionBatch':
+        """
+        Stack batches row-wise
+        
+        Metadata is taken from the first batch with detections (the first
+        batch if all are empty); only columns present in every batch are
+        kept.
+        """
+        if len(batches) == 0:
+            return cls.empty()
+        
+        first = next((b for b in batches if len(b)), batches[0])
+        names = [name for name in first.columns if all(name in b.columns for b in batches)]
+        
+        return cls(
+            bbox=np.concatenate([b.bbox for b in batches]),
+            confidence=np.concatenate([b.confidence for b in batches]),
+            class_id=np.concatenate([b.class_id for b in batches]),
+            area=np.concatenate([b.area for b in batches]),
+            center=np.concatenate([b.center for b in batches]),
+            columns={name: np.concatenate([b.columns[name] for b in batches]) for name in names},
+            image_shape=first.image_shape,
+            source=first.source,
+            class_names=first.class_names
+        )
+    
+    @classmethod
+    def from_dicts(
+        cls,
+        detections: List[Dict[str, Any]],
+        class_names: Optional[Dict[int, str]] = None
+    ) -> 'DetectionBatch':
+        """Build a batch from YOLO-style detection dicts"""
+        if len(detections) == 0:
+            return cls.empty(class_names=class_names)
+        
+        first = detections[0]
+        
+        return cls(
+            bbox=[det['bbox'] for det in detections],
+            confidence=[det['confidence'] for det in detections],
+            class_id=[det.get('class_id', -1) for det in detections],
+            area=[det['area'] for det in detections] if 'area' in first else None,
+            center=[det['center'] for det in detections] if 'center' in first else None,
+            image_shape=first.get('image_shape'),
+            source=first.get('detection_source', 'unknown'),
+            class_names=class_names
+        )
+    
+    def select(self, index) -> 'DetectionBatch':
+        """Subset of the batch by boolean mask or integer index array"""
+        return DetectionBatch(
+            bbox=self.bbox[index],
+            confidence=self.confidence[index],
+            class_id=self.class_id[index],
+            area=self.area[index],
+            center=self.center[index],
+            columns={name: values[index] for name, values in self.columns.items()},
+            image_shape=self.image_shape,
+            source=self.source,
+            class_names=self.class_names
+        )
+    
+    def translate(self, offsets: np.ndarray):
+        """
+        Shift boxes and centers in place
+        
+        Args:
+            offsets: (2,) dx, dy for the whole batch or (n, 2) per detection
+        """
+        offsets = np.asarray(offsets, dtype=np.float64)
+        self.bbox += np.tile(offsets, 2)
+        self.center += offsets
+    
+    def class_name_array(self) -> np.ndarray:
+        """Class names for every detection as a string array"""
+        lookup = {int(c): self.class_names.get(int(c), 'unknown') for c in np.unique(self.class_id)}
+        return np.array([lookup[c] for c in self.class_id.tolist()], dtype=object)
+    
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        """Convert to YOLO-style detection dicts (API boundary only)"""
+        class_names = self.class_name_array()
+        tile_origin = self.columns.get('tile_origin')
+        
+        detections = []
+        
+        for i, (bbox, conf, cls, area, center) in enumerate(zip(
+            self.bbox.tolist(),
+            self.confidence.tolist(),
+            self.class_id.tolist(),
+            self.area.tolist(),
+            self.center.tolist()
+        )):
+            detection = {
+                'bbox': bbox,
+                'confidence': conf,
+                'class_id': cls,
+                'class_name': class_names[i],
+                'area': area,
+                'center': center,
+                'image_shape': self.image_shape,
+                'detection_source': self.source
+            }
+            
+            if tile_origin is not None:
+                detection['tile_origin'] = tuple(tile_origin[i].tolist())
+            
+            detections.append(detection)
+        
+        return detections
@@ -0,0 +1,202 @@
+"""
+Detection Accuracy Metrics
+Per-class average precision over a labeled YOLO-format sample set
+"""
+
+import numpy as np
+from typing import List, Dict, Any, Optional, Sequence
+import logging
+from pathlib import Path
+import cv2
+
+from models.detection_batch import DetectionBatch
+from models.spatial_index import box_iou_matrix
+
+logger = logging.getLogger(__name__)
+
+IMAGE_SUFFIXES = ('.jpg', '.jpeg', '.png', '.tif', '.tiff', '.bmp')
+
+# COCO-style IoU thresholds 0.50:0.05:0.95
+COCO_IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+
+
+def load_yolo_samples(
+    dataset_dir: str,
+    max_images: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """
+    Load a labeled sample set in YOLO layout
+    
+    Expects images/<name>.<ext> with labels/<name>.txt holding one
+    "class cx cy w h" line (normalized coordinates) per object.
+    
+    Returns:
+        List of {'path', 'image' (RGB), 'boxes' (m, 4) x1, y1, x2, y2,
+        'classes' (m,)}
+    """
+    root = Path(dataset_dir)
+    image_paths = sorted(
+        path for path in (root / 'images').iterdir()
+        if path.suffix.lower() in IMAGE_SUFFIXES
+    )
+    
+    if max_images is not None:
+        image_paths = image_paths[:max_images]
+    
+    samples = []
+    
+    for image_path in image_paths:
+        image = cv2.cvtColor(cv2.imread(str(image_path)), cv2.COLOR_BGR2RGB)
+        height, width = image.shape[:2]
+        
+        label_path = root / 'labels' / f"{image_path.stem}.txt"
+        labels = np.zeros((0, 5))
+        
+        if label_path.exists() and label_path.stat().st_size > 0:
+            labels = np.loadtxt(label_path, ndmin=2)[:, :5]
+        
+        cx, cy = labels[:, 1] * width, labels[:, 2] * height
+        w, h = labels[:, 3] * width, labels[:, 4] * height
+        
+        samples.append({
+            'path': str(image_path),
+            'image': image,
+            'boxes': np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1),
+            'classes': labels[:, 0].astype(np.int32)
+        })
+    
+    logger.info(f"Loaded {len(samples)} labeled samples from {dataset_dir}")
+    
+    return samples
+
+
+def evaluate_detections(
+    predictions: Sequence[DetectionBatch],
+    samples: Sequence[Dict[str, Any]],
+    classes: Dict[int, str],
+    iou_thresholds: np.ndarray = COCO_IOU_THRESHOLDS
+) -> Dict[str, Any]:
+    """
+    Per-class average precision (COCO 101-point interpolation)
+    
+    Args:
+        predictions: Detections per sample, in sample order
+        samples: Ground truth from load_yolo_samples
+        classes: Class id -> name mapping to report on
+        iou_thresholds: IoU thresholds AP is averaged over
+    
+    Returns:
+        {'per_class': {name: {'ap50', 'ap50_95', 'num_labels'}},
+         'map50', 'map50_95'} - means over classes with labels
+    """
+    scores = {class_id: [] for class_id in classes}
+    true_positives = {class_id: [] for class_id in classes}
+    num_labels = {class_id: 0 for class_id in classes}
+    
+    for detections, sample in zip(predictions, samples):
+        for class_id in classes:
+            gt = sample['boxes'][sample['classes'] == class_id]
+            num_labels[class_id] += len(gt)
+            
+            mask = detections.class_id == class_id
+            if not mask.any():
+                continue
+            
+            tp = _match_image(detections.bbox[mask], detections.confidence[mask], gt, iou_thresholds)
+            scores[class_id].append(detections.confidence[mask])
+            true_positives[class_id].append(tp)
+    
+    per_class = {}
+    
+    for class_id, name in classes.items():
+        if num_labels[class_id] == 0:
+            per_class[name] = {'ap50': None, 'ap50_95': None, 'num_labels': 0}
+            continue
+        
+        if scores[class_id]:
+            ap = _average_precision(
+                np.concatenate(scores[class_id]),
+                np.concatenate(true_positives[class_id]),
+                num_labels[class_id]
+            )
+        else:
+            ap = np.zeros(len(iou_thresholds))
+        
+        per_class[name] = {
+            'ap50': float(ap[0]),
+            'ap50_95': float(ap.mean()),
+            'num_labels': num_labels[class_id]
+        }
+    
+    labeled = [metrics for metrics in per_class.values() if metrics['num_labels'] > 0]
+    
+    return {
+        'per_class': per_class,
+        'map50': float(np.mean([m['ap50'] for m in labeled])) if labeled else None,
+        'map50_95': float(np.mean([m['ap50_95'] for m in labeled])) if labeled else None
+    }
+
+
+# Private helpers
+
+def _match_image(
+    boxes: np.ndarray,
+    scores: np.ndarray,
+    gt: np.ndarray,
+    iou_thresholds: np.ndarray
+) -> np.ndarray:
+    """
+    Greedy score-ordered matching of one image/class
+    
+    Returns:
+        (n, T) boolean true-positive flags per prediction and threshold
+    """
+    tp = np.zeros((len(boxes), len(iou_thresholds)), dtype=bool)
+    
+    if len(gt) == 0:
+        return tp
+    
+    iou = box_iou_matrix(boxes, gt)
+    order = np.argsort(-scores, kind='stable')
+    
+    for t, threshold in enumerate(iou_thresholds):
+        matched = np.zeros(len(gt), dtype=bool)
+        
+        for i in order:
+            candidates = np.where(matched, -1.0, iou[i])
+            j = int(np.argmax(candidates))
+            
+            if candidates[j] >= threshold:
+                matched[j] = True
+                tp[i, t] = True
+    
+    return tp
+
+
+def _average_precision(
+    scores: np.ndarray,
+    tp: np.ndarray,
+    num_labels: int
+) -> np.ndarray:
+    """101-point interpolated AP per IoU threshold"""
+    order = np.argsort(-scores, kind='stable')
+    tp = tp[order]
+    
+    tp_cum = np.cumsum(tp, axis=0)
+    fp_cum = np.cumsum(~tp, axis=0)
+    
+    recall = tp_cum / num_labels
+    precision = tp_cum / (tp_cum + fp_cum)
+    
+    # Monotone precision envelope
+    precision = np.flip(np.maximum.accumulate(np.flip(precision, axis=0), axis=0), axis=0)
+    
+    recall_points = np.linspace(0, 1, 101)
+    ap = np.zeros(tp.shape[1])
+    
+    for t in range(tp.shape[1]):
+        idx = np.searchsorted(recall[:, t], recall_points, side='left')
+        valid = idx < len(recall)
+        ap[t] = precision[idx[valid], t].sum() / len(recall_points)
+    
+    return ap
@@ -7,9 +7,15 @@ import numpy as np
 from typing import List, Dict, Any, Tuple
 import logging
 from scipy.spatial.distance import cdist
+from scipy.optimize import linear_sum_assignment
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
 from datetime import datetime
 import uuid
 
+from models.spatial_index import GridIndex, box_iou_matrix, box_iou_pairs
+from models.detection_batch import DetectionBatch
+
 logger = logging.getLogger(__name__)
 
 
@@ -19,7 +25,26 @@ class DetectionFusionEngine:
     Provides unified, high-confidence defect detection
     """
     
-    def __init__(self):
+    ASSIGNMENT_MODES = ('greedy', 'optimal')
+    
+    # Severity by defect type (other types use the base severity of 5)
+    DEFECT_TYPE_SEVERITY = {
+        'leak': 8,
+        'crack': 6,
+        'corrosion': 5,
+        'faulty_pipe': 7,
+        'pipe': 0
+    }
+    
+    def __init__(self, assignment_mode: str = 'greedy'):
+        if assignment_mode not in self.ASSIGNMENT_MODES:
+            raise ValueError(f"Unknown assignment mode: {assignment_mode}")
+        
+        # Visual/spectral assignment strategy:
+        #   greedy  - each visual box takes its best spectral box (may share)
+        #   optimal - one-to-one maximum-IoU bipartite matching
+        self.assignment_mode = assignment_mode
+        
         # Fusion weights
         self.visual_weight = 0.6
         self.spectral_weight = 0.4
@@ -27,6 +52,9 @@ class DetectionFusionEngine:
         # Spatial matching threshold (IoU)
         self.spatial_match_threshold = 0.3
         
+        # Max cells per IoU matrix block when matching large scenes
+        self.iou_block_size = 4_000_000
+        
         # Confidence thresholds
         self.min_fused_confidence = 0.4
         self.high_confidence_threshold = 0.75
@@ -59,18 +87,26 @@ class DetectionFusionEngine:
             spectral_leaks = spectral_results.get('leak_details', [])
             
             # 1. Match visual detections with spectral detections
-            for yolo_det in yolo_detections:
-                # Find spatially overlapping spectral detections
-                matches = self._find_spatial_matches(
-                    yolo_det,
-                    spectral_leaks,
-                    rgb_image.shape,
-                    hyperspectral_image.shape
-                )
-                
-                if matches:
+            #    (all pairs scored at once on the rescaled boxes)
+            visual_boxes = self._scaled_visual_boxes(
+                yolo_detections,
+                rgb_image.shape,
+                hyperspectral_image.shape
+            )
+            spectral_boxes = self._boxes_array(spectral_leaks)
+            
+            match_idx, match_iou = self._match_visual_spectral(
+                visual_boxes,
+                spectral_boxes
+            )
+            
+            for yolo_det, spectral_idx, iou in zip(yolo_detections, match_idx, match_iou):
+                if spectral_idx >= 0:
                     # Fuse with best match
-                    best_match = matches[0]
+                    best_match = {
+                        **spectral_leaks[spectral_idx],
+                        'iou_with_visual': float(iou)
+                    }
                     matched_spectral.add(best_match['id'])
                     
                     fused = self._fuse_detection_pair(
@@ -133,6 +169,211 @@ class DetectionFusionEngine:
             logger.error(f"Fusion failed: {str(e)}", exc_info=True)
             raise
     
+    def fuse_batch(
+        self,
+        yolo_detections: DetectionBatch,
+        spectral_results: Dict[str, Any],
+        rgb_image: np.ndarray,
+        hyperspectral_image: np.ndarray
+    ) -> DetectionBatch:
+        """
+        Columnar fusion of a visual DetectionBatch with batch spectral results
+        
+        Same rules as fuse(), evaluated on whole arrays. Use with
+        SpectralAnalyzer.analyze(..., as_batch=True) and convert with
+        to_dicts() at the API boundary.
+        
+        Returns:
+            DetectionBatch of fused detections (confidence = combined
+            confidence), filtered and sorted by priority
+        """
+        try:
+            spectral = spectral_results['leak_details']
+            
+            logger.info(f"Fusing {len(yolo_detections)} visual + {len(spectral)} spectral detections (batch)")
+            
+            # 1. Match visual detections with spectral detections
+            scale_y = hyperspectral_image.shape[0] / rgb_image.shape[0]
+            scale_x = hyperspectral_image.shape[1] / rgb_image.shape[1]
+            visual_boxes = yolo_detections.bbox * np.array([scale_x, scale_y, scale_x, scale_y])
+            
+            match_idx, match_iou = self._match_visual_spectral(visual_boxes, spectral.bbox)
+            
+            # 2. Rows: every visual detection, then unmatched spectral detections
+            spectral_matched = np.zeros(len(spectral), dtype=bool)
+            spectral_matched[match_idx[match_idx >= 0]] = True
+            unmatched = np.flatnonzero(~spectral_matched)
+            
+            num_visual = len(yolo_detections)
+            spectral_idx = np.concatenate([match_idx, unmatched])
+            has_visual = np.arange(len(spectral_idx)) < num_visual
+            has_spectral = spectral_idx >= 0
+            
+            visual_conf = np.concatenate([yolo_detections.confidence, np.zeros(len(unmatched))])
+            spectral_conf = self._gather(spectral.confidence, spectral_idx, 0.0)
+            
+            combined = np.where(
+                has_visual & has_spectral,
+                visual_conf * self.visual_weight + spectral_conf * self.spectral_weight,
+                np.where(has_visual, visual_conf * 0.7, spectral_conf * 0.7)  # Single-source penalty
+            )
+            
+            # Spectral defect type has priority; '' marks a missing type
+            class_name = np.concatenate([
+                yolo_detections.class_name_array(),
+                np.full(len(unmatched), 'spectral_anomaly', dtype=object)
+            ])
+            spectral_type = self._gather(
+                spectral.columns.get('defect_type', np.full(len(spectral), '', dtype=object)),
+                spectral_idx,
+                ''
+            )
+            defect_type = np.where(
+                spectral_type != '',
+                spectral_type,
+                np.where(has_visual, class_name, 'unknown')
+            ).astype(object)
+            
+            fusion_type = np.where(
+                has_visual & has_spectral,
+                'visual_spectral',
+                np.where(has_visual, 'visual_only', 'spectral_only')
+            ).astype(object)
+            
+            spectral_rows = np.maximum(spectral_idx, 0)
+            take_spectral = ~has_visual
+            
+            fused = DetectionBatch(
+                bbox=np.where(
+                    take_spectral[:, None],
+                    spectral.bbox[spectral_rows] if len(spectral) else 0,
+                    np.concatenate([yolo_detections.bbox, np.zeros((len(unmatched), 4))])
+                ),
+                confidence=combined,
+                class_id=np.concatenate([yolo_detections.class_id, np.full(len(unmatched), -1)]),
+                area=np.where(
+                    take_spectral,
+                    spectral.area[spectral_rows] if len(spectral) else 0,
+                    np.concatenate([yolo_detections.area, np.zeros(len(unmatched))])
+                ),
+                center=np.where(
+                    take_spectral[:, None],
+                    spectral.center[spectral_rows] if len(spectral) else 0,
+                    np.concatenate([yolo_detections.center, np.zeros((len(unmatched), 2))])
+                ),
+                columns={
+                    'visual_confidence': visual_conf,
+                    'spectral_confidence': spectral_conf,
+                    'defect_type': defect_type,
+                    'class_name': class_name,
+                    'fusion_type': fusion_type,
+                    'iou': np.concatenate([match_iou, np.zeros(len(unmatched))]),
+                    'spectral_index': spectral_idx,
+                    **{
+                        target: self._gather(spectral.columns[name], spectral_idx, fill)
+                        for name, target, fill in [
+                            ('label', 'label', -1),
+                            ('rx_mean', 'rx_mean', np.nan),
+                            ('ndwi_mean', 'ndwi_mean', np.nan),
+                            ('ace_mean', 'ace_mean', np.nan),
+                            ('mf_mean', 'mf_mean', np.nan),
+                            ('detection_methods', 'detection_methods', -1),
+                            ('mean_spectrum', 'mean_spectrum', np.nan),
+                            ('defect_type', 'spectral_defect_type', '')
+                        ]
+                        if name in spectral.columns
+                    },
+                    'spectral_area_pixels': self._gather(spectral.area, spectral_idx, 0.0)
+                },
+                image_shape=rgb_image.shape,
+                source='fusion',
+                class_names=yolo_detections.class_names
+            )
+            
+            # 3. Filter by confidence
+            fused = fused.select(fused.confidence >= self.min_fused_confidence)
+            
+            # 4. Assign severity levels
+            fused.columns['severity'] = self._severity_array(fused)
+            
+            # 5. Sort by priority
+            priority = fused.confidence * fused.columns['severity']
+            fused = fused.select(np.argsort(-priority, kind='stable'))
+            
+            logger.info(f"Fusion complete: {len(fused)} final detections")
+            
+            return fused
+        
+        except Exception as e:
+            logger.error(f"Fusion failed: {str(e)}", exc_info=True)
+            raise
+    
+    def to_dicts(self, fused: DetectionBatch) -> List[Dict[str, Any]]:
+        """
+        Convert a fuse_batch() result into fused detection dicts
+        Same layout as fuse(); intended for the API boundary only
+        """
+        columns = fused.columns
+        timestamp = datetime.utcnow().isoformat()
+        
+        detections = []
+        
+        for i, (bbox, center) in enumerate(zip(fused.bbox.tolist(), fused.center.tolist())):
+            fusion_type = columns['fusion_type'][i]
+            has_visual = fusion_type != 'spectral_only'
+            has_spectral = fusion_type != 'visual_only'
+            
+            det = {
+                'detection_id': str(uuid.uuid4()),
+                'bbox': bbox,
+                'visual_confidence': float(columns['visual_confidence'][i]),
+                'spectral_confidence': float(columns['spectral_confidence'][i]),
+                'combined_confidence': float(fused.confidence[i]),
+                'defect_type': columns['defect_type'][i],
+                'class_name': columns['class_name'][i],
+                'area': float(fused.area[i]),
+                'center': center,
+                'spectral_signature': None,
+                'detection_methods': {
+                    'visual': has_visual,
+                    'spectral': has_spectral
+                },
+                'metadata': {
+                    'timestamp': timestamp
+                }
+            }
+            
+            if has_visual:
+                det['metadata']['visual_class'] = columns['class_name'][i]
+            
+            if has_spectral:
+                spectral_type = columns['spectral_defect_type'][i] if 'spectral_defect_type' in columns else ''
+                
+                det['spectral_signature'] = (
+                    columns['mean_spectrum'][i].tolist()
+                    if spectral_type and 'mean_spectrum' in columns else []
+                )
+                det['spectral_scores'] = {
+                    name: float(columns[name][i])
+                    for name in ('rx_mean', 'ndwi_mean', 'ace_mean', 'mf_mean')
+                    if name in columns
+                }
+                det['detection_methods']['methods_agreed'] = int(columns['detection_methods'][i])
+                det['metadata'].update({
+                    'spectral_defect_type': spectral_type or None,
+                    'spectral_area_pixels': int(columns['spectral_area_pixels'][i])
+                })
+                
+                if has_visual:
+                    det['metadata']['iou'] = float(columns['iou'][i])
+            
+            det['fusion_type'] = fusion_type
+            det['severity'] = int(columns['severity'][i])
+            
+            detections.append(det)
+        
+        return self._add_geo_coordinates(detections, fused.image_shape)
+    
     def detect_changes(
         self,
         before_detections: List[Dict[str, Any]],
@@ -150,20 +391,20 @@ class DetectionFusionEngine:
             logger.info(f"Detecting changes: {len(before_detections)} before, {len(after_detections)} after")
             
             changes = []
-            matched_after = set()
-            
-            # Find matching detections
-            for before_det in before_detections:
-                matches = self._find_matching_detections(
-                    before_det,
-                    after_detections,
-                    iou_threshold
-                )
-                
-                if matches:
+            
+            # Best after-detection per before-detection via spatial index
+            match_idx, _ = self._match_detections(
+                self._boxes_array(before_detections),
+                self._boxes_array(after_detections),
+                iou_threshold
+            )
+            matched_after = np.zeros(len(after_detections), dtype=bool)
+            matched_after[match_idx[match_idx >= 0]] = True
+            
+            for before_det, after_idx in zip(before_detections, match_idx):
+                if after_idx >= 0:
                     # Object still exists - check if condition changed
-                    after_det = matches[0]
-                    matched_after.add(after_det['detection_id'])
+                    after_det = after_detections[after_idx]
                     
                     if self._has_condition_changed(before_det, after_det):
                         changes.append({
@@ -190,8 +431,8 @@ class DetectionFusionEngine:
                     })
             
             # Find new detections (new damage)
-            for after_det in after_detections:
-                if after_det.get('detection_id') not in matched_after:
+            for after_det, matched in zip(after_detections, matched_after):
+                if not matched:
                     changes.append({
                         'change_id': str(uuid.uuid4()),
                         'change_type': 'new_damage',
@@ -218,18 +459,35 @@ class DetectionFusionEngine:
         Enhance change detections with spectral information
         """
         try:
-            for change in changes:
-                if change['after'] is not None:
-                    # Add spectral confidence if available
-                    after_det = change['after']
-                    
-                    # Find matching spectral detection
-                    for spectral_leak in spectral_results.get('leak_details', []):
-                        if self._is_spatial_overlap(after_det, spectral_leak):
-                            change['spectral_confirmation'] = True
-                            change['spectral_confidence'] = spectral_leak['combined_confidence']
-                            change['defect_type_spectral'] = spectral_leak['defect_type']
-                            break
+            spectral_leaks = spectral_results.get('leak_details', [])
+            
+            enhanced = [
+                change for change in changes
+                if change['after'] is not None and change['after'].get('bbox')
+            ]
+            
+            if not enhanced or not spectral_leaks:
+                return changes
+            
+            # First spectral leak (in result order) overlapping each change
+            index = GridIndex(self._boxes_array(spectral_leaks))
+            after_boxes = self._boxes_array([change['after'] for change in enhanced])
+            change_idx, leak_idx = index.query_pairs(after_boxes)
+            
+            iou = box_iou_pairs(after_boxes[change_idx], index.boxes[leak_idx])
+            overlap = iou > 0.1  # Any overlap
+            change_idx, leak_idx = change_idx[overlap], leak_idx[overlap]
+            
+            # Pairs are sorted by change then leak index
+            first = np.unique(change_idx, return_index=True)[1]
+            
+            for ci, li in zip(change_idx[first], leak_idx[first]):
+                change = enhanced[ci]
+                spectral_leak = spectral_leaks[li]
+                
+                change['spectral_confirmation'] = True
+                change['spectral_confidence'] = spectral_leak['combined_confidence']
+                change['defect_type_spectral'] = spectral_leak['defect_type']
             
             return changes
             
@@ -239,43 +497,148 @@ class DetectionFusionEngine:
     
     # Private methods
     
-    def _find_spatial_matches(
+    def _scaled_visual_boxes(
         self,
-        visual_det: Dict[str, Any],
-        spectral_leaks: List[Dict[str, Any]],
+        visual_dets: List[Dict[str, Any]],
         rgb_shape: tuple,
         hyper_shape: tuple
-    ) -> List[Dict[str, Any]]:
-        """Find spectral detections that spatially overlap with visual detection"""
-        matches = []
-        
+    ) -> np.ndarray:
+        """Visual bboxes as an (n, 4) array in hyperspectral pixel space"""
         # Scale factor between RGB and hyperspectral
         scale_y = hyper_shape[0] / rgb_shape[0]
         scale_x = hyper_shape[1] / rgb_shape[1]
         
-        visual_bbox = visual_det['bbox']
-        visual_bbox_scaled = [
-            visual_bbox[0] * scale_x,
-            visual_bbox[1] * scale_y,
-            visual_bbox[2] * scale_x,
-            visual_bbox[3] * scale_y
-        ]
+        boxes = self._boxes_array(visual_dets)
+        boxes *= np.array([scale_x, scale_y, scale_x, scale_y])
         
-        for spectral_leak in spectral_leaks:
-            spectral_bbox = spectral_leak['bbox']
-            
-            iou = self._calculate_iou(visual_bbox_scaled, spectral_bbox)
-            
-            if iou >= self.spatial_match_threshold:
-                matches.append({
-                    **spectral_leak,
-                    'iou_with_visual': iou
-                })
+        return boxes
+    
+    def _boxes_array(self, detections: List[Dict[str, Any]]) -> np.ndarray:
+        """Stack detection bboxes into an (n, 4) float array"""
+        if len(detections) == 0:
+            return np.zeros((0, 4), dtype=np.float64)
         
-        # Sort by IoU
-        matches.sort(key=lambda x: x['iou_with_visual'], reverse=True)
+        return np.array([det['bbox'] for det in detections], dtype=np.float64)
+    
+    def _iter_iou_blocks(self, boxes1: np.ndarray, boxes2: np.ndarray):
+        """
+        Yield (row_offset, iou_block) over row chunks of the IoU matrix
+        Keeps peak memory bounded by iou_block_size cells per block
+        """
+        rows_per_block = max(1, self.iou_block_size // max(len(boxes2), 1))
         
-        return matches
+        for start in range(0, len(boxes1), rows_per_block):
+            yield start, box_iou_matrix(boxes1[start:start + rows_per_block], boxes2)
+    
+    def _match_visual_spectral(
+        self,
+        visual_boxes: np.ndarray,
+        spectral_boxes: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Assign visual boxes to spectral boxes using assignment_mode
+        
+        Returns:
+            (match_idx, match_iou) arrays of length n; match_idx is -1
+            where no spectral box was assigned
+        """
+        n = len(visual_boxes)
+        match_idx = np.full(n, -1, dtype=np.int64)
+        match_iou = np.zeros(n, dtype=np.float64)
+        
+        if n == 0 or len(spectral_boxes) == 0:
+            return match_idx, match_iou
+        
+        if self.assignment_mode == 'optimal':
+            self._match_optimal(visual_boxes, spectral_boxes, match_idx, match_iou)
+        else:
+            self._match_greedy(visual_boxes, spectral_boxes, match_idx, match_iou)
+        
+        return match_idx, match_iou
+    
+    def _match_greedy(
+        self,
+        visual_boxes: np.ndarray,
+        spectral_boxes: np.ndarray,
+        match_idx: np.ndarray,
+        match_iou: np.ndarray
+    ):
+        """Each visual box takes its best spectral box above spatial_match_threshold"""
+        for start, iou in self._iter_iou_blocks(visual_boxes, spectral_boxes):
+            stop = start + len(iou)
+            best = np.argmax(iou, axis=1)
+            best_iou = iou[np.arange(len(iou)), best]
+            matched = best_iou >= self.spatial_match_threshold
+            
+            match_idx[start:stop] = np.where(matched, best, -1)
+            match_iou[start:stop] = np.where(matched, best_iou, 0.0)
+    
+    def _match_optimal(
+        self,
+        visual_boxes: np.ndarray,
+        spectral_boxes: np.ndarray,
+        match_idx: np.ndarray,
+        match_iou: np.ndarray
+    ):
+        """
+        One-to-one maximum-IoU matching (Hungarian algorithm)
+        
+        Only pairs above spatial_match_threshold are candidates. The
+        candidate graph is split into connected components and each
+        component is solved independently, so the O(k^3) cost applies
+        to cluster size k rather than to the whole scene.
+        """
+        n, m = len(visual_boxes), len(spectral_boxes)
+        
+        # Sparse candidate pairs above threshold
+        rows, cols, vals = [], [], []
+        for start, iou in self._iter_iou_blocks(visual_boxes, spectral_boxes):
+            r, c = np.nonzero(iou >= self.spatial_match_threshold)
+            rows.append(r + start)
+            cols.append(c)
+            vals.append(iou[r, c])
+        
+        rows = np.concatenate(rows)
+        cols = np.concatenate(cols)
+        vals = np.concatenate(vals)
+        
+        if len(rows) == 0:
+            return
+        
+        # Components of the bipartite graph (visual nodes 0..n-1, spectral n..n+m-1)
+        graph = coo_matrix(
+            (np.ones(len(rows)), (rows, cols + n)),
+            shape=(n + m, n + m)
+        )
+        _, labels = connected_components(graph, directed=False)
+        
+        pair_labels = labels[rows]
+        order = np.argsort(pair_labels, kind='stable')
+        rows, cols, vals, pair_labels = rows[order], cols[order], vals[order], pair_labels[order]
+        bounds = np.flatnonzero(np.diff(pair_labels)) + 1
+        
+        for comp_rows, comp_cols, comp_vals in zip(
+            np.split(rows, bounds),
+            np.split(cols, bounds),
+            np.split(vals, bounds)
+        ):
+            if len(comp_rows) == 1:
+                match_idx[comp_rows[0]] = comp_cols[0]
+                match_iou[comp_rows[0]] = comp_vals[0]
+                continue
+            
+            u_rows, r_local = np.unique(comp_rows, return_inverse=True)
+            u_cols, c_local = np.unique(comp_cols, return_inverse=True)
+            
+            weights = np.zeros((len(u_rows), len(u_cols)))
+            weights[r_local, c_local] = comp_vals
+            
+            assigned_r, assigned_c = linear_sum_assignment(weights, maximize=True)
+            
+            # Zero-weight assignments are not real candidate pairs
+            valid = weights[assigned_r, assigned_c] > 0
+            match_idx[u_rows[assigned_r[valid]]] = u_cols[assigned_c[valid]]
+            match_iou[u_rows[assigned_r[valid]]] = weights[assigned_r[valid], assigned_c[valid]]
     
     def _fuse_detection_pair(
         self,
@@ -441,16 +804,8 @@ class DetectionFusionEngine:
         base_severity = 5
         
         # Adjust based on defect type
-        type_severity = {
-            'leak': 8,
-            'crack': 6,
-            'corrosion': 5,
-            'faulty_pipe': 7,
-            'pipe': 0
-        }
-        
         defect_type = detection['defect_type']
-        severity = type_severity.get(defect_type, base_severity)
+        severity = self.DEFECT_TYPE_SEVERITY.get(defect_type, base_severity)
         
         # Adjust based on confidence
         confidence = detection['combined_confidence']
@@ -469,26 +824,82 @@ class DetectionFusionEngine:
         
         return min(max(severity, 1), 10)
     
-    def _find_matching_detections(
+    def _severity_array(self, fused: DetectionBatch) -> np.ndarray:
+        """Vectorized _calculate_severity over a fused DetectionBatch"""
+        defect_type = fused.columns['defect_type']
+        types, inverse = np.unique(defect_type.astype(str), return_inverse=True)
+        
+        severity = np.array(
+            [self.DEFECT_TYPE_SEVERITY.get(t, 5) for t in types],
+            dtype=np.int64
+        )[inverse.reshape(-1)]
+        
+        severity += fused.confidence > 0.8
+        severity += fused.columns['fusion_type'] == 'visual_spectral'
+        
+        if 'ace_mean' in fused.columns:
+            ace_mean = fused.columns['ace_mean']
+            severity += np.nan_to_num(ace_mean, nan=0.0) > 0.8
+        
+        return np.clip(severity, 1, 10)
+    
+    def _gather(self, values: np.ndarray, idx: np.ndarray, fill) -> np.ndarray:
+        """values[idx] with `fill` where idx is -1"""
+        values = np.asarray(values)
+        
+        if len(values) == 0:
+            out_shape = (len(idx),) + values.shape[1:]
+            return np.full(out_shape, fill, dtype=values.dtype if values.dtype == object else None)
+        
+        out = values[np.maximum(idx, 0)].copy()
+        
+        if values.dtype.kind in 'iu' and isinstance(fill, float):
+            out = out.astype(np.float64)
+        
+        out[idx < 0] = fill
+        
+        return out
+    
+    def _match_detections(
         self,
-        reference: Dict[str, Any],
-        candidates: List[Dict[str, Any]],
+        reference_boxes: np.ndarray,
+        candidate_boxes: np.ndarray,
         iou_threshold: float
-    ) -> List[Dict[str, Any]]:
-        """Find detections that match spatially"""
-        matches = []
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find the best spatially matching candidate for every reference box
         
-        ref_bbox = reference['bbox']
+        Only candidates sharing grid cells with a reference box are scored,
+        and each pair's IoU is computed once.
         
-        for candidate in candidates:
-            iou = self._calculate_iou(ref_bbox, candidate['bbox'])
-            
-            if iou >= iou_threshold:
-                matches.append(candidate)
+        Returns:
+            (match_idx, match_iou) arrays of length n; match_idx is -1
+            where no candidate reaches iou_threshold. Ties go to the
+            lowest candidate index.
+        """
+        n = len(reference_boxes)
+        match_idx = np.full(n, -1, dtype=np.int64)
+        match_iou = np.zeros(n, dtype=np.float64)
+        
+        if n == 0 or len(candidate_boxes) == 0:
+            return match_idx, match_iou
+        
+        index = GridIndex(candidate_boxes)
+        ref_idx, cand_idx = index.query_pairs(reference_boxes)
         
-        matches.sort(key=lambda x: self._calculate_iou(ref_bbox, x['bbox']), reverse=True)
+        iou = box_iou_pairs(reference_boxes[ref_idx], candidate_boxes[cand_idx])
+        keep = iou >= iou_threshold
+        ref_idx, cand_idx, iou = ref_idx[keep], cand_idx[keep], iou[keep]
         
-        return matches
+        # Highest IoU first within each reference box
+        order = np.lexsort((cand_idx, -iou, ref_idx))
+        ref_idx, cand_idx, iou = ref_idx[order], cand_idx[order], iou[order]
+        first = np.unique(ref_idx, return_index=True)[1]
+        
+        match_idx[ref_idx[first]] = cand_idx[first]
+        match_iou[ref_idx[first]] = iou[first]
+        
+        return match_idx, match_iou
     
     def _has_condition_changed(
         self,
@@ -516,19 +927,3 @@ class DetectionFusionEngine:
             return True
         
         return False
-    
-    def _is_spatial_overlap(
-        self,
-        det1: Dict[str, Any],
-        det2: Dict[str, Any]
-    ) -> bool:
-        """Check if two detections overlap spatially"""
-        bbox1 = det1.get('bbox', [])
-        bbox2 = det2.get('bbox', [])
-        
-        if not bbox1 or not bbox2:
-            return False
-        
-        iou = self._calculate_iou(bbox1, bbox2)
-        
-        return iou > 0.1  # Any overlap
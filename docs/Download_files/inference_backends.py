@@ -0,0 +1,380 @@
+"""
+Inference Backends for YOLODetector
+PyTorch (ultralytics) and ONNX Runtime / OpenVINO execution paths
+"""
+
+import numpy as np
+from typing import List, Optional, Sequence, Union
+from abc import ABC, abstractmethod
+import logging
+from pathlib import Path
+import cv2
+
+from models.tile_merge import TileMergeEngine
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceBackend(ABC):
+    """
+    Common interface for YOLOv8 inference engines
+    
+    predict() returns one (n, 6) float32 array per image with rows
+    x1, y1, x2, y2, confidence, class_id in image pixel coordinates -
+    the rows YOLODetector._parse_results reads from ultralytics results.
+    """
+    
+    name = 'base'
+    
+    @abstractmethod
+    def load(self):
+        """Load the model"""
+    
+    @abstractmethod
+    def predict(
+        self,
+        images: Sequence[np.ndarray],
+        conf: float,
+        iou: float,
+        max_det: int
+    ) -> List[np.ndarray]:
+        """Run detection on a batch of RGB images"""
+
+
+class UltralyticsBackend(InferenceBackend):
+    """PyTorch inference through ultralytics.YOLO"""
+    
+    name = 'pytorch'
+    
+    def __init__(self, model_path: str, device: Optional[str] = None):
+        self.model_path = model_path
+        self.device = device
+        self.model = None
+    
+    def load(self):
+        from ultralytics import YOLO
+        
+        self.model = YOLO(self.model_path)
+    
+    def predict(
+        self,
+        images: Sequence[np.ndarray],
+        conf: float,
+        iou: float,
+        max_det: int
+    ) -> List[np.ndarray]:
+        results = self.model.predict(
+            list(images),
+            conf=conf,
+            iou=iou,
+            max_det=max_det,
+            device=self.device,
+            verbose=False
+        )
+        
+        return [
+            result.boxes.data.cpu().numpy().astype(np.float32)
+            if result.boxes is not None and len(result.boxes) > 0
+            else np.zeros((0, 6), dtype=np.float32)
+            for result in results
+        ]
+
+
+class OnnxRuntimeBackend(InferenceBackend):
+    """
+    ONNX Runtime inference for an exported YOLOv8 model
+    
+    A .pt path is exported to ONNX (dynamic batch) on load. Pre- and
+    post-processing (letterbox, box decoding, per-class NMS) match
+    ultralytics so detections are comparable with the PyTorch path.
+    
+    Quantization modes (applied to the exported model, cached on disk
+    next to it as <name>.<mode>.onnx):
+        dynamic - INT8 weights, activations quantized at run time
+        static  - INT8 weights and activations, calibrated on
+                  calibration_images (QDQ format, per-channel weights)
+        fp16    - float16 weights and compute, float32 inputs/outputs
+    """
+    
+    name = 'onnx'
+    
+    QUANTIZATION_MODES = ('dynamic', 'static', 'fp16')
+    
+    def __init__(
+        self,
+        model_path: str,
+        imgsz: int = 640,
+        intra_op_threads: Optional[int] = None,
+        inter_op_threads: Optional[int] = None,
+        providers: Optional[List[str]] = None,
+        quantization: Optional[str] = None,
+        calibration_images: Optional[Sequence[Union[str, np.ndarray]]] = None
+    ):
+        if quantization is not None and quantization not in self.QUANTIZATION_MODES:
+            raise ValueError(f"Unknown quantization mode: {quantization}")
+        
+        if quantization == 'static' and not calibration_images:
+            raise ValueError("Static INT8 quantization requires calibration_images")
+        
+        self.model_path = model_path
+        self.imgsz = imgsz
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+        self.providers = providers or ['CPUExecutionProvider']
+        self.quantization = quantization
+        self.calibration_images = calibration_images
+        self.session = None
+        self.input_name = None
+    
+    def load(self):
+        import onnxruntime as ort
+        
+        onnx_path = self.export_onnx(self.model_path, self.imgsz)
+        
+        if self.quantization:
+            onnx_path = self.quantize_onnx(onnx_path)
+        
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        
+        if self.intra_op_threads:
+            options.intra_op_num_threads = self.intra_op_threads
+        if self.inter_op_threads:
+            options.inter_op_num_threads = self.inter_op_threads
+        
+        # A missing provider would silently fall back to the plain CPU one
+        available = ort.get_available_providers()
+        missing = [p for p in self.providers if p not in available]
+        
+        if missing:
+            raise RuntimeError(
+                f"ONNX Runtime execution providers {missing} are not available "
+                f"(installed: {available}). The OpenVINO provider needs the "
+                f"onnxruntime-openvino package instead of onnxruntime."
+            )
+        
+        self.session = ort.InferenceSession(onnx_path, sess_options=options, providers=self.providers)
+        self.input_name = self.session.get_inputs()[0].name
+        
+        logger.info(f"ONNX Runtime session ready: {onnx_path} ({', '.join(self.session.get_providers())})")
+    
+    @staticmethod
+    def export_onnx(model_path: str, imgsz: int = 640) -> str:
+        """Export a .pt model to ONNX next to it (reused if up to date)"""
+        path = Path(model_path)
+        
+        if path.suffix == '.onnx':
+            return str(path)
+        
+        onnx_path = path.with_suffix('.onnx')
+        
+        if onnx_path.exists() and onnx_path.stat().st_mtime >= path.stat().st_mtime:
+            return str(onnx_path)
+        
+        from ultralytics import YOLO
+        
+        logger.info(f"Exporting {path} to ONNX")
+        
+        return str(YOLO(str(path)).export(format='onnx', imgsz=imgsz, dynamic=True))
+    
+    def quantize_onnx(self, onnx_path: str) -> str:
+        """Quantize an ONNX model with the configured mode (reused if up to date)"""
+        path = Path(onnx_path)
+        quantized_path = path.with_name(f"{path.stem}.{self.quantization}.onnx")
+        
+        if quantized_path.exists() and quantized_path.stat().st_mtime >= path.stat().st_mtime:
+            return str(quantized_path)
+        
+        logger.info(f"Quantizing {path} ({self.quantization})")
+        
+        if self.quantization == 'dynamic':
+            from onnxruntime.quantization import quantize_dynamic, QuantType
+            
+            quantize_dynamic(str(path), str(quantized_path), weight_type=QuantType.QInt8)
+        
+        elif self.quantization == 'static':
+            import onnx
+            from onnxruntime.quantization import quantize_static, QuantType, QuantFormat
+            
+            input_name = onnx.load(str(path), load_external_data=False).graph.input[0].name
+            
+            quantize_static(
+                str(path),
+                str(quantized_path),
+                _CalibrationReader(self, input_name, self.calibration_images),
+                quant_format=QuantFormat.QDQ,
+                activation_type=QuantType.QUInt8,
+                weight_type=QuantType.QInt8,
+                per_channel=True
+            )
+        
+        else:
+            import onnx
+            from onnxconverter_common import float16
+            
+            model = float16.convert_float_to_float16(onnx.load(str(path)), keep_io_types=True)
+            onnx.save(model, str(quantized_path))
+        
+        return str(quantized_path)
+    
+    def predict(
+        self,
+        images: Sequence[np.ndarray],
+        conf: float,
+        iou: float,
+        max_det: int
+    ) -> List[np.ndarray]:
+        if len(images) == 0:
+            return []
+        
+        inputs, gains, pads = zip(*(self._letterbox(image) for image in images))
+        
+        outputs = self.session.run(None, {self.input_name: np.stack(inputs)})[0]
+        
+        return [
+            self._postprocess(output, gain, pad, image.shape[:2], conf, iou, max_det)
+            for output, gain, pad, image in zip(outputs, gains, pads, images)
+        ]
+    
+    # Private methods
+    
+    def _letterbox(self, image: np.ndarray):
+        """Resize keeping aspect ratio and pad to imgsz x imgsz (CHW float32)"""
+        h, w = image.shape[:2]
+        gain = min(self.imgsz / h, self.imgsz / w)
+        new_w, new_h = int(round(w * gain)), int(round(h * gain))
+        
+        pad_x = (self.imgsz - new_w) / 2
+        pad_y = (self.imgsz - new_h) / 2
+        
+        canvas = np.full((self.imgsz, self.imgsz, 3), 114, dtype=np.uint8)
+        left, top = int(round(pad_x - 0.1)), int(round(pad_y - 0.1))
+        canvas[top:top + new_h, left:left + new_w] = cv2.resize(
+            np.ascontiguousarray(image[:, :, :3]),
+            (new_w, new_h),
+            interpolation=cv2.INTER_LINEAR
+        )
+        
+        tensor = canvas.transpose(2, 0, 1).astype(np.float32) / 255.0
+        
+        return tensor, gain, (left, top)
+    
+    def _postprocess(
+        self,
+        output: np.ndarray,
+        gain: float,
+        pad: tuple,
+        image_shape: tuple,
+        conf: float,
+        iou: float,
+        max_det: int
+    ) -> np.ndarray:
+        """Decode one (4 + num_classes, anchors) YOLOv8 output"""
+        predictions = output.T
+        class_scores = predictions[:, 4:]
+        
+        class_ids = np.argmax(class_scores, axis=1)
+        scores = class_scores[np.arange(len(class_scores)), class_ids]
+        
+        keep = scores > conf
+        predictions, scores, class_ids = predictions[keep], scores[keep], class_ids[keep]
+        
+        if len(scores) == 0:
+            return np.zeros((0, 6), dtype=np.float32)
+        
+        # cx, cy, w, h -> x1, y1, x2, y2 in letterboxed pixels
+        cx, cy, bw, bh = predictions[:, 0], predictions[:, 1], predictions[:, 2], predictions[:, 3]
+        boxes = np.stack([cx - bw / 2, cy - bh / 2, cx + bw / 2, cy + bh / 2], axis=1)
+        
+        kept = TileMergeEngine(iou_threshold=iou).nms_indices(boxes, scores, class_ids)[:max_det]
+        boxes, scores, class_ids = boxes[kept], scores[kept], class_ids[kept]
+        
+        # Undo letterbox
+        boxes -= np.array([pad[0], pad[1], pad[0], pad[1]], dtype=boxes.dtype)
+        boxes /= gain
+        boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, image_shape[1])
+        boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, image_shape[0])
+        
+        return np.hstack([boxes, scores[:, None], class_ids[:, None]]).astype(np.float32)
+
+
+class _CalibrationReader:
+    """ONNX Runtime calibration data reader over letterboxed sample images"""
+    
+    def __init__(
+        self,
+        backend: OnnxRuntimeBackend,
+        input_name: str,
+        images: Sequence[Union[str, np.ndarray]]
+    ):
+        self.backend = backend
+        self.input_name = input_name
+        self.images = list(images)
+        self._iter = iter(self.images)
+    
+    def get_next(self):
+        image = next(self._iter, None)
+        
+        if image is None:
+            return None
+        
+        if not isinstance(image, np.ndarray):
+            image = cv2.cvtColor(cv2.imread(str(image)), cv2.COLOR_BGR2RGB)
+        
+        tensor, _, _ = self.backend._letterbox(image)
+        
+        return {self.input_name: tensor[None]}
+    
+    def rewind(self):
+        self._iter = iter(self.images)
+
+
+def create_backend(
+    backend: str,
+    model_path: str,
+    imgsz: int = 640,
+    num_threads: Optional[int] = None,
+    device: Optional[str] = None,
+    quantization: Optional[str] = None,
+    calibration_images: Optional[Sequence[Union[str, np.ndarray]]] = None
+) -> InferenceBackend:
+    """
+    Build an inference backend by name
+    
+    Args:
+        backend: 'pytorch', 'onnx' (ONNX Runtime CPU) or 'openvino'
+                 (ONNX Runtime with the OpenVINO execution provider,
+                 from the onnxruntime-openvino package)
+        model_path: .pt weights (exported on demand) or .onnx model
+        imgsz: Network input size for exported models
+        num_threads: Intra-op threads for ONNX Runtime
+        device: Torch device for the PyTorch backend (None = auto)
+        quantization: None, 'dynamic', 'static' or 'fp16' (ONNX backends only)
+        calibration_images: Image paths or RGB arrays for static INT8
+    """
+    if backend == 'pytorch':
+        if quantization is not None:
+            raise ValueError("Quantized inference requires the 'onnx' or 'openvino' backend")
+        
+        return UltralyticsBackend(model_path, device=device)
+    
+    if backend == 'onnx':
+        return OnnxRuntimeBackend(
+            model_path,
+            imgsz=imgsz,
+            intra_op_threads=num_threads,
+            quantization=quantization,
+            calibration_images=calibration_images
+        )
+    
+    if backend == 'openvino':
+        return OnnxRuntimeBackend(
+            model_path,
+            imgsz=imgsz,
+            intra_op_threads=num_threads,
+            providers=['OpenVINOExecutionProvider', 'CPUExecutionProvider'],
+            quantization=quantization,
+            calibration_images=calibration_images
+        )
+    
+    raise ValueError(f"Unknown inference backend: {backend}")
@@ -0,0 +1,180 @@
+"""
+Integral-Image Local RX Anomaly Detector
+Sliding-window RX whose window statistics come from summed-area tables
+"""
+
+import numpy as np
+from typing import Optional, Tuple
+import logging
+
+from models.background_stats import BackgroundStatistics
+
+logger = logging.getLogger(__name__)
+
+
+class IntegralLocalRX:
+    """
+    Local RX with an (inner, outer) guard window, like spy.rx(window=...)
+    
+    The background of each pixel is the outer window minus the inner
+    window. Running sums of x and of the upper triangle of x x^T are kept
+    in summed-area tables, so every window's sums cost four lookups and
+    the annulus mean and covariance are O(B^2) per pixel regardless of
+    the window size. Window placement near borders follows SPy: windows
+    are shifted to stay inside the image rather than clipped.
+    
+    The image is processed in tiles whose tables fit in max_bytes.
+    """
+    
+    def __init__(
+        self,
+        inner: int = 3,
+        outer: int = 25,
+        cov: Optional[np.ndarray] = None,
+        max_bytes: int = 256 * 2**20
+    ):
+        """
+        Args:
+            inner: Inner (guard) window width in pixels
+            outer: Outer (background) window width in pixels
+            cov: Shared covariance; if given only the local mean is
+                 estimated per window (same as spy.rx(..., cov=cov))
+            max_bytes: Approximate memory budget per tile
+        """
+        if inner >= outer:
+            raise ValueError("Inner window must be smaller than outer window")
+        
+        self.inner = inner
+        self.outer = outer
+        self.cov = cov
+        self.max_bytes = max_bytes
+    
+    def __call__(self, img: np.ndarray) -> np.ndarray:
+        """
+        RX scores (squared Mahalanobis distance) for a (rows, cols, bands) cube
+        """
+        rows, cols, num_bands = img.shape
+        
+        outer = (min(self.outer, rows), min(self.outer, cols))
+        inner = (min(self.inner, outer[0]), min(self.inner, outer[1]))
+        num_samples = outer[0] * outer[1] - inner[0] * inner[1]
+        
+        if self.cov is None and num_samples <= num_bands:
+            raise ValueError("Window size provides too few samples for image data dimensionality")
+        
+        # Centering keeps the raw-moment covariance well conditioned
+        center = img.reshape(-1, num_bands).mean(axis=0, dtype=np.float64)
+        
+        if self.cov is not None:
+            inv_cov = BackgroundStatistics(np.zeros(num_bands), self.cov, num_samples).inv_cov
+        else:
+            inv_cov = None
+        
+        tile = self._tile_size(num_bands, outer)
+        scores = np.empty((rows, cols))
+        
+        for r0 in range(0, rows, tile):
+            for c0 in range(0, cols, tile):
+                r1, c1 = min(r0 + tile, rows), min(c0 + tile, cols)
+                scores[r0:r1, c0:c1] = self._score_tile(
+                    img, center, inv_cov, (r0, r1), (c0, c1), inner, outer, num_samples
+                )
+        
+        return scores
+    
+    # Private methods
+    
+    def _score_tile(
+        self,
+        img: np.ndarray,
+        center: np.ndarray,
+        inv_cov: Optional[np.ndarray],
+        row_range: Tuple[int, int],
+        col_range: Tuple[int, int],
+        inner: Tuple[int, int],
+        outer: Tuple[int, int],
+        num_samples: int
+    ) -> np.ndarray:
+        """RX scores for output pixels rows [r0, r1) x cols [c0, c1)"""
+        rows, cols, num_bands = img.shape
+        
+        out_rows = np.arange(*row_range)
+        out_cols = np.arange(*col_range)
+        
+        outer_y = self._window_starts(out_rows, rows, outer[0])
+        outer_x = self._window_starts(out_cols, cols, outer[1])
+        inner_y = self._window_starts(out_rows, rows, inner[0])
+        inner_x = self._window_starts(out_cols, cols, inner[1])
+        
+        # Input region covering every outer window of the tile
+        y_lo, y_hi = outer_y[0], outer_y[-1] + outer[0]
+        x_lo, x_hi = outer_x[0], outer_x[-1] + outer[1]
+        
+        region = img[y_lo:y_hi, x_lo:x_hi].astype(np.float64) - center
+        
+        if inv_cov is None:
+            iu0, iu1 = np.triu_indices(num_bands)
+            features = np.concatenate([region, region[..., iu0] * region[..., iu1]], axis=2)
+        else:
+            features = region
+        
+        table = np.zeros((features.shape[0] + 1, features.shape[1] + 1, features.shape[2]))
+        np.cumsum(features, axis=0, out=table[1:, 1:])
+        np.cumsum(table[1:, 1:], axis=1, out=table[1:, 1:])
+        del features
+        
+        def box_sums(y0: np.ndarray, x0: np.ndarray, height: int, width: int) -> np.ndarray:
+            y0, x0 = (y0 - y_lo)[:, None], (x0 - x_lo)[None, :]
+            y1, x1 = y0 + height, x0 + width
+            return table[y1, x1] - table[y0, x1] - table[y1, x0] + table[y0, x0]
+        
+        sums = (
+            box_sums(outer_y, outer_x, *outer) -
+            box_sums(inner_y, inner_x, *inner)
+        ).reshape(-1, table.shape[2])
+        
+        mean = sums[:, :num_bands] / num_samples
+        pixels = region[(out_rows - y_lo)[:, None], (out_cols - x_lo)[None, :]].reshape(-1, num_bands)
+        diff = pixels - mean
+        
+        if inv_cov is not None:
+            scores = np.einsum('ij,jk,ik->i', diff, inv_cov, diff)
+        else:
+            second = np.empty((len(sums), num_bands, num_bands))
+            second[:, iu0, iu1] = sums[:, num_bands:]
+            second[:, iu1, iu0] = sums[:, num_bands:]
+            
+            cov = (second - num_samples * mean[:, :, None] * mean[:, None, :]) / (num_samples - 1)
+            
+            try:
+                solved = np.linalg.solve(cov, diff[:, :, None])[:, :, 0]
+            except np.linalg.LinAlgError:
+                # Singular window covariance - pseudo-inverse like SPy
+                solved = np.einsum('pij,pj->pi', np.linalg.pinv(cov, hermitian=True), diff)
+            
+            scores = np.einsum('ij,ij->i', diff, solved)
+        
+        return scores.reshape(len(out_rows), len(out_cols))
+    
+    def _tile_size(self, num_bands: int, outer: Tuple[int, int]) -> int:
+        """Largest square tile whose tables and per-pixel matrices fit max_bytes"""
+        if self.cov is None:
+            per_table_pixel = num_bands + num_bands * (num_bands + 1) // 2
+            per_output_pixel = 2 * num_bands * num_bands
+        else:
+            per_table_pixel = num_bands
+            per_output_pixel = 2 * num_bands
+        
+        tile = 512
+        while tile > 1:
+            table_bytes = 2 * (tile + outer[0]) * (tile + outer[1]) * per_table_pixel * 8
+            if table_bytes + tile * tile * per_output_pixel * 8 <= self.max_bytes:
+                break
+            tile //= 2
+        
+        return tile
+    
+    @staticmethod
+    def _window_starts(positions: np.ndarray, length: int, size: int) -> np.ndarray:
+        """First row/col of windows centered on positions, shifted inside the image"""
+        return np.clip(positions - size // 2, 0, length - size)
@@ -0,0 +1,69 @@
+"""
+Stage Memory Report
+Per-stage peak and retained heap memory of an analysis run (tracemalloc)
+"""
+
+from typing import Dict, List, Any
+import logging
+import tracemalloc
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+MB = 2 ** 20
+
+
+class MemoryReport:
+    """
+    Records heap memory around named stages
+    
+    NumPy reports its array buffers to tracemalloc, so the figures cover
+    the maps and temporaries each stage allocates. Memory allocated
+    before start() (e.g. the input cube) is not counted.
+    """
+    
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.stages: List[Dict[str, Any]] = []
+        self._owns_tracing = False
+    
+    def start(self):
+        if self.enabled and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._owns_tracing = True
+    
+    def stop(self):
+        if self._owns_tracing:
+            tracemalloc.stop()
+            self._owns_tracing = False
+    
+    @contextmanager
+    def stage(self, name: str):
+        """Record peak and retained memory of the enclosed block"""
+        if not (self.enabled and tracemalloc.is_tracing()):
+            yield
+            return
+        
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        
+        try:
+            yield
+        finally:
+            current, peak = tracemalloc.get_traced_memory()
+            
+            self.stages.append({
+                'stage': name,
+                'peak_mb': round(peak / MB, 2),
+                'retained_mb': round(current / MB, 2),
+                'allocated_mb': round((current - before) / MB, 2)
+            })
+            
+            logger.debug(f"Memory [{name}]: peak {peak / MB:.1f} MB, retained {current / MB:.1f} MB")
+    
+    @property
+    def peak_mb(self) -> float:
+        return max((stage['peak_mb'] for stage in self.stages), default=0.0)
+    
+    def as_dict(self) -> Dict[str, Any]:
+        return {'peak_mb': self.peak_mb, 'stages': list(self.stages)}
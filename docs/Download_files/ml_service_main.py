@@ -17,6 +17,7 @@ import shutil
 # Import our custom modules
 from models.yolo_detector import YOLODetector
 from models.spectral_analyzer import SpectralAnalyzer
+from models.result_projection import ResultProjection
 from models.fusion_engine import DetectionFusionEngine
 from graph.tinkerpop_client import TinkerPopClient
 from graph.graph_builder import PipelineGraphBuilder
@@ -132,23 +133,30 @@ async def detect_multimodal(
             rgb_preprocessed = preprocessor.preprocess_rgb(str(rgb_path))
             hyper_preprocessed = preprocessor.preprocess_hyperspectral(str(hyper_path))
             
-            # 2. YOLOv8 detection on RGB
+            # 2. YOLOv8 detection on RGB (columnar, no per-detection dicts)
             logger.info("Running YOLOv8 detection...")
-            yolo_detections = yolo_detector.detect(rgb_preprocessed)
+            yolo_detections = yolo_detector.detect(rgb_preprocessed, as_batch=True)
             
             # 3. Spectral analysis with SPy
             logger.info("Running spectral analysis...")
-            spectral_results = spectral_analyzer.analyze(hyper_preprocessed)
+            spectral_results = spectral_analyzer.analyze(
+                hyper_preprocessed,
+                as_batch=True,
+                projection=ResultProjection.compact()  # fusion only reads leak details
+            )
             
             # 4. Fuse detections
             logger.info("Fusing multi-modal detections...")
-            fused_detections = fusion_engine.fuse(
+            fused_batch = fusion_engine.fuse_batch(
                 yolo_detections,
                 spectral_results,
                 rgb_preprocessed,
                 hyper_preprocessed
             )
             
+            # API boundary: build response dicts only for final detections
+            fused_detections = fusion_engine.to_dicts(fused_batch)
+            
             # 5. Store in graph database
             logger.info("Storing results in graph database...")
             for detection in fused_detections:
@@ -399,7 +407,8 @@ async def warzone_damage_assessment(
                     shutil.copyfileobj(hyperspectral_after.file, f)
                 
                 spectral_results = spectral_analyzer.analyze(
-                    preprocessor.preprocess_hyperspectral(str(hyper_path))
+                    preprocessor.preprocess_hyperspectral(str(hyper_path)),
+                    projection=ResultProjection.compact()
                 )
                 
                 changes = fusion_engine.enhance_with_spectral(
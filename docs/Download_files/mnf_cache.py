@@ -0,0 +1,169 @@
+"""
+MNF Transform Cache
+Fitted MNF reduction transforms reused across cubes from the same sensor
+"""
+
+import numpy as np
+from typing import Dict, List, Optional, Any, Tuple
+import logging
+from collections import OrderedDict
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+class MNFTransformCache:
+    """
+    LRU cache of MNF reduction transforms keyed by (sensor ID, band count)
+    
+    Consecutive cubes from one sensor flight share nearly the same noise
+    covariance, so the transform fitted on the first cube is reused and
+    later cubes only pay for the projection. With staleness_tolerance set,
+    a cached transform is refitted when the new cube's noise covariance
+    differs from the one it was fitted on by more than that relative
+    (Frobenius) amount.
+    
+    Transforms can be saved to and preloaded from a directory of .npz
+    files, one per key.
+    """
+    
+    def __init__(
+        self,
+        max_entries: int = 8,
+        staleness_tolerance: Optional[float] = None
+    ):
+        """
+        Args:
+            max_entries: Transforms kept before the least recently used is evicted
+            staleness_tolerance: Maximum relative noise covariance change
+                                 before a transform is refitted
+                                 (None: never check, no noise estimate needed)
+        """
+        self.max_entries = max_entries
+        self.staleness_tolerance = staleness_tolerance
+        self._entries: 'OrderedDict[Tuple[str, int], Dict[str, Any]]' = OrderedDict()
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def __contains__(self, key: Tuple[str, int]) -> bool:
+        return key in self._entries
+    
+    @property
+    def checks_staleness(self) -> bool:
+        """Whether get needs the new cube's noise statistics"""
+        return self.staleness_tolerance is not None
+    
+    def get(self, sensor_id: str, num_bands: int, noise=None):
+        """
+        Cached transform (spy LinearTransform) or None
+        
+        Args:
+            sensor_id: Sensor the cube comes from
+            num_bands: Band count of the cube
+            noise: Noise statistics (spy GaussianStats) of the new cube,
+                   used for the staleness check
+        """
+        key = (str(sensor_id), int(num_bands))
+        entry = self._entries.get(key)
+        
+        if entry is None:
+            return None
+        
+        if self.checks_staleness and noise is not None:
+            change = self._relative_change(entry['noise_cov'], noise.cov)
+            
+            if change > self.staleness_tolerance:
+                logger.info(f"MNF transform for {key} is stale (noise change {change:.3f}); refitting")
+                del self._entries[key]
+                return None
+        
+        self._entries.move_to_end(key)
+        
+        return entry['transform']
+    
+    def put(self, sensor_id: str, num_bands: int, transform, noise=None):
+        """Store a fitted transform, evicting the least recently used beyond max_entries"""
+        key = (str(sensor_id), int(num_bands))
+        
+        self._entries[key] = {
+            'transform': transform,
+            'noise_cov': None if noise is None else np.asarray(noise.cov, dtype=np.float64)
+        }
+        self._entries.move_to_end(key)
+        
+        while len(self._entries) > self.max_entries:
+            evicted, _ = self._entries.popitem(last=False)
+            logger.debug(f"MNF transform for {evicted} evicted")
+    
+    def clear(self):
+        self._entries.clear()
+    
+    def save(self, directory: str) -> List[str]:
+        """Write every cached transform to <directory>/<sensor>__<bands>.npz"""
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        
+        paths = []
+        
+        for (sensor_id, num_bands), entry in self._entries.items():
+            transform = entry['transform']
+            arrays = {'A': transform._A}
+            
+            for name in ('pre', 'post'):
+                value = getattr(transform, f"_{name}", None)
+                if value is not None:
+                    arrays[name] = np.asarray(value)
+            
+            if entry['noise_cov'] is not None:
+                arrays['noise_cov'] = entry['noise_cov']
+            
+            path = directory / f"{sensor_id}__{num_bands}.npz"
+            np.savez(path, sensor_id=np.array(sensor_id), num_bands=np.array(num_bands), **arrays)
+            paths.append(str(path))
+        
+        logger.info(f"Saved {len(paths)} MNF transforms to {directory}")
+        
+        return paths
+    
+    def preload(self, directory: str) -> int:
+        """Load transforms saved by save(); returns how many were loaded"""
+        from spectral.algorithms.transforms import LinearTransform
+        
+        files = sorted(Path(directory).glob('*.npz'))
+        loaded = 0
+        
+        for path in files:
+            try:
+                with np.load(path) as data:
+                    transform = LinearTransform(
+                        data['A'],
+                        pre=data['pre'] if 'pre' in data else None,
+                        post=data['post'] if 'post' in data else None
+                    )
+                    noise_cov = data['noise_cov'] if 'noise_cov' in data else None
+                    
+                    key = (str(data['sensor_id']), int(data['num_bands']))
+                
+                self._entries[key] = {'transform': transform, 'noise_cov': noise_cov}
+                loaded += 1
+            
+            except Exception as e:
+                logger.warning(f"Failed to load MNF transform {path}: {str(e)}")
+        
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        
+        logger.info(f"Preloaded {loaded} MNF transforms from {directory}")
+        
+        return loaded
+    
+    # Private methods
+    
+    @staticmethod
+    def _relative_change(reference: Optional[np.ndarray], cov: np.ndarray) -> float:
+        """||cov - reference||_F / ||reference||_F (0 when nothing to compare)"""
+        if reference is None or reference.shape != cov.shape:
+            return 0.0
+        
+        return float(np.linalg.norm(cov - reference) / (np.linalg.norm(reference) + 1e-30))
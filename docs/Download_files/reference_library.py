@@ -0,0 +1,201 @@
+"""
+Spectral Reference Library
+Measured reference spectra in a versioned, memory-mapped on-disk format
+"""
+
+import numpy as np
+from typing import Dict, List, Optional, Any, Sequence
+import logging
+import json
+from pathlib import Path
+
+from models.band_lookup import BandLookup, WAVELENGTH_UNITS
+
+logger = logging.getLogger(__name__)
+
+# On-disk format identifier and version (<name>.json header + <name>.npy spectra)
+LIBRARY_FORMAT = 'wpdd-spectral-library'
+LIBRARY_VERSION = 1
+
+
+class ReferenceLibrary:
+    """
+    Named reference spectra sampled at common wavelengths (nm)
+    
+    Libraries are imported from measured collections (ENVI .sli exports
+    of USGS / ECOSTRESS, or CSV), saved once in the versioned format and
+    memory-mapped at startup. resample() interpolates the library onto a
+    sensor's band centers; results are cached per sensor (band table
+    header hash), so each sensor pays for resampling once.
+    """
+    
+    def __init__(
+        self,
+        names: Sequence[str],
+        wavelengths: np.ndarray,
+        spectra: np.ndarray,
+        metadata: Optional[Dict[str, Any]] = None
+    ):
+        """
+        Args:
+            names: Material names, one per spectrum
+            wavelengths: (B,) band centers in nm, increasing
+            spectra: (k, B) reflectance spectra
+            metadata: Free-form provenance (source, description, ...)
+        """
+        if spectra.shape != (len(names), len(wavelengths)):
+            raise ValueError(f"Spectra shape {spectra.shape} does not match {len(names)} names x {len(wavelengths)} wavelengths")
+        
+        self.names = [str(name) for name in names]
+        self.wavelengths = np.asarray(wavelengths, dtype=np.float64)
+        self.spectra = spectra
+        self.metadata = dict(metadata or {})
+        self._resampled: Dict[str, 'ReferenceLibrary'] = {}
+    
+    def __len__(self) -> int:
+        return len(self.names)
+    
+    @classmethod
+    def builtin(cls) -> 'ReferenceLibrary':
+        """
+        The simplified synthetic signatures (400-2500 nm, 224 bands)
+        
+        Deterministic, so every worker classifies identically.
+        """
+        wavelengths = np.linspace(400, 2500, 224)
+        
+        water = np.ones_like(wavelengths)
+        water[wavelengths > 1400] *= 0.3  # Strong absorption at 1450nm
+        water[wavelengths > 1900] *= 0.1  # Very strong at 1940nm
+        
+        healthy_pipe = 0.5 + 0.1 * np.sin(wavelengths / 100)
+        
+        # Iron oxide has characteristic absorption features
+        corrosion = np.ones_like(wavelengths)
+        corrosion[wavelengths < 600] *= 0.7  # Lower reflectance in blue
+        corrosion[(wavelengths > 800) & (wavelengths < 1000)] *= 0.5
+        
+        vegetation = np.ones_like(wavelengths)
+        vegetation[wavelengths < 700] *= 0.3  # Low reflectance in visible
+        vegetation[(wavelengths >= 700) & (wavelengths < 1300)] *= 2.0  # High NIR
+        
+        # Concrete is relatively flat, high reflectance (fixed-seed texture)
+        concrete = np.abs(0.7 + 0.05 * np.random.default_rng(0).standard_normal(len(wavelengths)))
+        
+        return cls(
+            ['water_leak', 'healthy_pipe', 'corroded_pipe', 'vegetation', 'concrete'],
+            wavelengths,
+            np.stack([water, healthy_pipe, corrosion, vegetation, concrete]),
+            metadata={'source': 'builtin'}
+        )
+    
+    @classmethod
+    def from_envi(cls, header_path: str) -> 'ReferenceLibrary':
+        """Import an ENVI spectral library (.hdr + .sli), e.g. a USGS / ECOSTRESS export"""
+        import spectral as spy
+        
+        library = spy.envi.open(header_path)
+        scale = WAVELENGTH_UNITS.get(str(library.bands.band_unit or 'nm').strip().lower(), 1.0)
+        
+        return cls._sorted(
+            library.names,
+            np.asarray(library.bands.centers, dtype=np.float64) * scale,
+            np.asarray(library.spectra, dtype=np.float32),
+            {'source': str(header_path)}
+        )
+    
+    @classmethod
+    def from_csv(cls, csv_path: str, wavelength_scale: float = 1.0) -> 'ReferenceLibrary':
+        """
+        Import a CSV with a wavelength column followed by one column per material
+        
+        The header row gives the material names.
+        """
+        with open(csv_path) as f:
+            header = f.readline().strip().split(',')
+        
+        data = np.loadtxt(csv_path, delimiter=',', skiprows=1, ndmin=2)
+        
+        return cls._sorted(
+            [name.strip() for name in header[1:]],
+            data[:, 0] * wavelength_scale,
+            data[:, 1:].T.astype(np.float32),
+            {'source': str(csv_path)}
+        )
+    
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> 'ReferenceLibrary':
+        """
+        Load a library saved with save()
+        
+        The spectra are memory-mapped, so startup cost does not grow with
+        the library size.
+        """
+        path = Path(path).with_suffix('')
+        header = json.loads(path.with_suffix('.json').read_text())
+        
+        if header.get('format') != LIBRARY_FORMAT:
+            raise ValueError(f"{path}.json is not a spectral reference library")
+        
+        if header.get('version') != LIBRARY_VERSION:
+            raise ValueError(f"Unsupported spectral library version {header.get('version')} (expected {LIBRARY_VERSION})")
+        
+        spectra = np.load(path.with_suffix('.npy'), mmap_mode='r' if mmap else None)
+        
+        return cls(header['names'], np.asarray(header['wavelengths']), spectra, header.get('metadata'))
+    
+    def save(self, path: str) -> str:
+        """Write <path>.json (names, wavelengths, version) and <path>.npy (spectra)"""
+        path = Path(path).with_suffix('')
+        path.parent.mkdir(parents=True, exist_ok=True)
+        
+        np.save(path.with_suffix('.npy'), np.ascontiguousarray(self.spectra, dtype=np.float32))
+        
+        path.with_suffix('.json').write_text(json.dumps({
+            'format': LIBRARY_FORMAT,
+            'version': LIBRARY_VERSION,
+            'names': self.names,
+            'wavelengths': self.wavelengths.tolist(),
+            'metadata': self.metadata
+        }))
+        
+        logger.info(f"Saved {len(self)} reference spectra to {path}")
+        
+        return str(path.with_suffix('.json'))
+    
+    def resample(self, bands: BandLookup) -> 'ReferenceLibrary':
+        """
+        Library linearly interpolated onto a sensor's band centers
+        
+        Cached per band table, so repeated calls for a sensor are free.
+        """
+        resampled = self._resampled.get(bands.key)
+        
+        if resampled is None:
+            spectra = np.stack([
+                np.interp(bands.wavelengths, self.wavelengths, spectrum)
+                for spectrum in np.asarray(self.spectra, dtype=np.float64)
+            ]).reshape(len(self), bands.num_bands)
+            
+            resampled = self._resampled[bands.key] = ReferenceLibrary(
+                self.names, bands.wavelengths, spectra, self.metadata
+            )
+            
+            logger.debug(f"Resampled {len(self)} reference spectra to {bands.num_bands} bands")
+        
+        return resampled
+    
+    def as_dict(self) -> Dict[str, np.ndarray]:
+        """name -> spectrum (float64)"""
+        spectra = np.asarray(self.spectra, dtype=np.float64)
+        
+        return {name: spectra[i] for i, name in enumerate(self.names)}
+    
+    # Private methods
+    
+    @classmethod
+    def _sorted(cls, names: List[str], wavelengths: np.ndarray, spectra: np.ndarray, metadata: Dict[str, Any]):
+        """Library with wavelengths in increasing order (np.interp needs it)"""
+        order = np.argsort(wavelengths, kind='stable')
+        
+        return cls(names, wavelengths[order], spectra[:, order], metadata)
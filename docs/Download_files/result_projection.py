@@ -0,0 +1,108 @@
+"""
+Result Projection
+Selects which score maps SpectralAnalyzer.analyze returns, and in what form
+"""
+
+import numpy as np
+from typing import Dict, Optional, Any, Sequence
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Per-pixel maps in analyze results
+MAP_KEYS = ('ndwi', 'ndvi', 'rx_scores', 'ace_scores', 'mf_scores', 'confidence_map')
+
+# 'full': maps as computed; 'downsample': every n-th row/column;
+# 'top_k': the k highest-scoring pixels as a sparse dict
+PROJECTION_MODES = ('full', 'downsample', 'top_k')
+
+
+class ResultProjection:
+    """
+    Which per-pixel maps analyze returns, and in what form
+    
+    Maps that are not requested are returned as None; analyze skips
+    computing the ones nothing else needs (NDVI, the confidence map) and
+    drops the rest once leak candidates are extracted, so only the leak
+    details and the requested (possibly reduced) maps outlive the call.
+    
+    Sparse top-k maps are dicts {'shape', 'rows', 'cols', 'values'} with
+    the pixels ordered by decreasing value.
+    """
+    
+    def __init__(
+        self,
+        maps: Sequence[str] = MAP_KEYS,
+        mode: str = 'full',
+        downsample: int = 4,
+        top_k: int = 1000
+    ):
+        """
+        Args:
+            maps: Map keys to return (subset of MAP_KEYS)
+            mode: One of PROJECTION_MODES
+            downsample: Row/column stride in 'downsample' mode
+            top_k: Pixels kept per map in 'top_k' mode
+        """
+        unknown = [name for name in maps if name not in MAP_KEYS]
+        if unknown:
+            raise ValueError(f"Unknown result maps {unknown}. Choose from {list(MAP_KEYS)}")
+        
+        if mode not in PROJECTION_MODES:
+            raise ValueError(f"Unknown projection mode '{mode}'. Choose from {list(PROJECTION_MODES)}")
+        
+        self.maps = tuple(maps)
+        self.mode = mode
+        self.downsample = max(1, int(downsample))
+        self.top_k = max(1, int(top_k))
+    
+    @classmethod
+    def compact(cls) -> 'ResultProjection':
+        """No maps: leak candidates, details and metadata only"""
+        return cls(maps=())
+    
+    def wants(self, name: str) -> bool:
+        return name in self.maps
+    
+    def project(self, name: str, array: Optional[np.ndarray]) -> Any:
+        """Requested form of one map (None if not requested)"""
+        if array is None or not self.wants(name):
+            return None
+        
+        if self.mode == 'downsample':
+            # Copy, so the full-resolution map can be freed
+            return np.ascontiguousarray(array[::self.downsample, ::self.downsample])
+        
+        if self.mode == 'top_k':
+            return self._top_k(array)
+        
+        return array
+    
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'maps': list(self.maps),
+            'mode': self.mode,
+            'downsample': self.downsample if self.mode == 'downsample' else None,
+            'top_k': self.top_k if self.mode == 'top_k' else None
+        }
+    
+    # Private methods
+    
+    def _top_k(self, array: np.ndarray) -> Dict[str, Any]:
+        """k highest pixels (NaN ignored) as coordinate lists"""
+        flat = array.reshape(-1)
+        valid = np.flatnonzero(~np.isnan(flat))
+        k = min(self.top_k, len(valid))
+        
+        # argpartition selects in O(n); only the k winners are sorted
+        top = valid[np.argpartition(flat[valid], len(valid) - k)[len(valid) - k:]] if k else valid[:0]
+        top = top[np.argsort(flat[top], kind='stable')[::-1]]
+        
+        rows, cols = np.unravel_index(top, array.shape)
+        
+        return {
+            'shape': tuple(array.shape),
+            'rows': rows.astype(np.int32),
+            'cols': cols.astype(np.int32),
+            'values': flat[top].astype(np.float32)
+        }
@@ -0,0 +1,274 @@
+"""
+Score Tile Store
+Georeferenced per-tile detector scores kept between surveys of the same corridor
+"""
+
+import numpy as np
+from typing import Dict, Optional, Any, Tuple
+import logging
+import hashlib
+import json
+import re
+from pathlib import Path
+
+from models.background_stats import BackgroundStatistics
+
+logger = logging.getLogger(__name__)
+
+# On-disk format identifier and version (store.json + background.npz + tiles/*.npz)
+STORE_FORMAT = 'wpdd-score-tiles'
+STORE_VERSION = 1
+
+
+class Footprint:
+    """
+    Position of a cube on a north-up map grid
+    
+    The upper-left pixel corner is at (easting, northing) in the map
+    units of crs. Cubes with the same pixel size and CRS share one global
+    pixel grid (origin at easting = northing = 0), which is what lets
+    overlapping flight lines address the same score tiles.
+    """
+    
+    def __init__(
+        self,
+        easting: float,
+        northing: float,
+        pixel_size: float,
+        pixel_height: Optional[float] = None,
+        crs: str = ''
+    ):
+        """
+        Args:
+            easting: Map x of the upper-left pixel corner
+            northing: Map y of the upper-left pixel corner
+            pixel_size: Pixel width in map units
+            pixel_height: Pixel height in map units (default: pixel_size)
+            crs: Coordinate reference system label (e.g. 'UTM 33 North WGS-84')
+        """
+        if pixel_size <= 0 or (pixel_height is not None and pixel_height <= 0):
+            raise ValueError("Footprint pixel size must be positive")
+        
+        self.easting = float(easting)
+        self.northing = float(northing)
+        self.pixel_size = float(pixel_size)
+        self.pixel_height = float(pixel_height or pixel_size)
+        self.crs = str(crs)
+    
+    @classmethod
+    def from_envi_header(cls, header_path: str) -> 'Footprint':
+        """Footprint from the 'map info' field of an ENVI .hdr file"""
+        import spectral as spy
+        
+        header = spy.envi.read_envi_header(str(header_path))
+        map_info = header.get('map info')
+        
+        if not map_info:
+            raise ValueError(f"No 'map info' in {header_path}; pass a Footprint explicitly")
+        
+        # {projection, ref x, ref y, easting, northing, x size, y size, [zone, hemisphere,] datum, ...}
+        fields = [field.strip() for field in map_info] if isinstance(map_info, list) else \
+            [field.strip() for field in str(map_info).strip('{}').split(',')]
+        
+        ref_x, ref_y, easting, northing, size_x, size_y = (float(value) for value in fields[1:7])
+        crs = ' '.join(field for field in [fields[0]] + fields[7:] if not re.match(r'^\w+\s*=', field))
+        
+        # Reference pixel coordinates are 1-based at the upper-left corner
+        return cls(
+            easting - (ref_x - 1) * size_x,
+            northing + (ref_y - 1) * size_y,
+            size_x,
+            size_y,
+            crs=crs
+        )
+    
+    def grid_origin(self) -> Tuple[int, int]:
+        """(row, col) of the cube's upper-left pixel on the global grid"""
+        row = -self.northing / self.pixel_height
+        col = self.easting / self.pixel_size
+        
+        if max(abs(row - round(row)), abs(col - round(col))) > 0.01:
+            logger.debug(f"Footprint is off the pixel grid by ({row - round(row):.3f}, {col - round(col):.3f}) pixels")
+        
+        return int(round(row)), int(round(col))
+    
+    def grid_key(self) -> Dict[str, Any]:
+        """What two footprints must share to use the same tiles"""
+        return {'pixel_size': self.pixel_size, 'pixel_height': self.pixel_height, 'crs': self.crs}
+
+
+class ScoreTileStore:
+    """
+    Directory of per-tile detector scores on a global pixel grid
+    
+    Each tile (tile_size x tile_size pixels of the global grid) holds the
+    float32 score channels of the cube window that covered it, with that
+    window and the checksum and mean spectrum of the pixels it was scored
+    from (the window and its RX halo). The store
+    also keeps the background model (statistics and MNF reduction) the
+    tiles were scored against, so later cubes are scored against the
+    same model and reused tiles stay comparable with recomputed ones.
+    
+    Tiles and background are invalidated together when the scoring
+    configuration (bands, detectors, reference spectrum) changes.
+    """
+    
+    def __init__(self, directory: str, tile_size: int = 256):
+        """
+        Args:
+            directory: Store directory (created if missing)
+            tile_size: Tile edge in pixels (fixed when the store is created)
+        """
+        self.directory = Path(directory)
+        self.tile_size = int(tile_size)
+        self.header: Dict[str, Any] = {}
+        
+        header_path = self.directory / 'store.json'
+        
+        if header_path.exists():
+            header = json.loads(header_path.read_text())
+            
+            if header.get('format') != STORE_FORMAT:
+                raise ValueError(f"{self.directory} is not a score tile store")
+            
+            if header.get('version') != STORE_VERSION:
+                raise ValueError(f"Unsupported score tile store version {header.get('version')} (expected {STORE_VERSION})")
+            
+            if header['tile_size'] != self.tile_size:
+                logger.info(f"Using the store's tile size {header['tile_size']} (requested {self.tile_size})")
+                self.tile_size = header['tile_size']
+            
+            self.header = header
+    
+    def __len__(self) -> int:
+        return len(list(self._tile_dir.glob('*.npz')))
+    
+    def bind(self, config_key: str, footprint: Footprint):
+        """
+        Attach the store to a scoring configuration and map grid
+        
+        A different configuration clears the tiles and the background
+        model; a different grid (pixel size / CRS) is an error.
+        """
+        grid = footprint.grid_key()
+        
+        if self.header:
+            if self.header['grid'] != grid:
+                raise ValueError(f"Footprint grid {grid} does not match the store's {self.header['grid']}")
+            
+            if self.header['config_key'] == config_key:
+                return
+            
+            logger.info("Scoring configuration changed; clearing score tiles")
+            self.clear()
+        
+        self.header = {
+            'format': STORE_FORMAT,
+            'version': STORE_VERSION,
+            'tile_size': self.tile_size,
+            'grid': grid,
+            'config_key': config_key
+        }
+        
+        self.directory.mkdir(parents=True, exist_ok=True)
+        (self.directory / 'store.json').write_text(json.dumps(self.header))
+    
+    def get(self, tile: Tuple[int, int]) -> Optional[Dict[str, Any]]:
+        """Stored tile {'window', 'checksum', 'mean', 'scores'} or None"""
+        path = self._tile_path(tile)
+        
+        if not path.exists():
+            return None
+        
+        try:
+            with np.load(path) as data:
+                return {
+                    'window': tuple(int(value) for value in data['window']),
+                    'checksum': str(data['checksum']),
+                    'mean': data['mean'],
+                    'scores': data['scores']
+                }
+        except Exception as e:
+            logger.warning(f"Failed to read score tile {path}: {str(e)}")
+            return None
+    
+    def put(
+        self,
+        tile: Tuple[int, int],
+        window: Tuple[int, int, int, int],
+        checksum: str,
+        mean: np.ndarray,
+        scores: np.ndarray
+    ):
+        """Store a tile's scores (window: global row0, col0, row1, col1)"""
+        self._tile_dir.mkdir(parents=True, exist_ok=True)
+        
+        np.savez(
+            self._tile_path(tile),
+            window=np.asarray(window, dtype=np.int64),
+            checksum=np.array(checksum),
+            mean=np.asarray(mean, dtype=np.float64),
+            scores=np.asarray(scores, dtype=np.float32)
+        )
+    
+    def load_background(self):
+        """(BackgroundStatistics, MNF reduction or None), or None if not stored yet"""
+        path = self.directory / 'background.npz'
+        
+        if not path.exists():
+            return None
+        
+        with np.load(path) as data:
+            background = BackgroundStatistics(data['mean'], data['cov'], int(data['nsamples']))
+            reduction = None
+            
+            if 'A' in data:
+                from spectral.algorithms.transforms import LinearTransform
+                
+                reduction = LinearTransform(
+                    data['A'],
+                    pre=data['pre'] if 'pre' in data else None,
+                    post=data['post'] if 'post' in data else None
+                )
+        
+        return background, reduction
+    
+    def save_background(self, background: BackgroundStatistics, reduction=None):
+        """Store the background model tiles are scored against"""
+        arrays = {'mean': background.mean, 'cov': background.cov, 'nsamples': np.array(background.nsamples)}
+        
+        if reduction is not None:
+            arrays['A'] = reduction._A
+            
+            for name in ('pre', 'post'):
+                value = getattr(reduction, f"_{name}", None)
+                if value is not None:
+                    arrays[name] = np.asarray(value)
+        
+        self.directory.mkdir(parents=True, exist_ok=True)
+        np.savez(self.directory / 'background.npz', **arrays)
+    
+    def clear(self):
+        """Remove every tile and the background model"""
+        for path in self._tile_dir.glob('*.npz'):
+            path.unlink()
+        
+        background = self.directory / 'background.npz'
+        if background.exists():
+            background.unlink()
+    
+    @staticmethod
+    def checksum(pixels: np.ndarray) -> str:
+        """Digest of a block of pixels and its shape (exact change detection)"""
+        digest = hashlib.blake2b(str(pixels.shape).encode(), digest_size=16)
+        digest.update(np.ascontiguousarray(pixels).tobytes())
+        return digest.hexdigest()
+    
+    # Private methods
+    
+    @property
+    def _tile_dir(self) -> Path:
+        return self.directory / 'tiles'
+    
+    def _tile_path(self, tile: Tuple[int, int]) -> Path:
+        return self._tile_dir / f"{tile[0]}_{tile[1]}.npz"
@@ -0,0 +1,173 @@
+"""
+Spatial Index for Bounding Boxes
+Uniform grid used to find overlapping detections without all-pairs scans
+"""
+
+import numpy as np
+from typing import Optional, Tuple
+
+
+class GridIndex:
+    """
+    Uniform grid over x1, y1, x2, y2 boxes
+    
+    Every box is registered in each grid cell it covers. Candidate pairs
+    are found by joining query cells against indexed cells, so the cost
+    grows with the number of overlapping pairs rather than n * m.
+    """
+    
+    def __init__(self, boxes: np.ndarray, cell_size: Optional[float] = None):
+        """
+        Args:
+            boxes: (n, 4) array of x1, y1, x2, y2
+            cell_size: Grid cell edge length (default: twice the median box extent)
+        """
+        self.boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        
+        if cell_size is None:
+            cell_size = self._default_cell_size(self.boxes)
+        
+        self.cell_size = float(cell_size)
+        
+        if len(self.boxes) > 0:
+            self.origin = self.boxes[:, :2].min(axis=0)
+        else:
+            self.origin = np.zeros(2)
+        
+        cell_ids, box_ids = self._expand_cells(self.boxes)
+        
+        order = np.argsort(cell_ids, kind='stable')
+        self._cell_ids = cell_ids[order]
+        self._box_ids = box_ids[order]
+    
+    def __len__(self) -> int:
+        return len(self.boxes)
+    
+    def query_pairs(self, query_boxes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find all (query, indexed) box pairs with a positive-area overlap
+        
+        Args:
+            query_boxes: (q, 4) array of x1, y1, x2, y2
+        
+        Returns:
+            (query_idx, box_idx) arrays, sorted by query then box index
+        """
+        query_boxes = np.asarray(query_boxes, dtype=np.float64).reshape(-1, 4)
+        empty = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+        
+        if len(query_boxes) == 0 or len(self.boxes) == 0:
+            return empty
+        
+        q_cells, q_ids = self._expand_cells(query_boxes)
+        
+        # Range of indexed entries sharing each query cell
+        lo = np.searchsorted(self._cell_ids, q_cells, side='left')
+        hi = np.searchsorted(self._cell_ids, q_cells, side='right')
+        counts = hi - lo
+        
+        if counts.sum() == 0:
+            return empty
+        
+        query_idx = np.repeat(q_ids, counts)
+        entry_idx = np.repeat(lo - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        box_idx = self._box_ids[entry_idx]
+        
+        # A pair sharing several cells is reported once (sort + mask; np.unique
+        # may pick a much slower hash path for large int64 inputs)
+        pair_keys = np.sort(query_idx * len(self.boxes) + box_idx)
+        pair_keys = pair_keys[np.concatenate([[True], pair_keys[1:] != pair_keys[:-1]])]
+        query_idx = pair_keys // len(self.boxes)
+        box_idx = pair_keys % len(self.boxes)
+        
+        # Cells only bound the search - keep true overlaps
+        a = query_boxes[query_idx]
+        b = self.boxes[box_idx]
+        overlaps = (
+            (np.minimum(a[:, 2], b[:, 2]) > np.maximum(a[:, 0], b[:, 0])) &
+            (np.minimum(a[:, 3], b[:, 3]) > np.maximum(a[:, 1], b[:, 1]))
+        )
+        
+        return query_idx[overlaps], box_idx[overlaps]
+    
+    # Private methods
+    
+    def _expand_cells(self, boxes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """List every (cell_id, box_idx) covered by the boxes"""
+        if len(boxes) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        
+        cells = np.floor((boxes - np.tile(self.origin, 2)) / self.cell_size).astype(np.int64)
+        cx0, cy0, cx1, cy1 = cells.T
+        
+        nx = cx1 - cx0 + 1
+        ny = cy1 - cy0 + 1
+        counts = nx * ny
+        
+        box_ids = np.repeat(np.arange(len(boxes)), counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        
+        cell_x = cx0[box_ids] + offsets % nx[box_ids]
+        cell_y = cy0[box_ids] + offsets // nx[box_ids]
+        
+        # Query boxes may fall left of / above the origin (negative cells)
+        cell_ids = self._pair_key(cell_x, cell_y)
+        
+        return cell_ids, box_ids
+    
+    @staticmethod
+    def _pair_key(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        """Map integer cell coordinates to a single int64 key"""
+        # Zigzag to non-negative, then combine with a fixed stride
+        zx = np.where(x >= 0, 2 * x, -2 * x - 1)
+        zy = np.where(y >= 0, 2 * y, -2 * y - 1)
+        return zx * (1 << 31) + zy
+    
+    @staticmethod
+    def _default_cell_size(boxes: np.ndarray) -> float:
+        """Twice the median box extent, so a typical box covers few cells"""
+        if len(boxes) == 0:
+            return 1.0
+        
+        extents = np.maximum(boxes[:, 2] - boxes[:, 0], boxes[:, 3] - boxes[:, 1])
+        return float(max(2.0 * np.median(extents), 1.0))
+
+
+def box_iou_matrix(boxes1: np.ndarray, boxes2: np.ndarray) -> np.ndarray:
+    """
+    Pairwise Intersection over Union between two box arrays
+    
+    Args:
+        boxes1: (n, 4) array of x1, y1, x2, y2
+        boxes2: (m, 4) array of x1, y1, x2, y2
+    
+    Returns:
+        (n, m) IoU matrix
+    """
+    x_inter_min = np.maximum(boxes1[:, None, 0], boxes2[None, :, 0])
+    y_inter_min = np.maximum(boxes1[:, None, 1], boxes2[None, :, 1])
+    x_inter_max = np.minimum(boxes1[:, None, 2], boxes2[None, :, 2])
+    y_inter_max = np.minimum(boxes1[:, None, 3], boxes2[None, :, 3])
+    
+    inter_area = (
+        np.clip(x_inter_max - x_inter_min, 0, None) *
+        np.clip(y_inter_max - y_inter_min, 0, None)
+    )
+    
+    area1 = (boxes1[:, 2] - boxes1[:, 0]) * (boxes1[:, 3] - boxes1[:, 1])
+    area2 = (boxes2[:, 2] - boxes2[:, 0]) * (boxes2[:, 3] - boxes2[:, 1])
+    
+    return inter_area / (area1[:, None] + area2[None, :] - inter_area + 1e-10)
+
+
+def box_iou_pairs(boxes1: np.ndarray, boxes2: np.ndarray) -> np.ndarray:
+    """Element-wise IoU between row-aligned (k, 4) box arrays (same values as box_iou_matrix)"""
+    inter_area = (
+        np.clip(np.minimum(boxes1[:, 2], boxes2[:, 2]) - np.maximum(boxes1[:, 0], boxes2[:, 0]), 0, None) *
+        np.clip(np.minimum(boxes1[:, 3], boxes2[:, 3]) - np.maximum(boxes1[:, 1], boxes2[:, 1]), 0, None)
+    )
+    
+    area1 = (boxes1[:, 2] - boxes1[:, 0]) * (boxes1[:, 3] - boxes1[:, 1])
+    area2 = (boxes2[:, 2] - boxes2[:, 0]) * (boxes2[:, 3] - boxes2[:, 1])
+    
+    return inter_area / (area1 + area2 - inter_area + 1e-10)
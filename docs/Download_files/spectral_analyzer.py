@@ -5,13 +5,33 @@ Handles all hyperspectral image processing for pipeline leak detection
 
 import spectral as spy
 import numpy as np
-from typing import Dict, List, Tuple, Optional, Any
+from typing import Dict, List, Tuple, Optional, Any, Union
 import logging
 from pathlib import Path
 import json
+import os
+import time
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+
+from models.detection_batch import DetectionBatch
+from models.background_stats import BackgroundStatistics
+from models.local_rx import IntegralLocalRX
+from models.band_lookup import BandLookup
+from models.spectral_indices import SpectralIndexEngine, DEFAULT_INDICES
+from models.mnf_cache import MNFTransformCache
+from models.reference_library import ReferenceLibrary
+from models.memory_report import MemoryReport
+from models.result_projection import ResultProjection
+from models.spectral_streaming import StreamingSpectralAnalysis
+from models.spectral_incremental import IncrementalSpectralAnalysis
+from models.score_tiles import Footprint, ScoreTileStore
 
 logger = logging.getLogger(__name__)
 
+# Working precision modes -> score map / cube dtype
+PRECISIONS = {'float64': np.float64, 'float32': np.float32}
+
 
 class SpectralAnalyzer:
     """
@@ -21,7 +41,9 @@ class SpectralAnalyzer:
     
     def __init__(self):
         self.initialized = False
+        self.reference_library = None
         self.reference_spectra = {}
+        self._library_cache = None
         
         # Key wavelength bands for water detection (in nanometers)
         self.water_bands = {
@@ -31,24 +53,83 @@ class SpectralAnalyzer:
             'swir2': 1940
         }
         
+        # Reference spectrum -> defect category (closest spectral angle)
+        self.defect_types = {
+            'water_leak': 'leak',
+            'corroded_pipe': 'corrosion',
+            'healthy_pipe': 'none',
+            'vegetation': 'vegetation_interference',
+            'concrete': 'surface_material'
+        }
+        
         # Detection thresholds
         self.rx_threshold_percentile = 99  # Top 1% as anomalies
+        self.mf_threshold_percentile = 95  # Top 5% matched filter responses
         self.ndwi_leak_threshold = 0.3
         self.ace_confidence_threshold = 0.7
         
-    def initialize(self):
-        """Load reference spectral signatures"""
+        # RX local window (inner, outer) in pixels
+        self.rx_window = (3, 25)
+        
+        # RX engine: 'spy' (spy.rx, per-pixel window statistics) or
+        # 'integral' (summed-area tables, cost independent of window size)
+        self.rx_engine = 'spy'
+        
+        # Estimate a covariance per window (False: shared background
+        # covariance, only the local mean is estimated)
+        self.rx_local_covariance = False
+        
+        # Sensor band table (set_sensor_header); None uses the image
+        # metadata wavelengths or assumes evenly spaced 400-2500 nm bands
+        self.band_lookup = None
+        
+        # Band-ratio indices from calculate_indices: name -> (kind, nm, nm)
+        # with kind 'nd' or 'ratio'; analyze needs 'ndwi' and 'ndvi'.
+        # Add e.g. spectral_indices.MOISTURE_INDICES for MNDWI / NDMI.
+        self.spectral_indices = dict(DEFAULT_INDICES)
+        
+        # Fitted MNF transforms reused across cubes (enable_mnf_cache);
+        # keyed by sensor_id and band count. None refits every cube.
+        self.mnf_cache = None
+        self.sensor_id = 'default'
+        
+        # Working precision: 'float64' (SPy detectors) or 'float32' (cube
+        # and score maps kept in float32, detectors evaluated block-wise)
+        self.precision = 'float64'
+        
+        # Record per-stage heap memory in analysis_metadata['memory']
+        self.track_memory = False
+        
+        # Run NDWI/NDVI, RX, ACE and MF concurrently on a thread pool
+        # (NumPy/BLAS release the GIL); BLAS threads per detector default
+        # to cpu_count // detector_workers to avoid oversubscription
+        self.concurrent_detectors = False
+        self.detector_workers = 4
+        self.blas_threads_per_detector = None
+        
+        # Maps analyze returns (ResultProjection); None returns every map
+        # at full resolution. ResultProjection.compact() returns none.
+        self.result_projection = None
+    
+    def initialize(self, library_path: Optional[str] = None):
+        """
+        Load reference spectral signatures
+        
+        Args:
+            library_path: Reference library saved with ReferenceLibrary.save
+                          (must include 'water_leak'); default: built-in
+                          synthetic signatures
+        """
         try:
             logger.info("Initializing Spectral Analyzer")
             
             # Load reference spectra for different materials/conditions
-            self.reference_spectra = {
-                'water_leak': self._create_water_signature(),
-                'healthy_pipe': self._create_healthy_pipe_signature(),
-                'corroded_pipe': self._create_corrosion_signature(),
-                'vegetation': self._create_vegetation_signature(),
-                'concrete': self._create_concrete_signature()
-            }
+            if library_path:
+                self.reference_library = ReferenceLibrary.load(library_path)
+            else:
+                self.reference_library = ReferenceLibrary.builtin()
+            
+            self.reference_spectra = self._sensor_reference_spectra()
             
             self.initialized = True
             logger.info("Spectral Analyzer initialized successfully")
@@ -61,63 +142,129 @@ class SpectralAnalyzer:
         """Check if analyzer is ready"""
         return self.initialized
     
-    def analyze(self, hyperspectral_image: np.ndarray) -> Dict[str, Any]:
+    @property
+    def dtype(self):
+        """Score map dtype for the configured precision"""
+        if self.precision not in PRECISIONS:
+            raise ValueError(f"Unknown precision '{self.precision}'. Choose from {list(PRECISIONS)}")
+        
+        return PRECISIONS[self.precision]
+    
+    def analyze(
+        self,
+        hyperspectral_image: np.ndarray,
+        as_batch: bool = False,
+        projection: Optional[ResultProjection] = None
+    ) -> Dict[str, Any]:
         """
         Main analysis function - runs all spectral detection algorithms
         
         Args:
             hyperspectral_image: 3D numpy array (rows, cols, bands)
+            as_batch: Return leak candidates/details as columnar DetectionBatch
+            projection: Maps to return and their form
+                        (default: self.result_projection, or all maps)
             
         Returns:
-            Dictionary with analysis results
+            Dictionary with analysis results; maps not in the projection are None
         """
+        projection = projection or self.result_projection or ResultProjection()
+        
+        # NDWI drives leak detection; NDVI is only computed when returned
+        index_names = ['ndwi'] + (['ndvi'] if projection.wants('ndvi') else [])
+        indices_needed = {name: self.spectral_indices[name] for name in index_names}
+        
+        memory = MemoryReport(enabled=self.track_memory)
+        memory.start()
+        
         try:
             logger.info(f"Analyzing hyperspectral image: shape {hyperspectral_image.shape}")
             
-            # 1. Calculate spectral indices
-            ndwi = self.calculate_ndwi(hyperspectral_image)
-            ndvi = self.calculate_ndvi(hyperspectral_image)
-            
-            # 2. Run anomaly detection
-            rx_scores = self.detect_anomalies_rx(hyperspectral_image)
+            if self.precision == 'float32':
+                hyperspectral_image = np.asarray(hyperspectral_image, dtype=np.float32)
             
-            # 3. Run target detection
-            ace_scores = self.detect_water_ace(hyperspectral_image)
-            mf_scores = self.matched_filter_water(hyperspectral_image)
+            timings = {}
             
-            # 4. Identify leak candidates
-            leak_candidates = self.identify_leaks(
-                ndwi, rx_scores, ace_scores, mf_scores
-            )
+            if self.concurrent_detectors:
+                # 1-4. Indices, background, RX, ACE and MF on a thread pool
+                with memory.stage('detectors'):
+                    indices, background, (rx_scores, ace_scores, mf_scores) = self._run_detectors_concurrently(
+                        hyperspectral_image, timings, indices_needed
+                    )
+                    ndwi, ndvi = indices['ndwi'], indices.get('ndvi')
+            else:
+                # 1. Calculate spectral indices (one band gather)
+                with memory.stage('indices'):
+                    indices = self._timed(timings, 'indices', self.calculate_indices, hyperspectral_image, indices_needed)
+                    ndwi, ndvi = indices['ndwi'], indices.get('ndvi')
+                
+                # 2. Estimate background statistics once (shared by RX, ACE and MF)
+                with memory.stage('background'):
+                    background = self._timed(timings, 'background', self.estimate_background, hyperspectral_image)
+                
+                # 3. Run anomaly detection
+                with memory.stage('rx'):
+                    rx_scores = self._timed(timings, 'rx', self.detect_anomalies_rx, hyperspectral_image, background)
+                
+                # 4. Run target detection
+                with memory.stage('ace'):
+                    ace_scores = self._timed(timings, 'ace', self.detect_water_ace, hyperspectral_image, background)
+                
+                with memory.stage('matched_filter'):
+                    mf_scores = self._timed(timings, 'matched_filter', self.matched_filter_water, hyperspectral_image, background)
             
-            # 5. Extract spectral signatures for each candidate
-            leak_details = self.extract_leak_details(
-                hyperspectral_image,
-                leak_candidates
-            )
+            # 5. Identify leak candidates
+            with memory.stage('leaks'):
+                leak_candidates = self.identify_leaks(
+                    ndwi, rx_scores, ace_scores, mf_scores,
+                    as_batch=as_batch
+                )
+                
+                # 6. Extract spectral signatures for each candidate
+                leak_details = self.extract_leak_details(
+                    hyperspectral_image,
+                    leak_candidates
+                )
             
-            # 6. Calculate confidence scores
-            confidence_map = self.calculate_confidence_map(
-                ndwi, rx_scores, ace_scores, mf_scores
-            )
+            # 7. Calculate confidence scores (only if returned)
+            confidence_map = None
+            if projection.wants('confidence_map'):
+                with memory.stage('confidence'):
+                    confidence_map = self.calculate_confidence_map(
+                        ndwi, rx_scores, ace_scores, mf_scores
+                    )
             
             results = {
-                'ndwi': ndwi,
-                'ndvi': ndvi,
-                'rx_scores': rx_scores,
-                'ace_scores': ace_scores,
-                'mf_scores': mf_scores,
                 'leak_candidates': leak_candidates,
                 'leak_details': leak_details,
-                'confidence_map': confidence_map,
                 'num_leaks': len(leak_candidates),
                 'analysis_metadata': {
                     'shape': hyperspectral_image.shape,
                     'num_bands': hyperspectral_image.shape[2],
-                    'rx_threshold': np.percentile(rx_scores, self.rx_threshold_percentile)
+                    'rx_threshold': np.percentile(rx_scores, self.rx_threshold_percentile),
+                    'precision': self.precision,
+                    'projection': projection.as_dict(),
+                    'timings': timings
                 }
             }
             
+            # 8. Keep only the requested maps, in the requested form
+            with memory.stage('projection'):
+                maps = {
+                    'ndwi': ndwi,
+                    'ndvi': ndvi,
+                    'rx_scores': rx_scores,
+                    'ace_scores': ace_scores,
+                    'mf_scores': mf_scores,
+                    'confidence_map': confidence_map
+                }
+                
+                for name, array in maps.items():
+                    results[name] = projection.project(name, array)
+            
+            if self.track_memory:
+                results['analysis_metadata']['memory'] = memory.as_dict()
+            
             logger.info(f"Analysis complete: {len(leak_candidates)} potential leaks detected")
             
             return results
@@ -125,6 +272,193 @@ class SpectralAnalyzer:
         except Exception as e:
             logger.error(f"Spectral analysis failed: {str(e)}", exc_info=True)
             raise
+        
+        finally:
+            memory.stop()
+    
+    def analyze_file(
+        self,
+        image_path: str,
+        block_rows: int = 256,
+        map_downsample: Optional[int] = None,
+        as_batch: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Out-of-core version of analyze for cubes larger than memory
+        
+        The cube is memory-mapped and streamed in blocks of block_rows rows;
+        per-pixel scores are spilled to a scratch file on disk.
+        
+        Args:
+            image_path: Image file readable by spy.open_image (e.g. ENVI .hdr)
+            block_rows: Image rows per block
+            map_downsample: Return score maps strided by this factor
+                            (None returns no maps)
+            as_batch: Return leak candidates/details as columnar DetectionBatch
+        
+        Returns:
+            Dictionary with the same keys as analyze
+        """
+        try:
+            streaming = StreamingSpectralAnalysis(
+                self,
+                block_rows=block_rows,
+                map_downsample=map_downsample
+            )
+            
+            return streaming.run(image_path, as_batch=as_batch)
+        
+        except Exception as e:
+            logger.error(f"Streaming spectral analysis failed: {str(e)}", exc_info=True)
+            raise
+    
+    def analyze_incremental(
+        self,
+        image_path: str,
+        tile_store: Union[ScoreTileStore, str],
+        footprint: Optional[Footprint] = None,
+        change_detection: str = 'checksum',
+        drift_tolerance: float = 0.01,
+        as_batch: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Re-analysis of a cube overlapping earlier surveys
+        
+        Score tiles whose pixels and RX halo are unchanged (same checksum,
+        or mean spectrum within drift_tolerance) are taken from tile_store;
+        only new or changed tiles are scored and stored. Leak candidates are
+        found on the assembled scores and stitched across tiles.
+        
+        Args:
+            image_path: Image file readable by spy.open_image (e.g. ENVI .hdr)
+            tile_store: ScoreTileStore or its directory
+            footprint: Map position of the cube (default: ENVI 'map info')
+            change_detection: 'checksum' or 'mean_drift'
+            drift_tolerance: Relative mean-spectrum change tolerated in 'mean_drift' mode
+            as_batch: Return leak candidates/details as columnar DetectionBatch
+        
+        Returns:
+            Dictionary with the same keys as analyze (score maps are None)
+        """
+        try:
+            if not isinstance(tile_store, ScoreTileStore):
+                tile_store = ScoreTileStore(tile_store)
+            
+            incremental = IncrementalSpectralAnalysis(
+                self,
+                tile_store,
+                change_detection=change_detection,
+                drift_tolerance=drift_tolerance
+            )
+            
+            return incremental.run(image_path, footprint=footprint, as_batch=as_batch)
+        
+        except Exception as e:
+            logger.error(f"Incremental spectral analysis failed: {str(e)}", exc_info=True)
+            raise
+    
+    def estimate_background(self, img: np.ndarray) -> BackgroundStatistics:
+        """
+        Background mean, covariance, inverse covariance and Cholesky factor
+        
+        Computed once per cube and passed to detect_anomalies_rx,
+        detect_water_ace and matched_filter_water.
+        """
+        try:
+            background = BackgroundStatistics.from_image(img)
+            
+            logger.debug(f"Background statistics estimated from {background.nsamples} pixels")
+            
+            return background
+        
+        except Exception as e:
+            logger.error(f"Background estimation failed: {str(e)}")
+            raise
+    
+    def set_sensor_header(self, header_path: str):
+        """Use the band wavelengths of an ENVI header for all band lookups"""
+        self.band_lookup = BandLookup.from_header(header_path)
+        
+        if self.band_lookup is None:
+            logger.warning(f"No wavelengths in {header_path}; assuming 400-2500 nm bands")
+        
+        if self.reference_library is not None:
+            self.reference_spectra = self._sensor_reference_spectra()
+    
+    def clear_sensor_header(self):
+        """Drop the header set with set_sensor_header (default band positions, library references)"""
+        self.band_lookup = None
+        
+        if self.reference_library is not None:
+            self.reference_spectra = self._sensor_reference_spectra()
+    
+    def enable_mnf_cache(
+        self,
+        max_entries: int = 8,
+        staleness_tolerance: Optional[float] = None,
+        preload_dir: Optional[str] = None
+    ) -> MNFTransformCache:
+        """
+        Reuse fitted MNF transforms for cubes from the same sensor
+        
+        Args:
+            max_entries: Transforms kept (least recently used evicted)
+            staleness_tolerance: Refit when the noise covariance changes by
+                                 more than this relative amount (None: never;
+                                 cached cubes then skip noise estimation)
+            preload_dir: Directory of transforms saved with mnf_cache.save()
+        """
+        self.mnf_cache = MNFTransformCache(max_entries, staleness_tolerance)
+        
+        if preload_dir:
+            self.mnf_cache.preload(preload_dir)
+        
+        return self.mnf_cache
+    
+    def calculate_index_stack(
+        self,
+        img: np.ndarray,
+        indices: Optional[Dict[str, Tuple[str, float, float]]] = None,
+        bands: Optional[BandLookup] = None
+    ) -> np.ndarray:
+        """
+        Evaluate band-ratio indices in one pass
+        
+        Each band the indices need is gathered from the cube and cast
+        once; all indices are written into one preallocated stack.
+        
+        Args:
+            img: (rows, cols, bands) cube
+            indices: name -> (kind, wavelength a, wavelength b), kind 'nd'
+                     ((a - b) / (a + b)) or 'ratio' (a / b)
+                     (default: self.spectral_indices)
+            bands: Band table (default: from the image / sensor header)
+        
+        Returns:
+            (num_indices, rows, cols) float32 stack in indices order
+        """
+        try:
+            engine = SpectralIndexEngine(self.spectral_indices if indices is None else indices)
+            
+            return engine(img, bands or self._bands(img))
+        
+        except Exception as e:
+            logger.error(f"Spectral index calculation failed: {str(e)}")
+            raise
+    
+    def calculate_indices(
+        self,
+        img: np.ndarray,
+        indices: Optional[Dict[str, Tuple[str, float, float]]] = None,
+        bands: Optional[BandLookup] = None
+    ) -> Dict[str, np.ndarray]:
+        """
+        calculate_index_stack as a name -> map dict (views into the stack)
+        """
+        indices = self.spectral_indices if indices is None else indices
+        stack = self.calculate_index_stack(img, indices, bands)
+        
+        return dict(zip(indices, stack))
     
     def calculate_ndwi(self, img: np.ndarray) -> np.ndarray:
         """
@@ -171,25 +505,30 @@ class SpectralAnalyzer:
             logger.error(f"NDVI calculation failed: {str(e)}")
             raise
     
-    def detect_anomalies_rx(self, img: np.ndarray) -> np.ndarray:
+    def detect_anomalies_rx(
+        self,
+        img: np.ndarray,
+        background: Optional[BackgroundStatistics] = None
+    ) -> np.ndarray:
         """
         RX Anomaly Detector - finds spectrally unusual pixels
         Perfect for detecting leaks that differ from background
         
-        Uses SPy's built-in RX detector with local statistics
+        Uses SPy's built-in RX detector with a local window mean and the
+        shared background covariance (projected into MNF space), or the
+        integral-image engine when rx_engine is 'integral'
         """
+        if background is None:
+            background = self.estimate_background(img)
+        
         try:
             logger.info("Running RX anomaly detection")
             
             # Apply noise reduction first (MNF transform)
-            reduced_img = self._reduce_noise_mnf(img)
+            reduced_img, reduced_background = self._reduce_noise_mnf(img, background)
             
             # Run RX with local window
-            rx_scores = spy.rx(
-                reduced_img,
-                window_inner=3,   # Pixel neighborhood size
-                window_outer=25   # Background window size
-            )
+            rx_scores = self._local_rx(reduced_img, reduced_background).astype(self.dtype, copy=False)
             
             logger.info(f"RX detection complete: mean={np.mean(rx_scores):.3f}")
             
@@ -198,9 +537,13 @@ class SpectralAnalyzer:
         except Exception as e:
             logger.error(f"RX detection failed: {str(e)}")
             # Fallback to simpler method if SPy fails
-            return self._simple_anomaly_detection(img)
+            return self._simple_anomaly_detection(img, background).astype(self.dtype, copy=False)
     
-    def detect_water_ace(self, img: np.ndarray) -> np.ndarray:
+    def detect_water_ace(
+        self,
+        img: np.ndarray,
+        background: Optional[BackgroundStatistics] = None
+    ) -> np.ndarray:
         """
         Adaptive Coherence/Cosine Estimator (ACE) for water detection
         More robust than matched filter in varying backgrounds
@@ -210,19 +553,39 @@ class SpectralAnalyzer:
             
             water_signature = self.reference_spectra['water_leak']
             
-            # Run ACE detector
-            ace_scores = spy.ace(img, water_signature)
+            if background is None:
+                background = self.estimate_background(img)
+            
+            if self.precision == 'float32':
+                # ACE = (x^T C^-1 d)^2 / (d^T C^-1 d * x^T C^-1 x), block-wise
+                projection, target_norm, distance = background.target_projection(
+                    img, water_signature, dtype=np.float32, with_distance=True
+                )
+                
+                ace_scores = projection
+                ace_scores *= projection
+                distance *= np.float32(target_norm)
+                ace_scores /= distance
+                ace_scores = np.clip(np.nan_to_num(ace_scores, copy=False), 0, 1, out=ace_scores)
+            else:
+                # Run ACE detector
+                ace_scores = spy.ace(img, water_signature, background=background.gaussian_stats)
             
             logger.info(f"ACE detection complete: max={np.max(ace_scores):.3f}")
             
-            return ace_scores
+            # SPy squeezes single-row images to (cols,)
+            return ace_scores.reshape(img.shape[:2])
             
         except Exception as e:
             logger.error(f"ACE detection failed: {str(e)}")
             # Return zeros if fails
             return np.zeros((img.shape[0], img.shape[1]))
     
-    def matched_filter_water(self, img: np.ndarray) -> np.ndarray:
+    def matched_filter_water(
+        self,
+        img: np.ndarray,
+        background: Optional[BackgroundStatistics] = None
+    ) -> np.ndarray:
         """
         Matched Filter detector for water targets
         Linear detector using background covariance
@@ -232,16 +595,27 @@ class SpectralAnalyzer:
             
             water_signature = self.reference_spectra['water_leak']
             
-            # Run matched filter
-            mf_scores = spy.matched_filter(
-                img,
-                water_signature,
-                background=None  # Uses global covariance
-            )
+            if background is None:
+                background = self.estimate_background(img)
+            
+            if self.precision == 'float32':
+                # MF = x^T C^-1 d / (d^T C^-1 d), block-wise
+                projection, target_norm = background.target_projection(img, water_signature, dtype=np.float32)
+                
+                mf_scores = projection
+                mf_scores /= np.float32(target_norm)
+            else:
+                # Run matched filter
+                mf_scores = spy.matched_filter(
+                    img,
+                    water_signature,
+                    background=background.gaussian_stats  # Shared global covariance
+                )
             
             logger.info(f"Matched Filter complete: max={np.max(mf_scores):.3f}")
             
-            return mf_scores
+            # SPy squeezes single-row images to (cols,)
+            return mf_scores.reshape(img.shape[:2])
             
         except Exception as e:
             logger.error(f"Matched Filter failed: {str(e)}")
@@ -252,31 +626,24 @@ class SpectralAnalyzer:
         ndwi: np.ndarray,
         rx_scores: np.ndarray,
         ace_scores: np.ndarray,
-        mf_scores: np.ndarray
-    ) -> List[Dict[str, Any]]:
+        mf_scores: np.ndarray,
+        as_batch: bool = False
+    ) -> Union[List[Dict[str, Any]], DetectionBatch]:
         """
         Combine all detection methods to identify leak locations
         
         Returns list of leak candidates with coordinates and scores
+        (or a DetectionBatch with score columns when as_batch is set)
         """
         try:
             # Create combined detection mask
             height, width = ndwi.shape
             
-            # Threshold each method
-            rx_threshold = np.percentile(rx_scores, self.rx_threshold_percentile)
-            rx_mask = rx_scores > rx_threshold
-            
-            ndwi_mask = ndwi > self.ndwi_leak_threshold
-            ace_mask = ace_scores > self.ace_confidence_threshold
-            mf_mask = mf_scores > np.percentile(mf_scores, 95)
-            
-            # Combine masks (at least 2 methods must agree)
-            vote_map = (
-                rx_mask.astype(int) +
-                ndwi_mask.astype(int) +
-                ace_mask.astype(int) +
-                mf_mask.astype(int)
+            # Threshold each method and combine (at least 2 methods must agree)
+            vote_map = self._vote_map(
+                ndwi, rx_scores, ace_scores, mf_scores,
+                rx_threshold=np.percentile(rx_scores, self.rx_threshold_percentile),
+                mf_threshold=np.percentile(mf_scores, self.mf_threshold_percentile)
             )
             
             leak_mask = vote_map >= 2
@@ -285,94 +652,94 @@ class SpectralAnalyzer:
             from scipy import ndimage
             labeled, num_features = ndimage.label(leak_mask)
             
-            leak_candidates = []
+            # Region properties from label-indexed reductions (one pass
+            # per property instead of a full-image mask per region)
+            index = np.arange(1, num_features + 1)
+            flat_labels = labeled.ravel()
+            ys, xs = np.indices(labeled.shape)
             
-            for i in range(1, num_features + 1):
-                # Get region properties
-                region_mask = labeled == i
-                region_coords = np.where(region_mask)
-                
-                if len(region_coords[0]) < 5:  # Skip tiny regions
-                    continue
-                
-                # Calculate centroid
-                centroid_y = int(np.mean(region_coords[0]))
-                centroid_x = int(np.mean(region_coords[1]))
-                
-                # Calculate bounding box
-                min_y, max_y = region_coords[0].min(), region_coords[0].max()
-                min_x, max_x = region_coords[1].min(), region_coords[1].max()
-                
-                # Extract scores for this region
-                region_scores = {
-                    'rx_mean': float(np.mean(rx_scores[region_mask])),
-                    'ndwi_mean': float(np.mean(ndwi[region_mask])),
-                    'ace_mean': float(np.mean(ace_scores[region_mask])),
-                    'mf_mean': float(np.mean(mf_scores[region_mask]))
-                }
-                
-                # Combined confidence
-                combined_confidence = (
-                    region_scores['rx_mean'] * 0.25 +
-                    region_scores['ace_mean'] * 0.35 +
-                    region_scores['mf_mean'] * 0.25 +
-                    (region_scores['ndwi_mean'] - self.ndwi_leak_threshold) * 0.15
-                )
-                
-                leak_candidates.append({
-                    'id': f"spectral_leak_{i}",
-                    'centroid': [centroid_x, centroid_y],
-                    'bbox': [min_x, min_y, max_x, max_y],
-                    'area_pixels': int(np.sum(region_mask)),
-                    'scores': region_scores,
-                    'combined_confidence': float(combined_confidence),
-                    'detection_methods': int(vote_map[centroid_y, centroid_x])
-                })
+            counts = np.bincount(flat_labels, minlength=num_features + 1)[1:]
+            sum_y = np.bincount(flat_labels, weights=ys.ravel(), minlength=num_features + 1)[1:]
+            sum_x = np.bincount(flat_labels, weights=xs.ravel(), minlength=num_features + 1)[1:]
+            
+            region_scores = np.stack([
+                ndimage.mean(rx_scores, labeled, index),
+                ndimage.mean(ndwi, labeled, index),
+                ndimage.mean(ace_scores, labeled, index),
+                ndimage.mean(mf_scores, labeled, index)
+            ], axis=1).reshape(-1, 4)
+            
+            slices = ndimage.find_objects(labeled)
+            
+            # Skip tiny regions
+            keep = np.flatnonzero(counts >= 5)
+            
+            labels = index[keep]
+            areas = counts[keep]
+            
+            # Calculate centroids and bounding boxes
+            centroids = np.stack([sum_x[keep] / areas, sum_y[keep] / areas], axis=1).astype(np.int64)
+            bboxes = np.array(
+                [[slices[k][1].start, slices[k][0].start, slices[k][1].stop - 1, slices[k][0].stop - 1] for k in keep],
+                dtype=np.int64
+            ).reshape(-1, 4)
+            
+            score_means = region_scores[keep]
+            methods = vote_map[centroids[:, 1], centroids[:, 0]]
+            
+            # Combined confidence
+            confidences = self._combined_confidence(*score_means.T)
+            
+            leak_candidates = self._leak_batch(
+                labels, bboxes, centroids, areas,
+                score_means, methods, confidences,
+                image_shape=(height, width)
+            )
             
             logger.info(f"Identified {len(leak_candidates)} leak candidates")
             
-            return leak_candidates
+            return leak_candidates if as_batch else self._leaks_to_dicts(leak_candidates)
             
         except Exception as e:
             logger.error(f"Leak identification failed: {str(e)}")
-            return []
+            return DetectionBatch.empty(source='spectral') if as_batch else []
     
     def extract_leak_details(
         self,
         img: np.ndarray,
-        leak_candidates: List[Dict[str, Any]]
-    ) -> List[Dict[str, Any]]:
+        leak_candidates: Union[List[Dict[str, Any]], DetectionBatch]
+    ) -> Union[List[Dict[str, Any]], DetectionBatch]:
         """
         Extract detailed spectral information for each leak candidate
         """
+        if isinstance(leak_candidates, DetectionBatch):
+            return self._extract_batch_details(img, leak_candidates)
+        
+        mean_spectra, failed = self._roi_mean_spectra(
+            img,
+            [candidate['bbox'] for candidate in leak_candidates]
+        )
+        
+        # Classify all candidates at once (batched spectral angles)
+        defect_types, water_angles = self._classify_spectra(mean_spectra)
+        
         detailed_leaks = []
         
-        for candidate in leak_candidates:
+        for i, candidate in enumerate(leak_candidates):
+            if failed[i]:
+                detailed_leaks.append(candidate)
+                continue
+            
             try:
-                # Extract ROI
-                bbox = candidate['bbox']
-                roi = img[bbox[1]:bbox[3], bbox[0]:bbox[2], :]
-                
-                # Calculate mean spectrum
-                mean_spectrum = np.mean(roi, axis=(0, 1))
-                
-                # Classify defect type based on spectral signature
-                defect_type = self._classify_defect_type(mean_spectrum)
-                
                 # Calculate severity
                 severity = self._calculate_severity(candidate['scores'])
                 
                 detailed_leaks.append({
                     **candidate,
-                    'mean_spectrum': mean_spectrum.tolist(),
-                    'defect_type': defect_type,
+                    'mean_spectrum': mean_spectra[i].tolist(),
+                    'defect_type': defect_types[i],
                     'severity': severity,
-                    'spectral_angle_to_water': float(
-                        self._spectral_angle(
-                            mean_spectrum,
-                            self.reference_spectra['water_leak']
-                        )
-                    )
+                    'spectral_angle_to_water': float(water_angles[i])
                 })
                 
             except Exception as e:
@@ -386,24 +753,40 @@ class SpectralAnalyzer:
         ndwi: np.ndarray,
         rx_scores: np.ndarray,
         ace_scores: np.ndarray,
-        mf_scores: np.ndarray
+        mf_scores: np.ndarray,
+        rx_range: Optional[Tuple[float, float]] = None,
+        mf_range: Optional[Tuple[float, float]] = None
     ) -> np.ndarray:
         """
         Create a combined confidence map
+        
+        rx_range / mf_range give the (min, max) used for normalization when
+        the maps are only part of the scene (streamed blocks)
         """
-        # Normalize all scores to 0-1
-        rx_norm = (rx_scores - rx_scores.min()) / (rx_scores.max() - rx_scores.min() + 1e-10)
-        ndwi_norm = np.clip((ndwi + 1) / 2, 0, 1)  # NDWI is -1 to 1
-        ace_norm = np.clip(ace_scores, 0, 1)
-        mf_norm = (mf_scores - mf_scores.min()) / (mf_scores.max() - mf_scores.min() + 1e-10)
-        
-        # Weighted combination
-        confidence_map = (
-            rx_norm * 0.25 +
-            ndwi_norm * 0.15 +
-            ace_norm * 0.35 +
-            mf_norm * 0.25
-        )
+        rx_min, rx_max = rx_range or (rx_scores.min(), rx_scores.max())
+        mf_min, mf_max = mf_range or (mf_scores.min(), mf_scores.max())
+        
+        # Normalize all scores to 0-1 and combine (weighted) in place:
+        # one output map and one scratch map instead of a map per term
+        confidence_map = np.empty(ndwi.shape, dtype=self.dtype)
+        term = np.empty(ndwi.shape, dtype=self.dtype)
+        
+        np.subtract(rx_scores, rx_min, out=confidence_map)
+        confidence_map *= 0.25 / (rx_max - rx_min + 1e-10)
+        
+        np.add(ndwi, 1, out=term)  # NDWI is -1 to 1
+        term /= 2
+        np.clip(term, 0, 1, out=term)
+        term *= 0.15
+        confidence_map += term
+        
+        np.clip(ace_scores, 0, 1, out=term)
+        term *= 0.35
+        confidence_map += term
+        
+        np.subtract(mf_scores, mf_min, out=term)
+        term *= 0.25 / (mf_max - mf_min + 1e-10)
+        confidence_map += term
         
         return confidence_map
     
@@ -445,63 +828,413 @@ class SpectralAnalyzer:
     
     # Helper methods
     
-    def _reduce_noise_mnf(self, img: np.ndarray) -> np.ndarray:
-        """Apply Minimum Noise Fraction transform"""
-        try:
-            # Estimate noise from homogeneous region
-            # Use center region as assumed relatively homogeneous
-            h, w = img.shape[0], img.shape[1]
-            noise_region = img[h//4:3*h//4, w//4:3*w//4, :]
+    def _extract_batch_details(
+        self,
+        img: np.ndarray,
+        leak_candidates: DetectionBatch
+    ) -> DetectionBatch:
+        """Columnar version of extract_leak_details"""
+        n = len(leak_candidates)
+        columns = leak_candidates.columns
+        
+        mean_spectra, failed = self._roi_mean_spectra(img, leak_candidates.bbox.astype(np.int64))
+        defect_types, water_angles = self._classify_spectra(mean_spectra)
+        
+        severities = np.zeros(n, dtype=np.int64)
+        
+        for i in range(n):
+            try:
+                severities[i] = self._calculate_severity({
+                    'rx_mean': columns['rx_mean'][i],
+                    'ndwi_mean': columns['ndwi_mean'][i],
+                    'ace_mean': columns['ace_mean'][i],
+                    'mf_mean': columns['mf_mean'][i]
+                })
             
-            noise = spy.noise_from_diffs(noise_region)
+            except Exception as e:
+                logger.warning(f"Failed to extract details for leak spectral_leak_{columns['label'][i]}: {str(e)}")
+                failed[i] = True
+        
+        # Rows whose extraction failed keep empty details
+        defect_types[failed] = ''
+        water_angles[failed] = np.nan
+        
+        details = leak_candidates.select(slice(None))
+        details.columns.update({
+            'mean_spectrum': mean_spectra,
+            'defect_type': defect_types,
+            'severity': severities,
+            'spectral_angle_to_water': water_angles
+        })
+        
+        return details
+    
+    def _leak_batch(
+        self,
+        labels,
+        bboxes,
+        centroids,
+        areas,
+        score_means,
+        methods,
+        confidences,
+        image_shape: tuple
+    ) -> DetectionBatch:
+        """Leak candidate DetectionBatch from per-region properties"""
+        score_means = np.array(score_means, dtype=np.float64).reshape(-1, 4)
+        
+        return DetectionBatch(
+            bbox=np.array(bboxes).reshape(-1, 4),
+            confidence=confidences,
+            area=areas,
+            center=np.array(centroids).reshape(-1, 2),
+            columns={
+                'label': np.array(labels, dtype=np.int64),
+                'rx_mean': score_means[:, 0],
+                'ndwi_mean': score_means[:, 1],
+                'ace_mean': score_means[:, 2],
+                'mf_mean': score_means[:, 3],
+                'detection_methods': np.array(methods, dtype=np.int64)
+            },
+            image_shape=image_shape,
+            source='spectral'
+        )
+    
+    def _leaks_to_dicts(self, leaks: DetectionBatch) -> List[Dict[str, Any]]:
+        """Convert a leak DetectionBatch into leak candidate/detail dicts"""
+        columns = leaks.columns
+        has_details = 'defect_type' in columns
+        
+        leak_dicts = []
+        
+        for i in range(len(leaks)):
+            leak = {
+                'id': f"spectral_leak_{columns['label'][i]}",
+                'centroid': leaks.center[i].astype(np.int64).tolist(),
+                'bbox': leaks.bbox[i].astype(np.int64).tolist(),
+                'area_pixels': int(leaks.area[i]),
+                'scores': {
+                    'rx_mean': float(columns['rx_mean'][i]),
+                    'ndwi_mean': float(columns['ndwi_mean'][i]),
+                    'ace_mean': float(columns['ace_mean'][i]),
+                    'mf_mean': float(columns['mf_mean'][i])
+                },
+                'combined_confidence': float(leaks.confidence[i]),
+                'detection_methods': int(columns['detection_methods'][i])
+            }
+            
+            # Rows whose detail extraction failed keep candidate fields only
+            if has_details and columns['defect_type'][i]:
+                leak.update({
+                    'mean_spectrum': columns['mean_spectrum'][i].tolist(),
+                    'defect_type': columns['defect_type'][i],
+                    'severity': int(columns['severity'][i]),
+                    'spectral_angle_to_water': float(columns['spectral_angle_to_water'][i])
+                })
             
-            # Apply MNF
-            mnf_result = spy.mnf(noise, img)
+            leak_dicts.append(leak)
+        
+        return leak_dicts
+    
+    def _vote_map(
+        self,
+        ndwi: np.ndarray,
+        rx_scores: np.ndarray,
+        ace_scores: np.ndarray,
+        mf_scores: np.ndarray,
+        rx_threshold: float,
+        mf_threshold: float
+    ) -> np.ndarray:
+        """Number of detection methods (0-4) flagging each pixel"""
+        rx_mask = rx_scores > rx_threshold
+        ndwi_mask = ndwi > self.ndwi_leak_threshold
+        ace_mask = ace_scores > self.ace_confidence_threshold
+        mf_mask = mf_scores > mf_threshold
+        
+        return (
+            rx_mask.astype(int) +
+            ndwi_mask.astype(int) +
+            ace_mask.astype(int) +
+            mf_mask.astype(int)
+        )
+    
+    def _combined_confidence(self, rx_mean, ndwi_mean, ace_mean, mf_mean):
+        """Leak confidence from region mean scores (scalars or arrays)"""
+        return (
+            rx_mean * 0.25 +
+            ace_mean * 0.35 +
+            mf_mean * 0.25 +
+            (ndwi_mean - self.ndwi_leak_threshold) * 0.15
+        )
+    
+    def _local_rx(
+        self,
+        reduced_img: np.ndarray,
+        reduced_background: BackgroundStatistics
+    ) -> np.ndarray:
+        """Windowed RX on an MNF-reduced cube with the configured engine"""
+        # Shared covariance (local mean only) unless local covariance is requested
+        cov = None if self.rx_local_covariance else reduced_background.cov
+        
+        if self.rx_engine == 'integral':
+            return IntegralLocalRX(*self.rx_window, cov=cov)(reduced_img)
+        
+        return spy.rx(
+            reduced_img,
+            window=self.rx_window,    # (pixel neighborhood, background window)
+            cov=cov
+        )
+    
+    def _reduce_noise_mnf(
+        self,
+        img: np.ndarray,
+        background: BackgroundStatistics
+    ) -> Tuple[np.ndarray, BackgroundStatistics]:
+        """
+        Apply Minimum Noise Fraction transform
+        
+        Returns the reduced image and the background statistics projected
+        into the reduced space (no extra pass over the pixels).
+        """
+        try:
+            # A cached transform needs no noise estimate unless it is checked for staleness
+            reduction = None
+            if self.mnf_cache is not None and not self.mnf_cache.checks_staleness:
+                reduction = self.mnf_cache.get(self.sensor_id, background.num_bands)
             
-            # Keep top components (preserves signal, removes noise)
-            num_components = min(20, img.shape[2])
-            transformed = mnf_result.transform(img)
-            reduced = transformed[:, :, :num_components]
+            if reduction is None:
+                # Estimate noise from homogeneous region
+                # Use center region as assumed relatively homogeneous
+                h, w = img.shape[0], img.shape[1]
+                noise_region = img[h//4:3*h//4, w//4:3*w//4, :]
+                
+                noise = spy.noise_from_diffs(noise_region)
+                
+                reduction = self._mnf_reduction(background, noise)
             
-            return reduced
+            return self._project(img, reduction), background.transform(reduction._A, reduction._pre)
             
         except Exception as e:
             logger.warning(f"MNF failed, using original image: {str(e)}")
-            return img
+            return img, background
+    
+    def _run_detectors_concurrently(
+        self,
+        img: np.ndarray,
+        timings: Dict[str, float],
+        indices: Optional[Dict[str, Tuple[str, float, float]]] = None
+    ) -> Tuple[Dict[str, np.ndarray], BackgroundStatistics, Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """
+        Indices and the three detectors on a bounded thread pool
+        
+        Indices start right away; the background is estimated on the
+        calling thread meanwhile, then RX, ACE and MF are submitted and
+        all are joined before returning. The BLAS thread count is
+        process-wide, so it is limited once for the whole section to
+        blas_threads_per_detector.
+        
+        Returns:
+            (indices, background, (rx_scores, ace_scores, mf_scores))
+        """
+        workers = max(1, self.detector_workers)
+        blas_threads = self.blas_threads_per_detector or max(1, (os.cpu_count() or 1) // workers)
+        
+        with self._blas_limit(blas_threads), ThreadPoolExecutor(max_workers=workers) as executor:
+            indices = executor.submit(self._timed, timings, 'indices', self.calculate_indices, img, indices)
+            
+            background = self._timed(timings, 'background', self.estimate_background, img)
+            
+            if self.precision != 'float32':
+                # Build the shared spy stats before ACE and MF both reach for them
+                background.gaussian_stats
+            
+            detectors = [
+                executor.submit(self._timed, timings, 'rx', self.detect_anomalies_rx, img, background),
+                executor.submit(self._timed, timings, 'ace', self.detect_water_ace, img, background),
+                executor.submit(self._timed, timings, 'matched_filter', self.matched_filter_water, img, background)
+            ]
+            
+            scores = tuple(future.result() for future in detectors)
+            
+            return indices.result(), background, scores
+    
+    @staticmethod
+    def _timed(timings: Dict[str, float], name: str, func, *args):
+        """Call func(*args), recording its wall time in seconds under name"""
+        start = time.perf_counter()
+        
+        try:
+            return func(*args)
+        finally:
+            timings[name] = time.perf_counter() - start
+    
+    @staticmethod
+    def _blas_limit(num_threads: int):
+        """Context limiting BLAS / OpenMP threads (threadpoolctl)"""
+        try:
+            from threadpoolctl import threadpool_limits
+        except ImportError:
+            logger.warning("threadpoolctl not installed; BLAS thread count not limited")
+            return nullcontext()
+        
+        return threadpool_limits(limits=num_threads)
+    
+    def _project(self, img: np.ndarray, reduction, chunk_size: Optional[int] = None) -> np.ndarray:
+        """
+        Apply an MNF LinearTransform block by block
+        
+        spy's LinearTransform adds its offset to the whole cube first (a
+        full-size float64 copy); blocks keep that temporary bounded.
+        """
+        chunk_size = chunk_size or BackgroundStatistics.CHUNK_PIXELS
+        pixels = img.reshape(-1, img.shape[-1])
+        
+        matrix = reduction._A.T
+        offset = 0 if reduction._pre is None else reduction._pre
+        
+        reduced = np.empty((len(pixels), matrix.shape[1]), dtype=self.dtype)
+        
+        for start in range(0, len(pixels), chunk_size):
+            block = pixels[start:start + chunk_size].astype(np.float64) + offset
+            reduced[start:start + chunk_size] = block @ matrix
+        
+        if reduction._post is not None:
+            reduced += reduction._post
+        
+        return reduced.reshape(img.shape[:-1] + (-1,))
+    
+    def _mnf_reduction(self, background: BackgroundStatistics, noise):
+        """MNF reduction transform (spy LinearTransform) from signal and noise statistics"""
+        if self.mnf_cache is not None:
+            cached = self.mnf_cache.get(self.sensor_id, background.num_bands, noise)
+            if cached is not None:
+                return cached
+        
+        # Apply MNF (signal statistics from the shared background)
+        mnf_result = spy.mnf(background.gaussian_stats, noise)
+        
+        # Keep top components (preserves signal, removes noise)
+        num_components = min(20, background.num_bands)
+        
+        reduction = mnf_result.get_reduction_transform(num=num_components)
+        
+        if self.mnf_cache is not None:
+            self.mnf_cache.put(self.sensor_id, background.num_bands, reduction, noise)
+        
+        return reduction
     
     def _find_band_index(self, img: np.ndarray, target_wavelength: float) -> int:
         """Find band index closest to target wavelength"""
-        # This is simplified - in production, read from image metadata
-        # For now, assume standard band distribution
+        return self._bands(img).index(target_wavelength)
+    
+    def _bands(self, img) -> BandLookup:
+        """
+        Cached band table for an image
+        
+        Image metadata wavelengths (spy images) take precedence, then the
+        sensor header if its band count matches; otherwise the bands are
+        assumed evenly spaced over 400-2500 nm.
+        """
+        lookup = BandLookup.from_metadata(getattr(img, 'metadata', None))
+        
+        if lookup is not None:
+            return lookup
+        
         num_bands = img.shape[2]
         
-        # Typical hyperspectral range: 400-2500 nm
-        wavelengths = np.linspace(400, 2500, num_bands)
-        idx = np.argmin(np.abs(wavelengths - target_wavelength))
+        if self.band_lookup is not None and self.band_lookup.num_bands == num_bands:
+            return self.band_lookup
         
-        return int(idx)
+        return BandLookup.default(num_bands)
     
     def _classify_defect_type(self, spectrum: np.ndarray) -> str:
         """Classify defect type based on spectral signature"""
-        min_angle = float('inf')
-        best_match = 'unknown'
+        defect_types, _ = self._classify_spectra(np.asarray(spectrum)[None, :])
+        
+        return defect_types[0]
+    
+    def _classify_spectra(self, spectra: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Batched Spectral Angle Mapper over the reference library
         
-        for defect_type, ref_spectrum in self.reference_spectra.items():
-            angle = self._spectral_angle(spectrum, ref_spectrum)
-            if angle < min_angle:
-                min_angle = angle
-                best_match = defect_type
+        All (n, B) spectra are compared with all k references in one
+        matrix product; the closest reference gives the defect type.
         
-        # Map to defect categories
-        type_mapping = {
-            'water_leak': 'leak',
-            'corroded_pipe': 'corrosion',
-            'healthy_pipe': 'none',
-            'vegetation': 'vegetation_interference',
-            'concrete': 'surface_material'
-        }
+        Returns:
+            (n,) defect types ('unknown' for spectra without a valid
+            angle) and (n,) angles to the water reference
+        """
+        names, library = self._reference_library()
+        
+        angles = self._spectral_angles(spectra, library)
+        finite = np.isfinite(angles)
+        
+        best = np.argmin(np.where(finite, angles, np.inf), axis=1)
+        defect_types = np.array(
+            [self.defect_types.get(names[j], 'unknown') for j in best],
+            dtype=object
+        ).reshape(-1)
+        defect_types[~finite.any(axis=1)] = 'unknown'
+        
+        if 'water_leak' in names:
+            water_angles = angles[:, names.index('water_leak')].copy()
+        else:
+            water_angles = np.full(len(spectra), np.nan)
+        
+        return defect_types, water_angles
+    
+    def _reference_library(self) -> Tuple[List[str], np.ndarray]:
+        """Reference names and (k, B) spectra, rebuilt only when reference_spectra changes"""
+        key = tuple((name, id(spectrum)) for name, spectrum in self.reference_spectra.items())
+        
+        if self._library_cache is None or self._library_cache[0] != key:
+            names = list(self.reference_spectra)
+            min_len = min((len(self.reference_spectra[name]) for name in names), default=0)
+            library = np.array([np.asarray(self.reference_spectra[name])[:min_len] for name in names], dtype=np.float64)
+            
+            self._library_cache = (key, names, library.reshape(len(names), min_len))
+        
+        return self._library_cache[1], self._library_cache[2]
+    
+    def _spectral_angles(self, spectra: np.ndarray, references: np.ndarray) -> np.ndarray:
+        """(n, k) spectral angles between spectra (n, B) and references (k, B')"""
+        # Compare over the common bands
+        min_len = min(spectra.shape[1], references.shape[1])
+        s = np.asarray(spectra[:, :min_len], dtype=np.float64)
+        r = references[:, :min_len]
+        
+        norms = np.linalg.norm(s, axis=1)[:, None] * np.linalg.norm(r, axis=1)[None, :]
+        cos_angle = (s @ r.T) / (norms + 1e-10)
         
-        return type_mapping.get(best_match, 'unknown')
+        return np.arccos(np.clip(cos_angle, -1, 1))
+    
+    def _sensor_reference_spectra(self) -> Dict[str, np.ndarray]:
+        """Reference library as a dict, resampled to the sensor bands when known"""
+        library = self.reference_library
+        
+        if self.band_lookup is not None:
+            library = library.resample(self.band_lookup)
+        
+        return library.as_dict()
+    
+    def _roi_mean_spectra(self, img: np.ndarray, bboxes) -> Tuple[np.ndarray, np.ndarray]:
+        """(n, B) mean spectra of bbox ROIs and a (n,) flag of ROIs that failed"""
+        mean_spectra = np.full((len(bboxes), img.shape[2]), np.nan)
+        failed = np.zeros(len(bboxes), dtype=bool)
+        
+        for i, bbox in enumerate(bboxes):
+            try:
+                # Extract ROI
+                roi = img[bbox[1]:bbox[3], bbox[0]:bbox[2], :]
+                
+                # Calculate mean spectrum
+                mean_spectra[i] = np.mean(roi, axis=(0, 1))
+            
+            except Exception as e:
+                logger.warning(f"Failed to extract ROI spectrum {list(bbox)}: {str(e)}")
+                failed[i] = True
+        
+        return mean_spectra, failed
     
     def _spectral_angle(self, spectrum1: np.ndarray, spectrum2: np.ndarray) -> float:
         """Calculate spectral angle between two spectra"""
@@ -532,81 +1265,30 @@ class SpectralAnalyzer:
         
         return int(np.clip(severity, 1, 10))
     
-    def _simple_anomaly_detection(self, img: np.ndarray) -> np.ndarray:
+    def _simple_anomaly_detection(
+        self,
+        img: np.ndarray,
+        background: Optional[BackgroundStatistics] = None
+    ) -> np.ndarray:
         """Fallback simple anomaly detection"""
-        # Use Mahalanobis distance
-        img_2d = img.reshape(-1, img.shape[2])
-        
-        mean = np.mean(img_2d, axis=0)
-        cov = np.cov(img_2d.T)
-        
+        # Use Mahalanobis distance (chunked, vectorized Cholesky solve;
+        # singular covariance is shrunk or pseudo-inverted)
         try:
-            inv_cov = np.linalg.inv(cov)
+            if background is None:
+                background = BackgroundStatistics.from_image(img)
             
-            distances = np.zeros(img_2d.shape[0])
-            for i, pixel in enumerate(img_2d):
-                diff = pixel - mean
-                distances[i] = np.sqrt(diff @ inv_cov @ diff.T)
+            return background.mahalanobis(img)
             
-            return distances.reshape(img.shape[0], img.shape[1])
-            
-        except:
+        except Exception as e:
+            logger.error(f"Fallback anomaly detection failed: {str(e)}")
             return np.zeros((img.shape[0], img.shape[1]))
     
     def _get_wavelengths(self, img) -> List[float]:
         """Get wavelength information from image"""
         if hasattr(img, 'metadata') and 'wavelength' in img.metadata:
             return [float(w) for w in img.metadata['wavelength']]
+        elif hasattr(img, 'shape'):
+            return self._bands(img).wavelengths.tolist()
         else:
             # Return default if not available
-            num_bands = img.shape[2] if hasattr(img, 'shape') else 224
-            return list(np.linspace(400, 2500, num_bands))
-    
-    # Reference spectrum creation methods
-    
-    def _create_water_signature(self) -> np.ndarray:
-        """Create reference spectrum for water/moisture"""
-        # Simplified water absorption spectrum
-        # In production, use measured spectra from spectral library
-        wavelengths = np.linspace(400, 2500, 224)
-        
-        signature = np.ones_like(wavelengths)
-        
-        # Water absorption peaks
-        signature[wavelengths > 1400] *= 0.3  # Strong absorption at 1450nm
-        signature[wavelengths > 1900] *= 0.1  # Very strong at 1940nm
-        
-        return signature
-    
-    def _create_healthy_pipe_signature(self) -> np.ndarray:
-        """Reference spectrum for healthy pipe materials"""
-        wavelengths = np.linspace(400, 2500, 224)
-        signature = 0.5 + 0.1 * np.sin(wavelengths / 100)
-        return signature
-    
-    def _create_corrosion_signature(self) -> np.ndarray:
-        """Reference spectrum for corroded surfaces"""
-        wavelengths = np.linspace(400, 2500, 224)
-        # Iron oxide has characteristic absorption features
-        signature = np.ones_like(wavelengths)
-        signature[wavelengths < 600] *= 0.7  # Lower reflectance in blue
-        signature[(wavelengths > 800) & (wavelengths < 1000)] *= 0.5
-        return signature
-    
-    def _create_vegetation_signature(self) -> np.ndarray:
-        """Reference spectrum for vegetation"""
-        wavelengths = np.linspace(400, 2500, 224)
-        signature = np.ones_like(wavelengths)
-        
-        # Vegetation characteristics
-        signature[wavelengths < 700] *= 0.3  # Low reflectance in visible
-        signature[(wavelengths >= 700) & (wavelengths < 1300)] *= 2.0  # High NIR
-        
-        return signature
-    
-    def _create_concrete_signature(self) -> np.ndarray:
-        """Reference spectrum for concrete surfaces"""
-        wavelengths = np.linspace(400, 2500, 224)
-        # Concrete is relatively flat, high reflectance
-        signature = 0.7 + 0.05 * np.random.randn(len(wavelengths))
-        return np.abs(signature)
+            return list(np.linspace(400, 2500, 224))
@@ -0,0 +1,264 @@
+"""
+Spectral Batch Runner
+Process-pool analysis of many hyperspectral cubes with a resumable manifest
+"""
+
+import numpy as np
+from typing import Dict, List, Optional, Any, Sequence
+import logging
+import argparse
+import json
+import os
+import time
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+logger = logging.getLogger(__name__)
+
+# Per-process analyzer, created once by _init_worker
+_worker_analyzer = None
+_worker_options: Dict[str, Any] = {}
+
+
+class SpectralBatchRunner:
+    """
+    Fans cube paths out to a process pool
+    
+    Each worker process builds and initializes one SpectralAnalyzer (and
+    its reference library) at startup and reuses it for every cube it is
+    given. Workers receive file paths, open the cubes themselves and send
+    back only the compact leak details.
+    
+    Every finished cube is appended to a JSON Lines progress manifest, so
+    a crashed or interrupted job resumes where it stopped: cubes already
+    recorded as done are skipped and their results read back.
+    """
+    
+    def __init__(
+        self,
+        manifest_path: str,
+        max_workers: Optional[int] = None,
+        analyzer_config: Optional[Dict[str, Any]] = None,
+        library_path: Optional[str] = None,
+        streaming: bool = False,
+        block_rows: int = 256,
+        retry_failed: bool = True
+    ):
+        """
+        Args:
+            manifest_path: JSON Lines progress manifest (created if missing)
+            max_workers: Worker processes (default: cpu_count)
+            analyzer_config: SpectralAnalyzer attribute overrides,
+                             e.g. {'rx_engine': 'integral', 'precision': 'float32'}
+            library_path: Reference library for every worker (ReferenceLibrary.save)
+            streaming: Use analyze_file (out-of-core) instead of analyze
+            block_rows: Rows per block in streaming mode
+            retry_failed: Re-run cubes the manifest records as failed
+        """
+        self.manifest_path = Path(manifest_path)
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.analyzer_config = dict(analyzer_config or {})
+        self.library_path = library_path
+        self.streaming = streaming
+        self.block_rows = block_rows
+        self.retry_failed = retry_failed
+    
+    def run(self, cube_paths: Sequence[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Analyze every cube not yet done
+        
+        Returns:
+            cube path -> record {'path', 'status' ('done' / 'failed'),
+            'num_leaks', 'leak_details', 'shape', 'elapsed_s', 'error'}
+            for all cubes, including those completed by earlier runs
+        """
+        cube_paths = [str(path) for path in cube_paths]
+        records = self.load_manifest()
+        
+        pending = [
+            path for path in dict.fromkeys(cube_paths)
+            if path not in records or (records[path]['status'] == 'failed' and self.retry_failed)
+        ]
+        
+        logger.info(f"Batch: {len(cube_paths)} cubes, {len(cube_paths) - len(pending)} already in manifest, "
+                    f"{len(pending)} to analyze on {self.max_workers} workers")
+        
+        if pending:
+            self._check_config()
+            
+            options = {
+                'config': self.analyzer_config,
+                'library_path': self.library_path,
+                'streaming': self.streaming,
+                'block_rows': self.block_rows
+            }
+            
+            with ProcessPoolExecutor(
+                max_workers=min(self.max_workers, len(pending)),
+                initializer=_init_worker,
+                initargs=(options,)
+            ) as executor:
+                futures = {executor.submit(_analyze_cube, path): path for path in pending}
+                
+                for done, future in enumerate(as_completed(futures), 1):
+                    record = future.result()
+                    records[record['path']] = record
+                    self._append_manifest(record)
+                    
+                    logger.info(f"[{done}/{len(pending)}] {record['path']}: {record['status']}, "
+                                f"{record['num_leaks']} leaks in {record['elapsed_s']:.1f}s")
+        
+        return {path: records[path] for path in cube_paths if path in records}
+    
+    def load_manifest(self) -> Dict[str, Dict[str, Any]]:
+        """Latest record per cube path from the manifest (empty if none)"""
+        records = {}
+        
+        if not self.manifest_path.exists():
+            return records
+        
+        with open(self.manifest_path) as f:
+            for line_number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A crash mid-write can leave a truncated last line
+                    logger.warning(f"Skipping unreadable manifest line {line_number}")
+                    continue
+                
+                records[record['path']] = record
+        
+        return records
+    
+    # Private methods
+    
+    def _check_config(self):
+        """Reject unknown analyzer settings before any worker starts"""
+        from models.spectral_analyzer import SpectralAnalyzer
+        
+        analyzer = SpectralAnalyzer()
+        unknown = [name for name in self.analyzer_config if not hasattr(analyzer, name)]
+        
+        if unknown:
+            raise ValueError(f"Unknown SpectralAnalyzer setting(s): {', '.join(unknown)}")
+    
+    def _append_manifest(self, record: Dict[str, Any]):
+        """Append one record and flush it to disk"""
+        self.manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        
+        with open(self.manifest_path, 'a') as f:
+            f.write(json.dumps(record, default=_json_default) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def _init_worker(options: Dict[str, Any]):
+    """Process initializer: one initialized analyzer per worker"""
+    global _worker_analyzer, _worker_options
+    
+    from models.spectral_analyzer import SpectralAnalyzer
+    
+    analyzer = SpectralAnalyzer()
+    
+    for name, value in options['config'].items():
+        if not hasattr(analyzer, name):
+            raise ValueError(f"Unknown SpectralAnalyzer setting '{name}'")
+        setattr(analyzer, name, value)
+    
+    analyzer.initialize(library_path=options['library_path'])
+    
+    _worker_analyzer = analyzer
+    _worker_options = options
+
+
+def _analyze_cube(path: str) -> Dict[str, Any]:
+    """Analyze one cube in a worker; never raises (failures become records)"""
+    import spectral as spy
+    from models.result_projection import ResultProjection
+    
+    analyzer = _worker_analyzer
+    start = time.perf_counter()
+    
+    record = {
+        'path': path,
+        'status': 'done',
+        'num_leaks': 0,
+        'leak_details': [],
+        'shape': None,
+        'elapsed_s': 0.0,
+        'error': None,
+        'worker_pid': os.getpid()
+    }
+    
+    try:
+        if path.lower().endswith('.hdr'):
+            # Sensor wavelengths (cached per header) for band lookups and references
+            analyzer.set_sensor_header(path)
+        elif analyzer.band_lookup is not None:
+            # Do not inherit the previous cube's wavelengths and resampled references
+            analyzer.clear_sensor_header()
+        
+        if _worker_options.get('streaming'):
+            results = analyzer.analyze_file(path, block_rows=_worker_options['block_rows'])
+        else:
+            cube = spy.open_image(path).open_memmap(interleave='bip')
+            results = analyzer.analyze(cube, projection=ResultProjection.compact())
+        
+        record.update({
+            'num_leaks': results['num_leaks'],
+            'leak_details': results['leak_details'],
+            'shape': list(results['analysis_metadata']['shape'])
+        })
+    
+    except Exception as e:
+        logger.error(f"Batch analysis of {path} failed: {str(e)}")
+        record.update({'status': 'failed', 'error': str(e)})
+    
+    record['elapsed_s'] = time.perf_counter() - start
+    
+    return record
+
+
+def _json_default(value):
+    """JSON encoding for NumPy scalars / arrays in leak details"""
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    
+    parser = argparse.ArgumentParser(description="WPDD spectral batch analysis")
+    parser.add_argument("cubes", nargs='+', help="Cube files (e.g. ENVI .hdr)")
+    parser.add_argument("--manifest", required=True)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--library", default=None)
+    parser.add_argument("--rx-engine", choices=['spy', 'integral'], default='spy')
+    parser.add_argument("--precision", choices=['float64', 'float32'], default='float64')
+    parser.add_argument("--streaming", action='store_true')
+    parser.add_argument("--block-rows", type=int, default=256)
+    args = parser.parse_args()
+    
+    runner = SpectralBatchRunner(
+        args.manifest,
+        max_workers=args.workers,
+        analyzer_config={'rx_engine': args.rx_engine, 'precision': args.precision},
+        library_path=args.library,
+        streaming=args.streaming,
+        block_rows=args.block_rows
+    )
+    records = runner.run(args.cubes)
+    
+    failed = [path for path, record in records.items() if record['status'] != 'done']
+    print(json.dumps({
+        'cubes': len(records),
+        'failed': failed,
+        'num_leaks': sum(record['num_leaks'] for record in records.values())
+    }, indent=2))
@@ -0,0 +1,310 @@
+"""
+Incremental Spectral Analysis
+Re-analysis of overlapping flight lines, recomputing only new or changed score tiles
+"""
+
+import spectral as spy
+import numpy as np
+from typing import Dict, List, Optional, Any, Tuple
+import logging
+import hashlib
+import json
+import os
+import tempfile
+
+from models.background_stats import BackgroundStatistics
+from models.score_tiles import Footprint, ScoreTileStore
+from models.spectral_streaming import StreamingSpectralAnalysis
+
+logger = logging.getLogger(__name__)
+
+# 'checksum': reuse a tile only if its pixels and RX halo are identical;
+# 'mean_drift': reuse it while its mean spectrum moved less than drift_tolerance
+CHANGE_DETECTION = ('checksum', 'mean_drift')
+
+
+class IncrementalSpectralAnalysis(StreamingSpectralAnalysis):
+    """
+    Streams a georeferenced cube through a SpectralAnalyzer tile by tile
+    
+    The cube is cut along the global tile grid of a ScoreTileStore. Each
+    tile is read with the RX halo of its pixels (outer // 2 pixels on
+    every side, widened at the image edges). A tile whose window and
+    read-window checksum (or mean spectrum, within drift_tolerance)
+    match the stored ones reuses the stored scores, so a change in a
+    neighbouring tile's halo strip also refreshes its RX. Other tiles
+    are scored (NDWI, windowed RX, ACE, matched filter) and written
+    back. All tiles are scored against the store's background model,
+    which is estimated from the first cube and kept until the
+    configuration changes.
+    
+    Thresholds and leak regions come from the assembled per-cube score
+    scratch (as in StreamingSpectralAnalysis), so candidates crossing
+    tile boundaries are stitched into one region.
+    """
+    
+    def __init__(
+        self,
+        analyzer,
+        store: ScoreTileStore,
+        change_detection: str = 'checksum',
+        drift_tolerance: float = 0.01,
+        percentile_samples: int = 1_000_000,
+        scratch_dir: Optional[str] = None,
+        seed: int = 0
+    ):
+        """
+        Args:
+            analyzer: Initialized SpectralAnalyzer (thresholds, engines, references)
+            store: Score tiles and background model from earlier runs
+            change_detection: One of CHANGE_DETECTION
+            drift_tolerance: Relative mean-spectrum change tolerated in 'mean_drift' mode
+            percentile_samples: Pixels sampled for percentile thresholds
+            scratch_dir: Directory for the on-disk score scratch file
+            seed: Random seed for the percentile sample
+        """
+        if change_detection not in CHANGE_DETECTION:
+            raise ValueError(f"Unknown change detection '{change_detection}'. Choose from {list(CHANGE_DETECTION)}")
+        
+        super().__init__(
+            analyzer,
+            block_rows=store.tile_size,
+            percentile_samples=percentile_samples,
+            scratch_dir=scratch_dir,
+            seed=seed
+        )
+        
+        self.store = store
+        self.change_detection = change_detection
+        self.drift_tolerance = drift_tolerance
+    
+    def run(
+        self,
+        image_path: str,
+        footprint: Optional[Footprint] = None,
+        as_batch: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Analyze an image file, reusing unchanged score tiles
+        
+        Args:
+            image_path: Image file readable by spy.open_image (e.g. ENVI .hdr)
+            footprint: Map position of the cube (default: ENVI 'map info')
+            as_batch: Return leak candidates/details as columnar DetectionBatch
+        
+        Returns:
+            Dictionary with the keys of SpectralAnalyzer.analyze (score maps
+            are None; they live in the tile store)
+        """
+        analyzer = self.analyzer
+        
+        image = spy.open_image(image_path)
+        cube = image.open_memmap(interleave='bip')
+        rows, cols, num_bands = cube.shape
+        
+        footprint = footprint or Footprint.from_envi_header(image_path)
+        bands = analyzer._bands(image)
+        
+        self.store.bind(self._config_key(bands, num_bands), footprint)
+        
+        # Background model shared by every run against this store
+        model = self.store.load_background()
+        
+        if model is None:
+            background, noise = self._accumulate_statistics(cube)
+            reduction = self._fit_reduction(background, noise)
+            self.store.save_background(background, reduction)
+        else:
+            background, reduction = model
+        
+        reduced_background = background if reduction is None else background.transform(reduction._A, reduction._pre)
+        
+        tiles = self._tiles(footprint, rows, cols)
+        
+        logger.info(f"Incremental analysis of {image_path}: shape {cube.shape}, {len(tiles)} tiles")
+        
+        fd, scratch_path = tempfile.mkstemp(suffix='.scores', dir=self.scratch_dir)
+        os.close(fd)
+        
+        try:
+            scratch = np.memmap(scratch_path, dtype=np.float32, mode='w+', shape=(rows, cols, len(self.SCORE_CHANNELS)))
+            
+            reused = 0
+            
+            for tile, window, (r0, r1, c0, c1) in tiles:
+                # Scores depend on every pixel of the read window, not only the tile's own
+                extended, inner = self._read_tile(cube, (r0, r1, c0, c1))
+                checksum = ScoreTileStore.checksum(extended)
+                mean = extended.reshape(-1, num_bands).mean(axis=0, dtype=np.float64)
+                
+                stored = self.store.get(tile)
+                
+                if self._unchanged(stored, window, checksum, mean):
+                    scratch[r0:r1, c0:c1] = stored['scores']
+                    reused += 1
+                    continue
+                
+                scores = self._score_tile(extended, inner, background, reduction, reduced_background, bands)
+                scratch[r0:r1, c0:c1] = scores
+                self.store.put(tile, window, checksum, mean, scores)
+            
+            scratch.flush()
+            
+            logger.info(f"Reused {reused} of {len(tiles)} score tiles")
+            
+            samples = self._sample_scores(scratch)
+            rx_threshold = float(np.percentile(samples['rx_scores'], analyzer.rx_threshold_percentile))
+            mf_threshold = float(np.percentile(samples['mf_scores'], analyzer.mf_threshold_percentile))
+            
+            # Regions are labeled per row block and stitched across blocks
+            leak_candidates = self._find_leaks(scratch, rx_threshold, mf_threshold)
+            leak_details = analyzer.extract_leak_details(cube, leak_candidates)
+        
+        finally:
+            scratch = None
+            os.remove(scratch_path)
+        
+        if not as_batch:
+            leak_candidates = analyzer._leaks_to_dicts(leak_candidates)
+            leak_details = analyzer._leaks_to_dicts(leak_details)
+        
+        results = {
+            'ndwi': None,
+            'ndvi': None,
+            'rx_scores': None,
+            'ace_scores': None,
+            'mf_scores': None,
+            'leak_candidates': leak_candidates,
+            'leak_details': leak_details,
+            'confidence_map': None,
+            'num_leaks': len(leak_candidates),
+            'analysis_metadata': {
+                'shape': cube.shape,
+                'num_bands': num_bands,
+                'rx_threshold': rx_threshold,
+                'incremental': {
+                    'tile_size': self.store.tile_size,
+                    'grid_origin': footprint.grid_origin(),
+                    'tiles': len(tiles),
+                    'reused_tiles': reused,
+                    'recomputed_tiles': len(tiles) - reused,
+                    'change_detection': self.change_detection
+                }
+            }
+        }
+        
+        logger.info(f"Incremental analysis complete: {len(leak_candidates)} potential leaks detected")
+        
+        return results
+    
+    # Private methods
+    
+    def _tiles(self, footprint: Footprint, rows: int, cols: int) -> List[Tuple]:
+        """(tile index, global window, local (r0, r1, c0, c1)) for every tile the cube covers"""
+        size = self.store.tile_size
+        grid_row, grid_col = footprint.grid_origin()
+        
+        def cuts(origin: int, extent: int) -> List[int]:
+            # Local positions of the global tile boundaries inside the cube
+            return sorted({0, extent} | set(range((-origin) % size, extent, size)))
+        
+        row_cuts, col_cuts = cuts(grid_row, rows), cuts(grid_col, cols)
+        tiles = []
+        
+        for r0, r1 in zip(row_cuts[:-1], row_cuts[1:]):
+            for c0, c1 in zip(col_cuts[:-1], col_cuts[1:]):
+                tile = ((grid_row + r0) // size, (grid_col + c0) // size)
+                window = (grid_row + r0, grid_col + c0, grid_row + r1, grid_col + c1)
+                tiles.append((tile, window, (r0, r1, c0, c1)))
+        
+        return tiles
+    
+    def _unchanged(self, stored: Optional[Dict[str, Any]], window, checksum: str, mean: np.ndarray) -> bool:
+        """Whether a stored tile's scores are still valid for these pixels"""
+        if stored is None or stored['window'] != tuple(window):
+            return False
+        
+        if self.change_detection == 'checksum':
+            return stored['checksum'] == checksum
+        
+        drift = np.linalg.norm(mean - stored['mean']) / (np.linalg.norm(stored['mean']) + 1e-30)
+        
+        return drift <= self.drift_tolerance
+    
+    def _read_tile(self, cube: np.ndarray, bounds: Tuple[int, int, int, int]) -> Tuple[np.ndarray, Tuple[slice, slice]]:
+        """Tile pixels with their RX halo, and the tile's slices within them"""
+        rows, cols, _ = cube.shape
+        r0, r1, c0, c1 = bounds
+        
+        h0, h1 = self._halo_span(r0, r1, rows)
+        w0, w1 = self._halo_span(c0, c1, cols)
+        
+        return np.array(cube[h0:h1, w0:w1]), (slice(r0 - h0, r1 - h0), slice(c0 - w0, c1 - w0))
+    
+    def _score_tile(
+        self,
+        extended: np.ndarray,
+        inner: Tuple[slice, slice],
+        background: BackgroundStatistics,
+        reduction,
+        reduced_background: BackgroundStatistics,
+        bands
+    ) -> np.ndarray:
+        """(rows, cols, channels) float32 scores of one tile read with its halo"""
+        analyzer = self.analyzer
+        block = extended[inner]
+        
+        indices = analyzer.calculate_indices(block, {'ndwi': analyzer.spectral_indices['ndwi']}, bands=bands)
+        
+        scores = {
+            'ndwi': indices['ndwi'],
+            'rx_scores': self._block_rx(extended, reduction, reduced_background, background)[inner],
+            'ace_scores': analyzer.detect_water_ace(block, background),
+            'mf_scores': analyzer.matched_filter_water(block, background)
+        }
+        
+        # Detectors may squeeze one-row / one-column tiles
+        return np.stack([np.reshape(scores[name], block.shape[:2]) for name in self.SCORE_CHANNELS], axis=-1).astype(np.float32)
+    
+    def _fit_reduction(self, background: BackgroundStatistics, noise):
+        """MNF reduction for a new store (None keeps the original bands)"""
+        try:
+            return self.analyzer._mnf_reduction(background, noise)
+        except Exception as e:
+            logger.warning(f"MNF failed, using original image: {str(e)}")
+            return None
+    
+    def _sample_scores(self, scratch: np.ndarray) -> Dict[str, np.ndarray]:
+        """RX / matched-filter values sampled for the percentile thresholds"""
+        rows, cols, _ = scratch.shape
+        sample_rate = min(1.0, self.percentile_samples / float(rows * cols))
+        samples = {'rx_scores': [], 'mf_scores': []}
+        
+        for r0, r1 in self._blocks(rows):
+            block = np.asarray(scratch[r0:r1])
+            keep = None if sample_rate >= 1.0 else self.rng.random((r1 - r0, cols)) < sample_rate
+            
+            for name in samples:
+                values = block[..., self.SCORE_CHANNELS.index(name)]
+                samples[name].append(values.ravel() if keep is None else values[keep])
+        
+        return {name: np.concatenate(parts) for name, parts in samples.items()}
+    
+    def _config_key(self, bands, num_bands: int) -> str:
+        """Digest of everything the stored scores depend on"""
+        analyzer = self.analyzer
+        water = np.asarray(analyzer.reference_spectra['water_leak'], dtype=np.float64)
+        
+        config = {
+            'sensor_id': analyzer.sensor_id,
+            'bands': bands.key,
+            'num_bands': int(num_bands),
+            'ndwi': list(analyzer.spectral_indices['ndwi']),
+            'rx_window': list(analyzer.rx_window),
+            'rx_engine': analyzer.rx_engine,
+            'rx_local_covariance': analyzer.rx_local_covariance,
+            'precision': analyzer.precision,
+            'water_reference': hashlib.sha1(water.tobytes()).hexdigest()
+        }
+        
+        return hashlib.sha1(json.dumps(config, sort_keys=True).encode()).hexdigest()
@@ -0,0 +1,99 @@
+"""
+Spectral Index Engine
+Declarative band-ratio indices evaluated from one band gather
+"""
+
+import numpy as np
+from typing import Dict, List, Tuple
+import logging
+
+from models.band_lookup import BandLookup
+
+logger = logging.getLogger(__name__)
+
+# Index kinds: 'nd' = (a - b) / (a + b), 'ratio' = a / b
+INDEX_KINDS = ('nd', 'ratio')
+
+# name -> (kind, band a nm, band b nm)
+DEFAULT_INDICES = {
+    'ndwi': ('nd', 560, 860),     # Green / NIR - open water
+    'ndvi': ('nd', 860, 650)      # NIR / red - vegetation
+}
+
+# Moisture indices for SWIR-capable sensors
+MOISTURE_INDICES = {
+    'mndwi': ('nd', 560, 1610),   # Green / SWIR1 - water, less built-up noise
+    'ndmi': ('nd', 860, 1610)     # NIR / SWIR1 - soil and vegetation moisture
+}
+
+
+class SpectralIndexEngine:
+    """
+    Evaluates a set of normalized-difference / ratio indices
+    
+    Every band the indices reference is gathered from the cube and cast
+    to float32 once, then each index is written into a preallocated
+    stack with out= buffers, so shared bands (e.g. NIR in NDWI, NDVI and
+    NDMI) cost one read.
+    """
+    
+    # Added to denominators to avoid division by zero
+    EPSILON = 1e-10
+    
+    def __init__(self, indices: Dict[str, Tuple[str, float, float]] = None):
+        """
+        Args:
+            indices: name -> (kind, wavelength a, wavelength b) in nm,
+                     kind 'nd' or 'ratio' (default: DEFAULT_INDICES)
+        """
+        indices = DEFAULT_INDICES if indices is None else indices
+        
+        for name, (kind, _, _) in indices.items():
+            if kind not in INDEX_KINDS:
+                raise ValueError(f"Unknown index kind '{kind}' for {name}. Choose from {INDEX_KINDS}")
+        
+        self.indices = dict(indices)
+    
+    @property
+    def names(self) -> List[str]:
+        """Index names in stack order"""
+        return list(self.indices)
+    
+    def __call__(self, img: np.ndarray, bands: BandLookup) -> np.ndarray:
+        """
+        Index stack of shape (num_indices, rows, cols), float32
+        """
+        rows, cols = img.shape[:2]
+        
+        # Gather each referenced band once
+        band_idx = {
+            name: bands.indices([wl_a, wl_b])
+            for name, (_, wl_a, wl_b) in self.indices.items()
+        }
+        unique_bands = np.unique(np.concatenate(list(band_idx.values()))) if band_idx else np.zeros(0, dtype=np.int64)
+        position = {band: k for k, band in enumerate(unique_bands.tolist())}
+        
+        gathered = np.empty((len(unique_bands), rows, cols), dtype=np.float32)
+        for k, band in enumerate(unique_bands):
+            np.copyto(gathered[k], img[:, :, band], casting='unsafe')
+        
+        stack = np.empty((len(self.indices), rows, cols), dtype=np.float32)
+        denominator = np.empty((rows, cols), dtype=np.float32)
+        
+        for i, (name, (kind, _, _)) in enumerate(self.indices.items()):
+            a = gathered[position[int(band_idx[name][0])]]
+            b = gathered[position[int(band_idx[name][1])]]
+            
+            if kind == 'nd':
+                np.subtract(a, b, out=stack[i])
+                np.add(a, b, out=denominator)
+            else:
+                np.copyto(stack[i], a)
+                np.copyto(denominator, b)
+            
+            denominator += self.EPSILON
+            np.divide(stack[i], denominator, out=stack[i])
+        
+        logger.debug(f"Spectral indices {self.names} from {len(unique_bands)} bands")
+        
+        return stack
@@ -0,0 +1,432 @@
+"""
+Out-of-Core Spectral Analysis
+Row-block streaming version of SpectralAnalyzer.analyze for cubes larger than RAM
+"""
+
+import spectral as spy
+import numpy as np
+from typing import Dict, Optional, Any
+import logging
+import os
+import tempfile
+from scipy import ndimage
+
+from models.background_stats import BackgroundStatistics, RunningStatistics
+from models.detection_batch import DetectionBatch
+
+logger = logging.getLogger(__name__)
+
+
+class StreamingSpectralAnalysis:
+    """
+    Streams a hyperspectral cube through a SpectralAnalyzer in row blocks
+    
+    Pass 1 reads the cube once to accumulate the global background
+    statistics and the MNF noise statistics (pixel differences over the
+    central region, as in SpectralAnalyzer._reduce_noise_mnf).
+    
+    Pass 2 scores every block: NDWI/NDVI, windowed RX (with a halo of
+    outer // 2 rows, widened at the image edges where windows are moved
+    inward, so windows match the full-image result), ACE and the
+    matched filter against the global background. Per-pixel scores go to
+    a float32 scratch memmap on disk; only a pixel sample is kept in
+    memory for the RX / matched-filter percentile thresholds.
+    
+    Pass 3 thresholds the scratch scores block by block, labels leak
+    regions and stitches regions that cross block boundaries.
+    
+    Only the leak candidates and, optionally, strided downsampled maps
+    are kept in memory.
+    """
+    
+    # Scratch channels, in order
+    SCORE_CHANNELS = ('ndwi', 'rx_scores', 'ace_scores', 'mf_scores')
+    
+    def __init__(
+        self,
+        analyzer,
+        block_rows: int = 256,
+        map_downsample: Optional[int] = None,
+        percentile_samples: int = 1_000_000,
+        scratch_dir: Optional[str] = None,
+        seed: int = 0
+    ):
+        """
+        Args:
+            analyzer: Initialized SpectralAnalyzer (thresholds, engines, references)
+            block_rows: Image rows per block
+            map_downsample: Keep every n-th row/column of the score maps
+                            (None keeps no maps)
+            percentile_samples: Pixels sampled for percentile thresholds
+            scratch_dir: Directory for the on-disk score scratch file
+            seed: Random seed for the percentile sample
+        """
+        self.analyzer = analyzer
+        self.block_rows = block_rows
+        self.map_downsample = map_downsample
+        self.percentile_samples = percentile_samples
+        self.scratch_dir = scratch_dir
+        self.rng = np.random.default_rng(seed)
+    
+    def run(self, image_path: str, as_batch: bool = False) -> Dict[str, Any]:
+        """
+        Analyze an image file (ENVI header or any format spy.open_image reads)
+        
+        Returns:
+            Dictionary with the keys of SpectralAnalyzer.analyze; score maps
+            are downsampled by map_downsample or None
+        """
+        image = spy.open_image(image_path)
+        cube = image.open_memmap(interleave='bip')
+        rows, cols, num_bands = cube.shape
+        
+        logger.info(f"Streaming analysis of {image_path}: shape {cube.shape}, {self.block_rows}-row blocks")
+        
+        fd, scratch_path = tempfile.mkstemp(suffix='.scores', dir=self.scratch_dir)
+        os.close(fd)
+        
+        try:
+            scratch = np.memmap(scratch_path, dtype=np.float32, mode='w+', shape=(rows, cols, len(self.SCORE_CHANNELS)))
+            
+            # Pass 1: global statistics
+            background, noise = self._accumulate_statistics(cube)
+            
+            # Pass 2: score blocks
+            maps, samples, ranges = self._score_blocks(cube, scratch, background, noise, self.analyzer._bands(image))
+            
+            rx_threshold = float(np.percentile(samples['rx_scores'], self.analyzer.rx_threshold_percentile))
+            mf_threshold = float(np.percentile(samples['mf_scores'], self.analyzer.mf_threshold_percentile))
+            
+            # Pass 3: leak regions
+            leak_candidates = self._find_leaks(scratch, rx_threshold, mf_threshold)
+            
+            if maps is not None:
+                maps['confidence_map'] = self.analyzer.calculate_confidence_map(
+                    maps['ndwi'], maps['rx_scores'], maps['ace_scores'], maps['mf_scores'],
+                    rx_range=ranges['rx_scores'],
+                    mf_range=ranges['mf_scores']
+                )
+            
+            leak_details = self.analyzer.extract_leak_details(cube, leak_candidates)
+        
+        finally:
+            scratch = None
+            os.remove(scratch_path)
+        
+        if not as_batch:
+            leak_candidates = self.analyzer._leaks_to_dicts(leak_candidates)
+            leak_details = self.analyzer._leaks_to_dicts(leak_details)
+        
+        maps = maps or {}
+        
+        results = {
+            'ndwi': maps.get('ndwi'),
+            'ndvi': maps.get('ndvi'),
+            'rx_scores': maps.get('rx_scores'),
+            'ace_scores': maps.get('ace_scores'),
+            'mf_scores': maps.get('mf_scores'),
+            'leak_candidates': leak_candidates,
+            'leak_details': leak_details,
+            'confidence_map': maps.get('confidence_map'),
+            'num_leaks': len(leak_candidates),
+            'analysis_metadata': {
+                'shape': cube.shape,
+                'num_bands': num_bands,
+                'rx_threshold': rx_threshold,
+                'streaming': {
+                    'block_rows': self.block_rows,
+                    'map_downsample': self.map_downsample,
+                    'percentile_samples': int(len(samples['rx_scores']))
+                }
+            }
+        }
+        
+        logger.info(f"Streaming analysis complete: {len(leak_candidates)} potential leaks detected")
+        
+        return results
+    
+    # Private methods
+    
+    def _blocks(self, rows: int):
+        """(start, stop) row ranges of the blocks"""
+        for r0 in range(0, rows, self.block_rows):
+            yield r0, min(r0 + self.block_rows, rows)
+    
+    def _accumulate_statistics(self, cube: np.ndarray):
+        """Pass 1: background statistics and MNF noise statistics"""
+        rows, cols, num_bands = cube.shape
+        
+        signal = RunningStatistics(num_bands)
+        noise = RunningStatistics(num_bands)
+        
+        # Noise from lower-right differences over the central region
+        r_lo, r_hi = rows // 4, 3 * rows // 4
+        c_lo, c_hi = cols // 4, 3 * cols // 4
+        
+        for r0, r1 in self._blocks(rows):
+            signal.update(np.asarray(cube[r0:r1]))
+            
+            d0, d1 = max(r0, r_lo), min(r1, r_hi - 1)
+            if d0 < d1 and c_hi - c_lo > 1:
+                upper = np.asarray(cube[d0:d1, c_lo:c_hi - 1], dtype=np.float64)
+                lower = np.asarray(cube[d0 + 1:d1 + 1, c_lo + 1:c_hi], dtype=np.float64)
+                noise.update(upper - lower)
+        
+        noise_stats = noise.finalize() if noise.count > 1 else None
+        
+        if noise_stats is not None:
+            # Differences of two pixels carry twice the noise variance
+            noise_stats = spy.GaussianStats(
+                mean=noise_stats.mean,
+                cov=noise_stats.cov / 2.0,
+                nsamples=noise_stats.nsamples
+            )
+        
+        return signal.finalize(), noise_stats
+    
+    def _score_blocks(
+        self,
+        cube: np.ndarray,
+        scratch: np.ndarray,
+        background: BackgroundStatistics,
+        noise,
+        bands
+    ):
+        """Pass 2: per-block scores into scratch, percentile samples and map extents"""
+        analyzer = self.analyzer
+        rows, cols, _ = cube.shape
+        
+        try:
+            reduction = analyzer._mnf_reduction(background, noise)
+            reduced_background = background.transform(reduction._A, reduction._pre)
+        except Exception as e:
+            logger.warning(f"MNF failed, using original image: {str(e)}")
+            reduction, reduced_background = None, background
+        
+        step = self.map_downsample
+        maps = {name: [] for name in ('ndvi',) + self.SCORE_CHANNELS} if step else None
+        
+        sample_rate = min(1.0, self.percentile_samples / float(rows * cols))
+        samples = {'rx_scores': [], 'mf_scores': []}
+        ranges = {'rx_scores': [np.inf, -np.inf], 'mf_scores': [np.inf, -np.inf]}
+        
+        for r0, r1 in self._blocks(rows):
+            h0, h1 = self._halo_span(r0, r1, rows)
+            extended = np.array(cube[h0:h1])
+            block = extended[r0 - h0:r1 - h0]
+            
+            indices = analyzer.calculate_indices(block, bands=bands)
+            
+            scores = {
+                'ndwi': indices['ndwi'],
+                'rx_scores': self._block_rx(extended, reduction, reduced_background, background)[r0 - h0:r1 - h0],
+                'ace_scores': analyzer.detect_water_ace(block, background),
+                'mf_scores': analyzer.matched_filter_water(block, background)
+            }
+            
+            scratch[r0:r1] = np.stack([scores[name] for name in self.SCORE_CHANNELS], axis=-1)
+            
+            # Percentile sample and global extents come from the stored
+            # (float32) values so thresholds compare like with like
+            stored = {name: scratch[r0:r1, :, self.SCORE_CHANNELS.index(name)] for name in samples}
+            keep = None if sample_rate >= 1.0 else self.rng.random(stored['rx_scores'].shape) < sample_rate
+            
+            for name, values in stored.items():
+                samples[name].append(values.ravel() if keep is None else values[keep])
+                ranges[name] = [min(ranges[name][0], float(values.min())), max(ranges[name][1], float(values.max()))]
+            
+            if step:
+                offset = (-r0) % step
+                scores['ndvi'] = indices['ndvi']
+                for name in maps:
+                    maps[name].append(np.asarray(scores[name])[offset::step, ::step])
+            
+            logger.debug(f"Scored rows {r0}-{r1}")
+        
+        scratch.flush()
+        
+        if maps is not None:
+            maps = {name: np.concatenate(parts) for name, parts in maps.items()}
+        
+        samples = {name: np.concatenate(parts) for name, parts in samples.items()}
+        
+        return maps, samples, {name: tuple(extent) for name, extent in ranges.items()}
+    
+    def _halo_span(self, start: int, stop: int, extent: int):
+        """
+        Read range around [start, stop) covering the RX windows of its pixels
+        
+        Windows are outer pixels wide and moved inward at the image edges
+        (spy.rx, IntegralLocalRX), so pixels within outer // 2 of an edge
+        need the outer pixels next to it rather than a symmetric halo.
+        """
+        outer = self.analyzer.rx_window[1]
+        halo = outer // 2
+        
+        return max(0, min(start - halo, extent - outer)), min(extent, max(stop + halo, outer))
+    
+    def _block_rx(
+        self,
+        extended: np.ndarray,
+        reduction,
+        reduced_background: BackgroundStatistics,
+        background: BackgroundStatistics
+    ) -> np.ndarray:
+        """Windowed RX on a halo-extended block (same fallback as detect_anomalies_rx)"""
+        try:
+            reduced = self.analyzer._project(extended, reduction) if reduction is not None else extended
+            return self.analyzer._local_rx(reduced, reduced_background)
+        except Exception as e:
+            logger.error(f"RX detection failed: {str(e)}")
+            return self.analyzer._simple_anomaly_detection(extended, background)
+    
+    def _find_leaks(
+        self,
+        scratch: np.ndarray,
+        rx_threshold: float,
+        mf_threshold: float
+    ) -> DetectionBatch:
+        """Pass 3: threshold stored scores, label regions, stitch across blocks"""
+        analyzer = self.analyzer
+        rows, cols, _ = scratch.shape
+        regions = _RegionAccumulator(cols)
+        
+        for r0, r1 in self._blocks(rows):
+            ndwi, rx, ace, mf = np.moveaxis(np.asarray(scratch[r0:r1], dtype=np.float64), -1, 0)
+            
+            vote_map = analyzer._vote_map(ndwi, rx, ace, mf, rx_threshold, mf_threshold)
+            regions.add_block(r0, vote_map >= 2, np.stack([rx, ndwi, ace, mf]))
+        
+        props = regions.finalize(min_pixels=5)
+        
+        # Methods agreeing at the (integer) centroid
+        centroid_scores = np.asarray(
+            scratch[props['centroids'][:, 1], props['centroids'][:, 0]],
+            dtype=np.float64
+        ).reshape(-1, len(self.SCORE_CHANNELS))
+        methods = analyzer._vote_map(
+            centroid_scores[:, 0], centroid_scores[:, 1], centroid_scores[:, 2], centroid_scores[:, 3],
+            rx_threshold, mf_threshold
+        )
+        
+        score_means = props['score_means']
+        confidences = analyzer._combined_confidence(
+            score_means[:, 0], score_means[:, 1], score_means[:, 2], score_means[:, 3]
+        )
+        
+        leak_candidates = analyzer._leak_batch(
+            props['labels'], props['bboxes'], props['centroids'], props['areas'],
+            score_means, methods, confidences,
+            image_shape=(rows, cols)
+        )
+        
+        logger.info(f"Identified {len(leak_candidates)} leak candidates")
+        
+        return leak_candidates
+
+
+class _RegionAccumulator:
+    """
+    Connected-region properties gathered block by block
+    
+    Regions are labeled per block (4-connectivity, like ndimage.label)
+    and merged with a union-find wherever a region touches the same
+    column in the last row of the previous block.
+    """
+    
+    def __init__(self, cols: int):
+        self.cols = cols
+        self.parent = []
+        self.props = []
+        self.previous_row = None
+    
+    def add_block(self, r0: int, mask: np.ndarray, scores: np.ndarray):
+        """Label a block mask and accumulate per-region sums (scores: (4, rows, cols))"""
+        labeled, num = ndimage.label(mask)
+        offset = len(self.parent)
+        
+        if num > 0:
+            flat = labeled.ravel()
+            index = np.arange(1, num + 1)
+            
+            ys, xs = np.indices(labeled.shape)
+            linear = (ys + r0) * self.cols + xs
+            slices = ndimage.find_objects(labeled)
+            
+            block_props = np.zeros((num, 13))
+            block_props[:, 0] = np.bincount(flat, minlength=num + 1)[1:]
+            block_props[:, 1] = np.bincount(flat, weights=(ys + r0).ravel(), minlength=num + 1)[1:]
+            block_props[:, 2] = np.bincount(flat, weights=xs.ravel(), minlength=num + 1)[1:]
+            block_props[:, 3] = [s[1].start for s in slices]
+            block_props[:, 4] = [s[0].start + r0 for s in slices]
+            block_props[:, 5] = [s[1].stop - 1 for s in slices]
+            block_props[:, 6] = [s[0].stop - 1 + r0 for s in slices]
+            block_props[:, 7] = ndimage.minimum(linear, labeled, index)
+            
+            for k in range(4):
+                block_props[:, 8 + k] = np.bincount(flat, weights=scores[k].ravel(), minlength=num + 1)[1:]
+            
+            self.props.append(block_props)
+            self.parent.extend(range(offset, offset + num))
+        
+        global_labels = np.where(labeled > 0, labeled - 1 + offset, -1)
+        
+        # Stitch regions continuing from the previous block
+        if self.previous_row is not None:
+            touching = (self.previous_row >= 0) & (global_labels[0] >= 0)
+            pairs = np.unique(np.stack([self.previous_row[touching], global_labels[0][touching]], axis=1), axis=0)
+            
+            for a, b in pairs:
+                self._union(int(a), int(b))
+        
+        self.previous_row = global_labels[-1]
+    
+    def finalize(self, min_pixels: int = 5) -> Dict[str, np.ndarray]:
+        """Merged region properties, numbered in raster order like ndimage.label"""
+        if not self.parent:
+            return {
+                'labels': np.zeros(0, dtype=np.int64),
+                'bboxes': np.zeros((0, 4), dtype=np.int64),
+                'centroids': np.zeros((0, 2), dtype=np.int64),
+                'areas': np.zeros(0, dtype=np.int64),
+                'score_means': np.zeros((0, 4))
+            }
+        
+        props = np.concatenate(self.props)
+        roots = np.array([self._find(i) for i in range(len(self.parent))])
+        unique_roots, region = np.unique(roots, return_inverse=True)
+        n = len(unique_roots)
+        
+        count = np.bincount(region, weights=props[:, 0], minlength=n)
+        sums = np.stack([np.bincount(region, weights=props[:, k], minlength=n) for k in (1, 2, 8, 9, 10, 11)], axis=1)
+        
+        mins = np.full((n, 3), np.inf)
+        maxs = np.full((n, 2), -np.inf)
+        np.minimum.at(mins, region, props[:, [3, 4, 7]])
+        np.maximum.at(maxs, region, props[:, [5, 6]])
+        
+        # ndimage.label numbers regions by their first pixel in raster order
+        order = np.argsort(mins[:, 2], kind='stable')
+        labels = np.empty(n, dtype=np.int64)
+        labels[order] = np.arange(1, n + 1)
+        
+        keep = order[count[order] >= min_pixels]
+        
+        return {
+            'labels': labels[keep],
+            'bboxes': np.stack([mins[keep, 0], mins[keep, 1], maxs[keep, 0], maxs[keep, 1]], axis=1).astype(np.int64),
+            'centroids': np.stack([sums[keep, 1] / count[keep], sums[keep, 0] / count[keep]], axis=1).astype(np.int64),
+            'areas': count[keep].astype(np.int64),
+            'score_means': sums[keep, 2:] / count[keep, None]
+        }
+    
+    def _find(self, i: int) -> int:
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+    
+    def _union(self, a: int, b: int):
+        ra, rb = self._find(a), self._find(b)
+        if ra != rb:
+            self.parent[max(ra, rb)] = min(ra, rb)
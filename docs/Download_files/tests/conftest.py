@@ -0,0 +1,15 @@
+"""
+Test Configuration
+The modules in this directory import each other as models.<name>; map that package here
+"""
+
+import sys
+import types
+from pathlib import Path
+
+MODELS_DIR = Path(__file__).resolve().parents[1]
+
+if 'models' not in sys.modules:
+    models = types.ModuleType('models')
+    models.__path__ = [str(MODELS_DIR)]
+    sys.modules['models'] = models
@@ -0,0 +1,108 @@
+"""
+Detection Batch Tests
+DetectionBatch dict round trip and concatenation edge cases
+"""
+
+import numpy as np
+import pytest
+
+from models.detection_batch import DetectionBatch
+
+CLASS_NAMES = {0: 'pipe', 1: 'leak'}
+
+
+def make_dicts(n: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    detections = []
+    
+    for _ in range(n):
+        x1, y1 = rng.uniform(0, 500, 2).tolist()
+        w, h = rng.uniform(5, 80, 2).tolist()
+        class_id = int(rng.integers(0, 3))   # 2 has no name
+        
+        detections.append({
+            'bbox': [x1, y1, x1 + w, y1 + h],
+            'confidence': float(rng.uniform(0.1, 1.0)),
+            'class_id': class_id,
+            'class_name': CLASS_NAMES.get(class_id, 'unknown'),
+            'area': w * h,
+            'center': [x1 + w / 2, y1 + h / 2],
+            'image_shape': (640, 640, 3),
+            'detection_source': 'yolov8'
+        })
+    
+    return detections
+
+
+@pytest.mark.parametrize('n', [0, 1, 25])
+def test_dict_round_trip(n):
+    detections = make_dicts(n)
+    
+    batch = DetectionBatch.from_dicts(detections, class_names=CLASS_NAMES)
+    
+    assert len(batch) == n
+    assert batch.to_dicts() == pytest.approx(detections)
+
+
+def test_round_trip_derives_area_and_center():
+    detections = [
+        {key: value for key, value in det.items() if key not in ('area', 'center')}
+        for det in make_dicts(10, seed=1)
+    ]
+    
+    restored = DetectionBatch.from_dicts(detections, class_names=CLASS_NAMES).to_dicts()
+    
+    for det, back in zip(detections, restored):
+        x1, y1, x2, y2 = det['bbox']
+        assert back['area'] == pytest.approx((x2 - x1) * (y2 - y1))
+        assert back['center'] == pytest.approx([(x1 + x2) / 2, (y1 + y2) / 2])
+
+
+def test_concatenate_no_batches():
+    batch = DetectionBatch.concatenate([])
+    
+    assert len(batch) == 0
+    assert batch.bbox.shape == (0, 4) and batch.center.shape == (0, 2)
+    assert batch.to_dicts() == []
+
+
+def test_concatenate_empty_batches():
+    empty = DetectionBatch.empty(
+        image_shape=(64, 64, 3),
+        source='yolov8',
+        class_names=CLASS_NAMES,
+        columns={'tile_origin': np.zeros((0, 2), dtype=np.int32)}
+    )
+    
+    batch = DetectionBatch.concatenate([empty, empty, empty])
+    
+    assert len(batch) == 0
+    assert batch.bbox.shape == (0, 4)
+    assert batch.columns['tile_origin'].shape == (0, 2)
+    assert (batch.image_shape, batch.source, batch.class_names) == ((64, 64, 3), 'yolov8', CLASS_NAMES)
+
+
+def test_concatenate_empty_with_detections():
+    full = DetectionBatch.from_dicts(make_dicts(7, seed=2), class_names=CLASS_NAMES)
+    full.columns['tile_origin'] = np.arange(14, dtype=np.int32).reshape(7, 2)
+    full.columns['on_seam'] = np.ones(7, dtype=bool)
+    
+    empty = DetectionBatch.empty(
+        source='yolov8',
+        class_names=CLASS_NAMES,
+        columns={'tile_origin': np.zeros((0, 2), dtype=np.int32)}
+    )
+    
+    for batches in ([empty, full], [full, empty], [empty, full, empty]):
+        batch = DetectionBatch.concatenate(batches)
+        
+        assert len(batch) == 7
+        np.testing.assert_array_equal(batch.bbox, full.bbox)
+        np.testing.assert_array_equal(batch.class_id, full.class_id)
+        np.testing.assert_array_equal(batch.columns['tile_origin'], full.columns['tile_origin'])
+        
+        # Columns missing from any batch are dropped
+        assert set(batch.columns) == {'tile_origin'}
+        assert batch.to_dicts() == pytest.approx(
+            [dict(det, tile_origin=tuple(origin)) for det, origin in zip(full.to_dicts(), full.columns['tile_origin'].tolist())]
+        )
@@ -0,0 +1,187 @@
+"""
+Fusion Engine Tests
+Visual/spectral assignment and change detection against brute-force references
+"""
+
+import numpy as np
+import pytest
+from scipy.optimize import linear_sum_assignment
+
+from models.fusion_engine import DetectionFusionEngine
+from models.spatial_index import GridIndex, box_iou_matrix
+
+
+def _random_boxes(rng, n, extent=200.0):
+    xy = rng.uniform(0, extent, (n, 2))
+    wh = rng.uniform(5, 40, (n, 2))
+    return np.hstack([xy, xy + wh])
+
+
+def _reference_optimal(visual, spectral, threshold):
+    """Total IoU of one global Hungarian solve over the thresholded IoU matrix"""
+    weights = box_iou_matrix(visual, spectral)
+    weights[weights < threshold] = 0.0
+    
+    rows, cols = linear_sum_assignment(weights, maximize=True)
+    
+    return weights[rows, cols].sum()
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_optimal_matches_global_assignment(seed):
+    rng = np.random.default_rng(seed)
+    visual = _random_boxes(rng, int(rng.integers(1, 80)))
+    
+    # Jittered copies of some visual boxes plus clutter: clusters of every size
+    copies = visual[rng.random(len(visual)) < 0.6] + rng.normal(0, 4, (1, 4))
+    spectral = np.vstack([copies + rng.normal(0, 3, copies.shape), _random_boxes(rng, int(rng.integers(0, 40)))])
+    
+    engine = DetectionFusionEngine(assignment_mode='optimal')
+    match_idx, match_iou = engine._match_visual_spectral(visual, spectral)
+    
+    matched = match_idx >= 0
+    iou = box_iou_matrix(visual, spectral)
+    
+    # One-to-one, only real candidate pairs, IoU reported as computed
+    assert len(np.unique(match_idx[matched])) == matched.sum()
+    assert np.all(iou[matched, match_idx[matched]] >= engine.spatial_match_threshold)
+    np.testing.assert_allclose(match_iou[matched], iou[matched, match_idx[matched]])
+    assert np.all(match_iou[~matched] == 0)
+    
+    np.testing.assert_allclose(
+        match_iou.sum(),
+        _reference_optimal(visual, spectral, engine.spatial_match_threshold),
+        rtol=1e-12, atol=1e-12
+    )
+
+
+def test_optimal_resolves_greedy_conflict():
+    # A prefers X, but X is B's only candidate; giving A its second choice Y
+    # matches both boxes with a larger total IoU
+    visual = np.array([[1, 0, 11, 10], [-2, 0, 8, 10]], dtype=float)   # A, B
+    spectral = np.array([[0, 0, 10, 10], [5, 0, 15, 10]], dtype=float)  # X, Y
+    
+    greedy, _ = DetectionFusionEngine('greedy')._match_visual_spectral(visual, spectral)
+    optimal, _ = DetectionFusionEngine('optimal')._match_visual_spectral(visual, spectral)
+    
+    assert greedy.tolist() == [0, 0]
+    assert optimal.tolist() == [1, 0]
+
+
+def test_optimal_drops_zero_weight_assignments():
+    # A, B and C all overlap X; only C also overlaps Y and Z. The 3x3
+    # component has no perfect matching, so one assignment has zero weight
+    visual = np.array([[-3, 0, 7, 10], [-3, 1, 7, 11], [3, 0, 13, 10]], dtype=float)  # A, B, C
+    spectral = np.array([[0, 0, 10, 10], [6, 0, 16, 10], [6, 1, 16, 11]], dtype=float)  # X, Y, Z
+    
+    match_idx, match_iou = DetectionFusionEngine('optimal')._match_visual_spectral(visual, spectral)
+    
+    assert (match_idx >= 0).sum() == 2
+    assert sorted(match_idx[:2]) == [-1, 0] and match_idx[2] in (1, 2)
+    np.testing.assert_allclose(match_iou.sum(), _reference_optimal(visual, spectral, 0.3))
+
+
+def _iou(a, b) -> float:
+    inter = max(0.0, min(a[2], b[2]) - max(a[0], b[0])) * max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+    return inter / ((a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter + 1e-10)
+
+
+def _lattice_scene(rng, n):
+    """Integer boxes on a coarse lattice (edges on grid-cell boundaries), some duplicated, some negative"""
+    xy = rng.integers(-5, 15, (n, 2)) * 10.0
+    wh = rng.choice([10.0, 20.0, 30.0], (n, 2))
+    boxes = np.hstack([xy, xy + wh])
+    
+    duplicates = rng.integers(0, n, n // 4)
+    return np.vstack([boxes, boxes[duplicates]])
+
+
+def _detections(boxes, rng, prefix):
+    return [
+        {
+            'detection_id': f"{prefix}{i}",
+            'bbox': box.tolist(),
+            'class_name': str(rng.choice(['pipe', 'leak', 'crack'])),
+            'severity': int(rng.integers(3, 9)),
+            'confidence': float(rng.choice([0.5, 0.6, 0.9]))
+        }
+        for i, box in enumerate(boxes)
+    ]
+
+
+def _reference_changes(engine, before, after, iou_threshold):
+    """Pairwise scan as before the grid index: (type, before index, after index)"""
+    changes, matched_after = [], set()
+    
+    for i, before_det in enumerate(before):
+        matches = [j for j, after_det in enumerate(after) if _iou(before_det['bbox'], after_det['bbox']) >= iou_threshold]
+        matches.sort(key=lambda j: _iou(before_det['bbox'], after[j]['bbox']), reverse=True)
+        
+        if matches:
+            matched_after.add(matches[0])
+            if engine._has_condition_changed(before_det, after[matches[0]]):
+                changes.append(('condition_deteriorated', i, matches[0]))
+        else:
+            change_type = 'possible_repair' if before_det['class_name'] in ['faulty_pipe', 'leak'] else 'infrastructure_loss'
+            changes.append((change_type, i, None))
+    
+    changes += [('new_damage', None, j) for j in range(len(after)) if j not in matched_after]
+    
+    return changes
+
+
+@pytest.mark.parametrize('iou_threshold', [0.3, 0.5])
+@pytest.mark.parametrize('seed', range(15))
+def test_detect_changes_matches_pairwise_scan(seed, iou_threshold):
+    rng = np.random.default_rng(300 + seed)
+    before = _detections(_lattice_scene(rng, int(rng.integers(1, 60))), rng, 'b')
+    after = _detections(_lattice_scene(rng, int(rng.integers(1, 60))), rng, 'a')
+    
+    engine = DetectionFusionEngine()
+    changes = engine.detect_changes(before, after, iou_threshold=iou_threshold)
+    
+    position = {id(det): i for i, det in enumerate(before)} | {id(det): j for j, det in enumerate(after)}
+    found = [
+        (change['change_type'],
+         None if change['before'] is None else position[id(change['before'])],
+         None if change['after'] is None else position[id(change['after'])])
+        for change in changes
+    ]
+    
+    assert found == _reference_changes(engine, before, after, iou_threshold)
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_enhance_with_spectral_matches_pairwise_scan(seed):
+    rng = np.random.default_rng(400 + seed)
+    after = _detections(_lattice_scene(rng, int(rng.integers(1, 50))), rng, 'a')
+    leaks = [
+        {'bbox': box.tolist(), 'combined_confidence': float(k), 'defect_type': 'water_leak'}
+        for k, box in enumerate(_lattice_scene(rng, int(rng.integers(1, 50))))
+    ]
+    changes = [{'change_type': 'new_damage', 'before': None, 'after': det} for det in after]
+    
+    DetectionFusionEngine().enhance_with_spectral(changes, {'leak_details': leaks})
+    
+    for change in changes:
+        # First leak in result order with IoU > 0.1
+        first = next((leak for leak in leaks if _iou(change['after']['bbox'], leak['bbox']) > 0.1), None)
+        
+        assert change.get('spectral_confidence') == (None if first is None else first['combined_confidence'])
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_grid_index_pairs_match_all_pairs(seed):
+    rng = np.random.default_rng(500 + seed)
+    indexed = _lattice_scene(rng, int(rng.integers(1, 80)))
+    queries = _lattice_scene(rng, int(rng.integers(1, 80))) - 35.0   # partly left of / above the origin
+    
+    cell_size = float(rng.choice([10.0, 20.0, 40.0])) if seed % 2 else None
+    query_idx, box_idx = GridIndex(indexed, cell_size=cell_size).query_pairs(queries)
+    
+    overlaps = (
+        (np.minimum(queries[:, None, 2], indexed[None, :, 2]) > np.maximum(queries[:, None, 0], indexed[None, :, 0])) &
+        (np.minimum(queries[:, None, 3], indexed[None, :, 3]) > np.maximum(queries[:, None, 1], indexed[None, :, 1]))
+    )
+    
+    assert list(zip(query_idx.tolist(), box_idx.tolist())) == [tuple(pair) for pair in np.argwhere(overlaps).tolist()]
@@ -0,0 +1,34 @@
+"""
+Spectral Batch Tests
+Per-worker analyzer state in the batch runner
+"""
+
+import numpy as np
+import spectral as spy
+
+from models import spectral_batch
+from models.spectral_analyzer import SpectralAnalyzer
+from test_spectral_streaming import make_analyzer, make_cube
+
+
+def test_cube_without_header_drops_previous_sensor_header(tmp_path):
+    cube = make_cube(make_analyzer('integral'), 20, 20)
+    header = str(tmp_path / 'sensor.hdr')
+    spy.envi.save_image(header, cube, force=True, metadata={'wavelength': list(np.linspace(380.0, 2510.0, 224))})
+    
+    spectral_batch._init_worker({'config': {}, 'library_path': None, 'streaming': False, 'block_rows': 256})
+    analyzer = spectral_batch._worker_analyzer
+    
+    assert spectral_batch._analyze_cube(header)['status'] == 'done'
+    assert analyzer.band_lookup is not None
+    
+    spectral_batch._analyze_cube(str(tmp_path / 'other.lan'))
+    
+    fresh = SpectralAnalyzer()
+    fresh.initialize()
+    
+    assert analyzer.band_lookup is None
+    assert analyzer.reference_spectra.keys() == fresh.reference_spectra.keys()
+    
+    for name, spectrum in fresh.reference_spectra.items():
+        np.testing.assert_array_equal(analyzer.reference_spectra[name], spectrum, err_msg=name)
@@ -0,0 +1,153 @@
+"""
+Incremental Spectral Analysis Tests
+SpectralAnalyzer.analyze_incremental against analyze, tile reuse and the tile store
+"""
+
+import numpy as np
+import pytest
+import spectral as spy
+
+from models.score_tiles import Footprint, ScoreTileStore
+from test_spectral_streaming import make_analyzer, make_cube, save_cube, leak_summary
+
+ROWS, COLS = 60, 70
+
+
+def footprint_at(grid_row: int, grid_col: int) -> Footprint:
+    """Footprint whose upper-left pixel is at (grid_row, grid_col) of a 1 m grid"""
+    return Footprint(float(grid_col), -float(grid_row), 1.0, crs='test')
+
+
+def stored_scores(store: ScoreTileStore, grid_row: int, grid_col: int) -> np.ndarray:
+    """(rows, cols, channels) scores assembled from the store's tiles"""
+    scores = np.full((ROWS, COLS, 4), np.nan)
+    
+    for path in (store.directory / 'tiles').glob('*.npz'):
+        with np.load(path) as data:
+            r0, c0, r1, c1 = data['window']
+            scores[r0 - grid_row:r1 - grid_row, c0 - grid_col:c1 - grid_col] = data['scores']
+    
+    return scores
+
+
+@pytest.mark.parametrize('rx_engine, grid_origin, tile_size', [
+    ('integral', (0, 0), 32),    # 6-column last tile
+    ('spy', (0, 0), 64),
+    ('integral', (20, 27), 32),  # 1-pixel-wide last tile
+    ('spy', (20, 27), 32),
+    ('integral', (5, 63), 16),   # 1-pixel-wide first tile
+])
+def test_first_run_matches_analyze(tmp_path, rx_engine, grid_origin, tile_size):
+    analyzer = make_analyzer(rx_engine)
+    cube = make_cube(analyzer, ROWS, COLS)
+    store = ScoreTileStore(str(tmp_path / 'store'), tile_size=tile_size)
+    
+    results = analyzer.analyze_incremental(save_cube(tmp_path, cube), store, footprint=footprint_at(*grid_origin))
+    full = analyzer.analyze(cube.astype(np.float64))
+    
+    scores = stored_scores(store, *grid_origin)
+    
+    for channel, name in enumerate(('ndwi', 'rx_scores', 'ace_scores', 'mf_scores')):
+        np.testing.assert_allclose(scores[..., channel], full[name], rtol=1e-5, atol=1e-5, err_msg=name)
+    
+    assert results['analysis_metadata']['incremental']['reused_tiles'] == 0
+    assert results['num_leaks'] == full['num_leaks'] > 0
+    assert leak_summary(results) == leak_summary(full)
+
+
+@pytest.fixture
+def scored(tmp_path):
+    """Analyzer, cube, its path and the store after a first run (grid origin (20, 27), 32-pixel tiles)"""
+    analyzer = make_analyzer('integral')
+    cube = make_cube(analyzer, ROWS, COLS)
+    path = save_cube(tmp_path, cube)
+    store_dir = str(tmp_path / 'store')
+    
+    first = analyzer.analyze_incremental(path, ScoreTileStore(store_dir, tile_size=32), footprint=footprint_at(20, 27))
+    
+    return analyzer, cube, path, store_dir, first
+
+
+def test_rerun_reuses_every_tile(scored):
+    analyzer, _, path, store_dir, first = scored
+    
+    again = analyzer.analyze_incremental(path, store_dir, footprint=footprint_at(20, 27))
+    stats = again['analysis_metadata']['incremental']
+    
+    assert stats['reused_tiles'] == stats['tiles'] == 12
+    assert leak_summary(again) == leak_summary(first)
+
+
+def test_only_changed_tiles_are_recomputed(scored, tmp_path):
+    analyzer, cube, _, store_dir, _ = scored
+    
+    # Rows 26-31, cols 17-24 lie inside global tile (1, 1) and the RX halo of tile (1, 0)
+    changed = cube.copy()
+    changed[26:32, 17:25] += 0.01
+    path = save_cube(tmp_path, changed, name='changed')
+    
+    stats = analyzer.analyze_incremental(path, store_dir, footprint=footprint_at(20, 27))['analysis_metadata']['incremental']
+    assert stats['recomputed_tiles'] == 2
+    
+    # A small shift in the mean spectrum is within the drift tolerance
+    changed[26:32, 17:25] += 0.01
+    path = save_cube(tmp_path, changed, name='drifted')
+    
+    stats = analyzer.analyze_incremental(
+        path, store_dir, footprint=footprint_at(20, 27),
+        change_detection='mean_drift', drift_tolerance=0.01
+    )['analysis_metadata']['incremental']
+    assert stats['recomputed_tiles'] == 0
+
+
+def test_changed_tile_refreshes_neighbour_rx(scored, tmp_path):
+    analyzer, cube, _, store_dir, _ = scored
+    
+    # Swapping two blocks outside the MNF noise region keeps the background
+    # model, so analyze of the changed cube is the exact reference. Rows 2-5,
+    # cols 30-33 of global tile (0, 1) are within the RX halo of tile (0, 2).
+    changed = cube.copy()
+    changed[2:6, 30:34], changed[54:58, 63:67] = cube[54:58, 63:67], cube[2:6, 30:34]
+    path = save_cube(tmp_path, changed, name='swapped')
+    
+    results = analyzer.analyze_incremental(path, store_dir, footprint=footprint_at(20, 27))
+    full = analyzer.analyze(changed.astype(np.float64))
+    
+    assert 0 < results['analysis_metadata']['incremental']['reused_tiles'] < 12
+    
+    rx = stored_scores(ScoreTileStore(store_dir), 20, 27)[..., 1]
+    np.testing.assert_allclose(rx, full['rx_scores'], rtol=1e-5, atol=1e-5)
+    assert leak_summary(results) == leak_summary(full)
+
+
+def test_config_change_clears_tiles(scored):
+    analyzer, _, path, store_dir, _ = scored
+    analyzer.rx_window = (3, 21)
+    
+    stats = analyzer.analyze_incremental(
+        path, store_dir, footprint=footprint_at(20, 27)
+    )['analysis_metadata']['incremental']
+    
+    assert stats['reused_tiles'] == 0
+
+
+def test_store_rejects_other_grids(scored):
+    analyzer, _, path, store_dir, _ = scored
+    
+    with pytest.raises(ValueError):
+        analyzer.analyze_incremental(path, store_dir, footprint=Footprint(27.0, -20.0, 2.0, crs='test'))
+
+
+def test_footprint_from_envi_map_info(tmp_path):
+    path = str(tmp_path / 'geo.hdr')
+    spy.envi.save_image(
+        path, np.zeros((4, 5, 3), dtype=np.float32), force=True,
+        metadata={'map info': '{UTM, 2.000, 3.000, 1000.0, 5000.0, 2.0, 2.0, 33, North, WGS-84, units=Meters}'}
+    )
+    
+    footprint = Footprint.from_envi_header(path)
+    
+    # Reference pixel (2, 3) is 1 column and 2 rows from the upper-left corner
+    assert (footprint.easting, footprint.northing) == (998.0, 5004.0)
+    assert footprint.grid_origin() == (-2502, 499)
+    assert footprint.crs == 'UTM 33 North WGS-84'
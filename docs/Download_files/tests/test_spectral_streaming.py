@@ -0,0 +1,87 @@
+"""
+Streaming Spectral Analysis Tests
+SpectralAnalyzer.analyze_file against the in-memory analyze on small synthetic cubes
+"""
+
+import numpy as np
+import pytest
+import spectral as spy
+
+from models.spectral_analyzer import SpectralAnalyzer
+
+SCORE_MAPS = ('ndwi', 'rx_scores', 'ace_scores', 'mf_scores')
+
+
+def make_analyzer(rx_engine: str) -> SpectralAnalyzer:
+    analyzer = SpectralAnalyzer()
+    analyzer.rx_engine = rx_engine
+    analyzer.initialize()
+    return analyzer
+
+
+def make_cube(analyzer: SpectralAnalyzer, rows: int, cols: int, seed: int = 0) -> np.ndarray:
+    """Low-rank background with two water-leak patches (224 bands, float32)"""
+    rng = np.random.default_rng(seed)
+    cube = rng.normal(0, 1, (rows, cols, 8)) @ rng.normal(0, 1, (8, 224)) + 5
+    cube += rng.normal(0, 0.05, cube.shape)
+    
+    water = analyzer.reference_spectra['water_leak']
+    cube[rows // 3:rows // 3 + 6, cols // 3:cols // 3 + 6] = water
+    cube[rows - 6:rows - 1, cols - 7:cols - 1] = water
+    
+    return cube.astype(np.float32)
+
+
+def save_cube(tmp_path, cube: np.ndarray, name: str = 'cube') -> str:
+    path = str(tmp_path / f"{name}.hdr")
+    spy.envi.save_image(path, cube, force=True)
+    return path
+
+
+def leak_summary(results):
+    return [(d['bbox'], d['area_pixels'], d['defect_type']) for d in results['leak_details']]
+
+
+@pytest.fixture(scope='module', params=['integral', 'spy'])
+def analyzer(request):
+    return make_analyzer(request.param)
+
+
+@pytest.mark.parametrize('rows, block_rows', [
+    (60, 16),   # last block shorter than the RX halo
+    (60, 7),    # block_rows + halo < outer window
+    (60, 59),   # rows % block_rows == 1
+    (41, 40),   # rows % block_rows == 1
+    (33, 64),   # one block
+])
+def test_analyze_file_matches_analyze(analyzer, tmp_path, rows, block_rows):
+    cube = make_cube(analyzer, rows, 40)
+    
+    streamed = analyzer.analyze_file(save_cube(tmp_path, cube), block_rows=block_rows, map_downsample=1)
+    full = analyzer.analyze(cube.astype(np.float64))
+    
+    for name in SCORE_MAPS:
+        np.testing.assert_allclose(streamed[name], full[name], rtol=1e-5, atol=1e-5, err_msg=name)
+    
+    assert streamed['num_leaks'] == full['num_leaks'] > 0
+    assert leak_summary(streamed) == leak_summary(full)
+
+
+def test_map_downsample_strides_maps(tmp_path):
+    analyzer = make_analyzer('integral')
+    cube = make_cube(analyzer, 45, 30)
+    
+    streamed = analyzer.analyze_file(save_cube(tmp_path, cube), block_rows=16, map_downsample=4)
+    full = analyzer.analyze(cube.astype(np.float64))
+    
+    for name in SCORE_MAPS + ('ndvi',):
+        np.testing.assert_allclose(streamed[name], full[name][::4, ::4], rtol=1e-5, atol=1e-5, err_msg=name)
+
+
+def test_single_row_detectors_keep_image_shape():
+    analyzer = make_analyzer('spy')
+    cube = make_cube(analyzer, 30, 20).astype(np.float64)
+    background = analyzer.estimate_background(cube)
+    
+    assert analyzer.detect_water_ace(cube[:1], background).shape == (1, 20)
+    assert analyzer.matched_filter_water(cube[:1], background).shape == (1, 20)
@@ -0,0 +1,159 @@
+"""
+Tile Merge Tests
+TileMergeEngine NMS / WBF against a plain one-box-at-a-time greedy loop
+"""
+
+import numpy as np
+import pytest
+
+from models.detection_batch import DetectionBatch
+from models.tile_merge import TileMergeEngine
+
+
+def _iou(a, b) -> float:
+    inter = max(0.0, min(a[2], b[2]) - max(a[0], b[0])) * max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+    return inter / ((a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter + 1e-10)
+
+
+def _reference_nms(boxes, scores, classes, iou_threshold):
+    """Classic greedy NMS: (kept indices, suppressor of every box)"""
+    order = sorted(range(len(boxes)), key=lambda i: (-scores[i], i))
+    keep, suppressor = [], list(range(len(boxes)))
+    
+    for i in order:
+        hits = [k for k in keep if classes[k] == classes[i] and _iou(boxes[k], boxes[i]) > iou_threshold]
+        
+        if hits:
+            suppressor[i] = hits[0]
+        else:
+            keep.append(i)
+    
+    return keep, suppressor
+
+
+def _reference_wbf(boxes, scores, keep, suppressor):
+    """Confidence-weighted mean box of every kept box's cluster"""
+    fused = []
+    
+    for k in keep:
+        members = [i for i in range(len(boxes)) if suppressor[i] == k]
+        weights = scores[members]
+        fused.append((boxes[members] * weights[:, None]).sum(axis=0) / max(weights.sum(), 1e-10))
+    
+    return np.array(fused).reshape(-1, 4)
+
+
+def _random_scene(rng, n, num_classes=3):
+    xy = rng.uniform(0, 300, (n, 2))
+    wh = rng.uniform(5, 60, (n, 2))
+    boxes = np.hstack([xy, xy + wh])
+    
+    # Rounded scores give ties, resolved by original order
+    scores = np.round(rng.random(n), 2)
+    classes = rng.integers(0, num_classes, n)
+    
+    return boxes, scores, classes
+
+
+@pytest.mark.parametrize('seed', range(40))
+def test_greedy_nms_matches_reference(seed):
+    rng = np.random.default_rng(seed)
+    boxes, scores, classes = _random_scene(rng, int(rng.integers(1, 150)))
+    iou_threshold = float(rng.choice([0.1, 0.3, 0.5, 0.7]))
+    
+    keep, suppressor = TileMergeEngine(iou_threshold)._greedy_nms(boxes, scores, classes)
+    ref_keep, ref_suppressor = _reference_nms(boxes, scores, classes, iou_threshold)
+    
+    assert keep.tolist() == ref_keep
+    assert suppressor.tolist() == ref_suppressor
+
+
+@pytest.mark.parametrize('max_rounds', [0, 1, 3])
+@pytest.mark.parametrize('seed', range(10))
+def test_sequential_pass_matches_reference(seed, max_rounds):
+    rng = np.random.default_rng(200 + seed)
+    boxes, scores, classes = _random_scene(rng, int(rng.integers(1, 150)))
+    
+    engine = TileMergeEngine(0.3)
+    engine.MAX_ROUNDS = max_rounds
+    keep, suppressor = engine._greedy_nms(boxes, scores, classes)
+    ref_keep, ref_suppressor = _reference_nms(boxes, scores, classes, 0.3)
+    
+    assert keep.tolist() == ref_keep
+    assert suppressor.tolist() == ref_suppressor
+
+
+@pytest.mark.parametrize('reverse', [False, True])
+def test_suppression_chain_matches_reference(reverse):
+    # Each box overlaps only its neighbours; scores fall along the chain, so
+    # every decision waits for the previous one (far more layers than MAX_ROUNDS)
+    n = 301
+    x = np.arange(n) * 3.0
+    boxes = np.stack([x, np.zeros(n), x + 10.0, np.full(n, 10.0)], axis=1)
+    scores = np.linspace(1.0, 0.01, n)[::-1 if reverse else 1]
+    classes = np.repeat([0, 1], [200, 101])
+    
+    keep, suppressor = TileMergeEngine(0.5)._greedy_nms(boxes, scores, classes)
+    ref_keep, ref_suppressor = _reference_nms(boxes, scores, classes, 0.5)
+    
+    assert keep.tolist() == ref_keep
+    assert suppressor.tolist() == ref_suppressor
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_wbf_matches_reference(seed):
+    rng = np.random.default_rng(100 + seed)
+    boxes, scores, classes = _random_scene(rng, int(rng.integers(1, 120)))
+    
+    merged = TileMergeEngine(0.3, mode='wbf').merge(DetectionBatch(boxes, scores, classes))
+    
+    keep, suppressor = _reference_nms(boxes, scores, classes, 0.3)
+    
+    np.testing.assert_allclose(merged.bbox, _reference_wbf(boxes, scores, keep, suppressor), rtol=1e-12, atol=1e-9)
+    np.testing.assert_array_equal(merged.confidence, scores[keep])
+
+
+def test_classes_never_suppress_each_other():
+    rng = np.random.default_rng(7)
+    boxes, scores, _ = _random_scene(rng, 60)
+    
+    # Every box repeated in three classes, including negative coordinates
+    boxes = np.vstack([boxes - 150.0] * 3)
+    scores = np.tile(scores, 3)
+    classes = np.repeat([0, 5, 2], 60)
+    
+    keep, suppressor = TileMergeEngine(0.5)._greedy_nms(boxes, scores, classes)
+    ref_keep, ref_suppressor = _reference_nms(boxes, scores, classes, 0.5)
+    
+    assert keep.tolist() == ref_keep
+    assert suppressor.tolist() == ref_suppressor
+    assert np.all(classes[suppressor] == classes)
+
+
+def test_identical_boxes_of_different_classes_are_all_kept():
+    boxes = np.array([[0, 0, 10, 10]] * 3, dtype=float)
+    
+    keep = TileMergeEngine(0.5).nms_indices(boxes, [0.9, 0.8, 0.7], [0, 1, 2])
+    
+    assert keep.tolist() == [0, 1, 2]
+
+
+def test_iou_equal_to_threshold_does_not_suppress():
+    # Suppression needs IoU > threshold; use the pair's exact IoU as threshold
+    boxes = np.array([[0, 0, 10, 10], [0, 0, 10, 20]], dtype=float)
+    iou_threshold = _iou(boxes[0], boxes[1])
+    
+    assert TileMergeEngine(iou_threshold).nms_indices(boxes, [0.9, 0.8], [0, 0]).tolist() == [0, 1]
+    assert _reference_nms(boxes, [0.9, 0.8], [0, 0], iou_threshold)[0] == [0, 1]
+    
+    assert TileMergeEngine(iou_threshold - 1e-9).nms_indices(boxes, [0.9, 0.8], [0, 0]).tolist() == [0]
+
+
+def test_score_threshold_and_empty_input():
+    engine = TileMergeEngine(0.5)
+    
+    assert len(engine.merge(DetectionBatch(np.zeros((0, 4)), np.zeros(0)))) == 0
+    
+    batch = DetectionBatch(np.array([[0, 0, 10, 10], [50, 50, 60, 60]], dtype=float), [0.9, 0.2], [0, 0])
+    
+    assert engine.merge(batch, score_threshold=0.5).confidence.tolist() == [0.9]
@@ -0,0 +1,232 @@
+"""
+Cross-Tile Merge Engine
+Vectorized NMS / weighted box fusion for detections from overlapping tiles
+"""
+
+import numpy as np
+from typing import Tuple
+import logging
+
+from models.detection_batch import DetectionBatch
+from models.spatial_index import GridIndex, box_iou_pairs
+
+logger = logging.getLogger(__name__)
+
+
+class TileMergeEngine:
+    """
+    Removes duplicate detections produced by overlapping tiles
+    
+    Boxes of different classes are shifted apart (class offset) so one
+    spatial query covers every class. Overlapping pairs come from a grid
+    index instead of an all-pairs matrix, and greedy NMS is resolved in
+    vectorized rounds over those pairs, giving the same result as the
+    classic one-box-at-a-time loop. Each round only settles one layer
+    of a suppression chain, so after MAX_ROUNDS the boxes still
+    undecided (long chains along dense seams) are finished by one
+    sequential pass over their pairs.
+    
+    Modes:
+        nms - keep the highest-scoring box of each duplicate cluster
+        wbf - weighted box fusion: the kept box takes the confidence-weighted
+              mean coordinates of the boxes it suppressed (boxes split at
+              tile seams are merged instead of dropped)
+    """
+    
+    MODES = ('nms', 'wbf')
+    
+    # Vectorized rounds before the sequential pass takes over
+    MAX_ROUNDS = 8
+    
+    def __init__(self, iou_threshold: float = 0.5, mode: str = 'nms'):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown merge mode: {mode}")
+        
+        self.iou_threshold = iou_threshold
+        self.mode = mode
+    
+    def merge(
+        self,
+        detections: DetectionBatch,
+        score_threshold: float = 0.0
+    ) -> DetectionBatch:
+        """
+        Merge duplicate detections
+        
+        Args:
+            detections: Detections in global (mosaic) coordinates
+            score_threshold: Drop detections below this confidence first
+        
+        Returns:
+            Surviving detections, highest confidence first
+        """
+        candidates = np.flatnonzero(detections.confidence >= score_threshold)
+        detections = detections.select(candidates)
+        
+        keep, suppressor = self._greedy_nms(
+            detections.bbox,
+            detections.confidence,
+            detections.class_id
+        )
+        
+        merged = detections.select(keep)
+        
+        if self.mode == 'wbf' and len(merged) > 0:
+            merged.bbox = self._fuse_boxes(detections, keep, suppressor)
+            merged.area = (merged.bbox[:, 2] - merged.bbox[:, 0]) * (merged.bbox[:, 3] - merged.bbox[:, 1])
+            merged.center = (merged.bbox[:, :2] + merged.bbox[:, 2:]) / 2
+        
+        logger.debug(f"Tile merge ({self.mode}): {len(candidates)} -> {len(merged)} detections")
+        
+        return merged
+    
+    def nms_indices(
+        self,
+        boxes: np.ndarray,
+        scores: np.ndarray,
+        classes: np.ndarray
+    ) -> np.ndarray:
+        """Indices kept by per-class greedy NMS, highest score first"""
+        keep, _ = self._greedy_nms(
+            np.asarray(boxes, dtype=np.float64).reshape(-1, 4),
+            np.asarray(scores, dtype=np.float64).reshape(-1),
+            np.asarray(classes).reshape(-1)
+        )
+        return keep
+    
+    # Private methods
+    
+    def _greedy_nms(
+        self,
+        boxes: np.ndarray,
+        scores: np.ndarray,
+        classes: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Greedy per-class NMS over sparse overlap pairs
+        
+        Returns:
+            keep: kept indices sorted by descending score
+            suppressor: for every box, the kept box that suppressed it
+                        (its own index if kept)
+        """
+        n = len(boxes)
+        
+        if n == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        
+        # Rank 0 = highest score; ties resolved by original order
+        order = np.lexsort((np.arange(n), -scores))
+        rank = np.empty(n, dtype=np.int64)
+        rank[order] = np.arange(n)
+        
+        hi, lo = self._overlap_pairs(boxes, classes)
+        
+        # Orient every pair as (higher-ranked, lower-ranked)
+        swap = rank[hi] > rank[lo]
+        hi, lo = np.where(swap, lo, hi), np.where(swap, hi, lo)
+        
+        # 1 kept, 0 suppressed, -1 undecided
+        state = np.full(n, -1, dtype=np.int8)
+        
+        for _ in range(self.MAX_ROUNDS):
+            undecided = state < 0
+            if not undecided.any():
+                break
+            
+            # Suppressed by a kept higher-ranked neighbour
+            hit = (state[hi] == 1) & undecided[lo]
+            suppressed_now = np.zeros(n, dtype=bool)
+            suppressed_now[lo[hit]] = True
+            
+            # Kept once no undecided/kept higher-ranked neighbour remains
+            blocking = np.zeros(n, dtype=np.int64)
+            pending = state[hi] != 0
+            np.add.at(blocking, lo[pending], 1)
+            
+            state[suppressed_now] = 0
+            state[undecided & ~suppressed_now & (blocking == 0)] = 1
+        
+        if (state < 0).any():
+            state = self._sequential_nms(state, rank, hi, lo)
+        
+        keep = np.flatnonzero(state == 1)
+        keep = keep[np.argsort(rank[keep])]
+        
+        # Suppressor = highest-ranked kept neighbour (what the greedy loop picks)
+        suppressor = np.arange(n)
+        by_kept = state[hi] == 1
+        kept_hi, kept_lo = hi[by_kept], lo[by_kept]
+        first = np.lexsort((rank[kept_hi], kept_lo))
+        kept_hi, kept_lo = kept_hi[first], kept_lo[first]
+        starts = np.concatenate([[True], kept_lo[1:] != kept_lo[:-1]]) if len(kept_lo) else np.zeros(0, dtype=bool)
+        suppressor[kept_lo[starts]] = kept_hi[starts]
+        
+        return keep, suppressor
+    
+    def _sequential_nms(
+        self,
+        state: np.ndarray,
+        rank: np.ndarray,
+        hi: np.ndarray,
+        lo: np.ndarray
+    ) -> np.ndarray:
+        """Settle the undecided boxes one at a time in rank order"""
+        # Higher-ranked neighbours that can still suppress an undecided box
+        live = (state[lo] < 0) & (state[hi] != 0)
+        by_box = np.argsort(lo[live], kind='stable')
+        neighbours, owners = hi[live][by_box], lo[live][by_box]
+        
+        undecided = np.flatnonzero(state < 0)
+        undecided = undecided[np.argsort(rank[undecided])]
+        starts = np.searchsorted(owners, undecided)
+        stops = np.searchsorted(owners, undecided, side='right')
+        
+        # Plain lists: this loop visits one box at a time
+        states = state.tolist()
+        neighbours = neighbours.tolist()
+        
+        for box, start, stop in zip(undecided.tolist(), starts.tolist(), stops.tolist()):
+            states[box] = 0 if any(states[other] == 1 for other in neighbours[start:stop]) else 1
+        
+        return np.asarray(states, dtype=np.int8)
+    
+    def _overlap_pairs(
+        self,
+        boxes: np.ndarray,
+        classes: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Same-class (i, j) pairs, i < j, with IoU above iou_threshold"""
+        # Shift each class into its own region so classes never overlap
+        span = float(np.max(boxes[:, 2:]) - np.min(boxes[:, :2])) + 1.0
+        _, class_index = np.unique(classes, return_inverse=True)
+        offset = (class_index.reshape(-1) * span * 2)[:, None]
+        shifted = boxes + np.hstack([offset, np.zeros_like(offset), offset, np.zeros_like(offset)])
+        
+        index = GridIndex(shifted)
+        i, j = index.query_pairs(shifted)
+        
+        upper = i < j
+        i, j = i[upper], j[upper]
+        
+        above = box_iou_pairs(boxes[i], boxes[j]) > self.iou_threshold
+        
+        return i[above], j[above]
+    
+    def _fuse_boxes(
+        self,
+        detections: DetectionBatch,
+        keep: np.ndarray,
+        suppressor: np.ndarray
+    ) -> np.ndarray:
+        """Confidence-weighted mean box of every kept box's cluster"""
+        cluster_of_kept = np.full(len(detections), -1, dtype=np.int64)
+        cluster_of_kept[keep] = np.arange(len(keep))
+        cluster = cluster_of_kept[suppressor]
+        
+        weights = detections.confidence
+        fused = np.zeros((len(keep), 4))
+        np.add.at(fused, cluster, detections.bbox * weights[:, None])
+        total = np.bincount(cluster, weights=weights, minlength=len(keep))
+        
+        return fused / np.maximum(total, 1e-10)[:, None]
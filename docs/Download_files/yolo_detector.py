@@ -5,10 +5,17 @@ Handles visual detection from satellite and drone imagery
 
 from ultralytics import YOLO
 import numpy as np
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Union
 import logging
 import cv2
 from pathlib import Path
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+from models.detection_batch import DetectionBatch
+from models.tile_merge import TileMergeEngine
+from models.inference_backends import create_backend
 
 logger = logging.getLogger(__name__)
 
@@ -19,8 +26,44 @@ class YOLODetector:
     Detects pipes, leaks, cracks, corrosion from RGB imagery
     """
     
-    def __init__(self, model_path: str = "yolov8x.pt"):
+    BACKENDS = ('pytorch', 'onnx', 'openvino')
+    
+    def __init__(
+        self,
+        model_path: str = "yolov8x.pt",
+        backend: str = 'pytorch',
+        num_threads: Optional[int] = None,
+        device: Optional[str] = None,
+        quantization: Optional[str] = None,
+        calibration_images: Optional[List[str]] = None
+    ):
+        """
+        Args:
+            model_path: .pt weights, or an .onnx model for the ONNX backends
+            backend: Inference engine - 'pytorch' (ultralytics), 'onnx'
+                     (ONNX Runtime CPU) or 'openvino' (ONNX Runtime with the
+                     OpenVINO execution provider from onnxruntime-openvino).
+                     .pt weights are exported to ONNX on load for the ONNX
+                     backends.
+            num_threads: ONNX Runtime intra-op threads (None = runtime default)
+            device: Torch device for PyTorch inference and training
+                    (None = auto-select, 'cpu' for CPU-only hosts)
+            quantization: Reduced-precision model for the ONNX backends -
+                          'dynamic' (INT8 weights), 'static' (INT8 weights
+                          and activations, needs calibration_images) or
+                          'fp16'. None runs the full-precision model.
+            calibration_images: Representative image paths for static INT8
+        """
+        if backend not in self.BACKENDS:
+            raise ValueError(f"Unknown inference backend: {backend}")
+        
         self.model_path = model_path
+        self.backend_name = backend
+        self.num_threads = num_threads
+        self.device = device
+        self.quantization = quantization
+        self.calibration_images = calibration_images
+        self.backend = None
         self.model = None
         self.loaded = False
         
@@ -39,13 +82,36 @@ class YOLODetector:
         self.conf_threshold = 0.25
         self.iou_threshold = 0.45
         self.max_det = 300
+        self.imgsz = 640           # Network input size for exported models
+        
+        # Tiled detection parameters
+        self.tile_batch_size = 8   # Tiles per predict() call
+        self.tile_workers = 2      # Threads preparing tile batches ahead of inference
+        
+        # Cross-tile duplicate removal ('nms' or 'wbf' to fuse seam-split boxes)
+        self.tile_merger = TileMergeEngine(iou_threshold=0.5, mode='nms')
         
     def load_model(self):
         """Load YOLO model"""
         try:
-            logger.info(f"Loading YOLOv8 model from {self.model_path}")
+            logger.info(
+                f"Loading YOLOv8 model from {self.model_path} "
+                f"({self.backend_name} backend, {self.quantization or 'full'} precision)"
+            )
+            
+            self.backend = create_backend(
+                self.backend_name,
+                self.model_path,
+                imgsz=self.imgsz,
+                num_threads=self.num_threads,
+                device=self.device,
+                quantization=self.quantization,
+                calibration_images=self.calibration_images
+            )
+            self.backend.load()
             
-            self.model = YOLO(self.model_path)
+            # ultralytics model (PyTorch backend only) - also used by train()
+            self.model = getattr(self.backend, 'model', None)
             self.loaded = True
             
             logger.info("YOLOv8 model loaded successfully")
@@ -62,8 +128,9 @@ class YOLODetector:
         self,
         image: np.ndarray,
         conf: Optional[float] = None,
-        iou: Optional[float] = None
-    ) -> List[Dict[str, Any]]:
+        iou: Optional[float] = None,
+        as_batch: bool = False
+    ) -> Union[List[Dict[str, Any]], DetectionBatch]:
         """
         Run detection on image
         
@@ -71,6 +138,7 @@ class YOLODetector:
             image: RGB image as numpy array
             conf: Confidence threshold (optional)
             iou: IoU threshold (optional)
+            as_batch: Return a columnar DetectionBatch instead of dicts
             
         Returns:
             List of detections with bounding boxes and metadata
@@ -82,20 +150,19 @@ class YOLODetector:
             logger.info(f"Running YOLOv8 detection on image: {image.shape}")
             
             # Run inference
-            results = self.model.predict(
-                image,
+            results = self.backend.predict(
+                [image],
                 conf=conf or self.conf_threshold,
                 iou=iou or self.iou_threshold,
-                max_det=self.max_det,
-                verbose=False
+                max_det=self.max_det
             )
             
             # Parse results
-            detections = self._parse_results(results[0], image.shape)
+            detections = self._parse_batch(results[0], image.shape)
             
             logger.info(f"YOLOv8 detected {len(detections)} objects")
             
-            return detections
+            return detections if as_batch else detections.to_dicts()
             
         except Exception as e:
             logger.error(f"YOLOv8 detection failed: {str(e)}", exc_info=True)
@@ -105,70 +172,123 @@ class YOLODetector:
         self,
         image: np.ndarray,
         tile_size: int = 1024,
-        overlap: int = 128
-    ) -> List[Dict[str, Any]]:
+        overlap: int = 128,
+        as_batch: bool = False,
+        batch_size: Optional[int] = None,
+        num_workers: Optional[int] = None
+    ) -> Union[List[Dict[str, Any]], DetectionBatch]:
         """
         Detect on large images using tiled approach
         Essential for satellite imagery
         
+        Tiles are grouped into batches for a single predict() call while
+        worker threads slice the next batches.
+        
         Args:
             image: Large RGB image
             tile_size: Size of each tile
             overlap: Overlap between tiles (for edge detection)
+            as_batch: Return a columnar DetectionBatch instead of dicts
+            batch_size: Tiles per predict() call (default: tile_batch_size)
+            num_workers: Tile slicing threads (default: tile_workers)
             
         Returns:
             Combined detections from all tiles
         """
+        if not self.loaded:
+            raise RuntimeError("Model not loaded. Call load_model() first.")
+        
         try:
             logger.info(f"Tiled detection: image {image.shape}, tile {tile_size}, overlap {overlap}")
             
             height, width = image.shape[:2]
-            all_detections = []
-            
-            # Calculate tile positions
-            stride = tile_size - overlap
-            y_positions = range(0, height - tile_size + 1, stride)
-            x_positions = range(0, width - tile_size + 1, stride)
-            
-            # Add final positions to cover edges
-            if y_positions[-1] + tile_size < height:
-                y_positions = list(y_positions) + [height - tile_size]
-            if x_positions[-1] + tile_size < width:
-                x_positions = list(x_positions) + [width - tile_size]
-            
-            total_tiles = len(y_positions) * len(x_positions)
-            logger.info(f"Processing {total_tiles} tiles")
-            
-            # Process each tile
-            for tile_idx, y in enumerate(y_positions):
-                for x in x_positions:
-                    # Extract tile
-                    tile = image[y:y+tile_size, x:x+tile_size]
-                    
-                    # Detect on tile
-                    tile_detections = self.detect(tile)
-                    
-                    # Transform coordinates to global space
-                    for det in tile_detections:
-                        det['bbox'][0] += x  # x1
-                        det['bbox'][1] += y  # y1
-                        det['bbox'][2] += x  # x2
-                        det['bbox'][3] += y  # y2
-                        det['tile_origin'] = (x, y)
-                    
-                    all_detections.extend(tile_detections)
-            
-            # Apply Non-Maximum Suppression across tiles
-            final_detections = self._global_nms(all_detections)
+            origins = self._tile_origins(height, width, tile_size, overlap)
+            
+            logger.info(f"Processing {len(origins)} tiles")
+            
+            def read_tile(x: int, y: int) -> np.ndarray:
+                return image[y:y+tile_size, x:x+tile_size]
+            
+            all_detections = self._detect_tile_stream(
+                read_tile,
+                origins,
+                batch_size or self.tile_batch_size,
+                num_workers or self.tile_workers
+            )
+            
+            # Apply Non-Maximum Suppression across tile seams
+            final_detections = self._merge_tiles(all_detections, origins, tile_size)
             
             logger.info(f"Tiled detection complete: {len(final_detections)} objects after NMS")
             
-            return final_detections
+            return final_detections if as_batch else final_detections.to_dicts()
             
         except Exception as e:
             logger.error(f"Tiled detection failed: {str(e)}")
             raise
     
+    def detect_tiles_from_path(
+        self,
+        image_path: str,
+        tile_size: int = 1024,
+        overlap: int = 128,
+        as_batch: bool = False,
+        batch_size: Optional[int] = None,
+        num_workers: Optional[int] = None
+    ) -> Union[List[Dict[str, Any]], DetectionBatch]:
+        """
+        Tiled detection on a mosaic that is never loaded into memory
+        
+        .npy arrays are memory-mapped and tiles are passed as views into
+        the mapping; rasters (GeoTIFF, etc.) are read one tile window at a
+        time. Peak memory is bounded by the prefetched batches
+        (~ batch_size x tile_size^2 per batch) regardless of mosaic size.
+        
+        Args:
+            image_path: Path to a (rows, cols, 3) .npy array or a raster
+                readable by rasterio (first three bands are used as RGB)
+            tile_size: Size of each tile
+            overlap: Overlap between tiles (for edge detection)
+            as_batch: Return a columnar DetectionBatch instead of dicts
+            batch_size: Tiles per predict() call (default: tile_batch_size)
+            num_workers: Tile reading threads (default: tile_workers)
+        
+        Returns:
+            Combined detections from all tiles
+        """
+        if not self.loaded:
+            raise RuntimeError("Model not loaded. Call load_model() first.")
+        
+        reader = _MosaicTileReader(image_path, tile_size)
+        
+        try:
+            logger.info(f"Tiled detection from {image_path}: {reader.height}x{reader.width}, tile {tile_size}, overlap {overlap}")
+            
+            origins = self._tile_origins(reader.height, reader.width, tile_size, overlap)
+            
+            logger.info(f"Processing {len(origins)} tiles")
+            
+            all_detections = self._detect_tile_stream(
+                reader.read_tile,
+                origins,
+                batch_size or self.tile_batch_size,
+                num_workers or self.tile_workers
+            )
+            
+            # Apply Non-Maximum Suppression across tile seams
+            final_detections = self._merge_tiles(all_detections, origins, tile_size)
+            
+            logger.info(f"Tiled detection complete: {len(final_detections)} objects after NMS")
+            
+            return final_detections if as_batch else final_detections.to_dicts()
+        
+        except Exception as e:
+            logger.error(f"Tiled detection from path failed: {str(e)}")
+            raise
+        
+        finally:
+            reader.close()
+    
     def detect_from_path(self, image_path: str) -> List[Dict[str, Any]]:
         """Load image from path and detect"""
         try:
@@ -252,7 +372,8 @@ class YOLODetector:
         epochs: int = 100,
         batch_size: int = 16,
         imgsz: int = 640,
-        name: str = "wpdd_model"
+        name: str = "wpdd_model",
+        device: Optional[str] = None
     ):
         """
         Train YOLOv8 model on custom dataset
@@ -263,10 +384,15 @@ class YOLODetector:
             batch_size: Batch size
             imgsz: Image size
             name: Experiment name
+            device: Torch device (default: the detector's device, auto if None)
         """
         try:
             logger.info(f"Starting YOLOv8 training: {epochs} epochs, batch {batch_size}")
             
+            # ONNX backends have no trainable model - train from the weights
+            if self.model is None:
+                self.model = YOLO(self.model_path)
+            
             results = self.model.train(
                 data=data_yaml,
                 epochs=epochs,
@@ -275,7 +401,7 @@ class YOLODetector:
                 name=name,
                 patience=50,
                 save=True,
-                device=0,  # GPU
+                device=device if device is not None else self.device,
                 workers=8,
                 optimizer='auto',
                 verbose=True,
@@ -293,36 +419,201 @@ class YOLODetector:
     
     # Private methods
     
+    def _tile_origins(
+        self,
+        height: int,
+        width: int,
+        tile_size: int,
+        overlap: int
+    ) -> np.ndarray:
+        """(num_tiles, 2) array of x, y tile origins covering the image"""
+        stride = tile_size - overlap
+        
+        def positions(length: int) -> List[int]:
+            steps = list(range(0, max(length - tile_size, 0) + 1, stride))
+            # Add final position to cover edges
+            if steps[-1] + tile_size < length:
+                steps.append(length - tile_size)
+            return steps
+        
+        ys, xs = np.meshgrid(positions(height), positions(width), indexing='ij')
+        
+        return np.stack([xs.ravel(), ys.ravel()], axis=1)
+    
+    def _detect_tile_stream(
+        self,
+        read_tile,
+        origins: np.ndarray,
+        batch_size: int,
+        num_workers: int
+    ) -> DetectionBatch:
+        """
+        Run batched inference over tiles, prefetching batches on a thread pool
+        
+        Args:
+            read_tile: Callable (x, y) -> tile array
+            origins: (num_tiles, 2) x, y tile origins
+            batch_size: Tiles per predict() call
+            num_workers: Threads reading tiles ahead of inference
+        
+        Returns:
+            Detections from all tiles in global coordinates, with a
+            'tile_origin' column
+        """
+        def load_batch(batch_origins: np.ndarray) -> List[np.ndarray]:
+            return [read_tile(int(x), int(y)) for x, y in batch_origins]
+        
+        chunks = [origins[i:i + batch_size] for i in range(0, len(origins), batch_size)]
+        tile_batches = []
+        
+        with ThreadPoolExecutor(max_workers=max(num_workers, 1)) as executor:
+            # Bounded prefetch window keeps at most a few batches in memory
+            pending = deque()
+            next_chunk = 0
+            
+            while next_chunk < len(chunks) or pending:
+                while next_chunk < len(chunks) and len(pending) < max(num_workers, 1) + 1:
+                    pending.append((chunks[next_chunk], executor.submit(load_batch, chunks[next_chunk])))
+                    next_chunk += 1
+                
+                batch_origins, future = pending.popleft()
+                tile_batches.append(self._predict_tiles(future.result(), batch_origins))
+        
+        return DetectionBatch.concatenate(tile_batches) if tile_batches else DetectionBatch.empty(
+            source='yolov8',
+            class_names=self.classes,
+            columns={'tile_origin': np.zeros((0, 2), dtype=np.int32)}
+        )
+    
+    def _merge_tiles(
+        self,
+        detections: DetectionBatch,
+        origins: np.ndarray,
+        tile_size: int
+    ) -> DetectionBatch:
+        """
+        Cross-tile duplicate removal restricted to overlap strips
+        
+        A duplicate pair comes from two tiles, and both boxes must reach
+        into those tiles' shared overlap. Detections that touch no overlap
+        strip of their own tile therefore pass through untouched, and only
+        the seam subset is merged (the merge engine's grid index keeps
+        that work local to each seam).
+        """
+        on_seam = self._seam_mask(detections, origins, tile_size)
+        detections.columns['on_seam'] = on_seam
+        
+        above = detections.confidence >= self.conf_threshold
+        
+        merged = DetectionBatch.concatenate([
+            detections.select(~on_seam & above),
+            self.tile_merger.merge(
+                detections.select(on_seam),
+                score_threshold=self.conf_threshold
+            )
+        ])
+        
+        logger.debug(f"Seam merge: {int(on_seam.sum())} of {len(detections)} detections on overlap strips")
+        
+        return merged.select(np.argsort(-merged.confidence, kind='stable'))
+    
+    def _seam_mask(
+        self,
+        detections: DetectionBatch,
+        origins: np.ndarray,
+        tile_size: int
+    ) -> np.ndarray:
+        """Whether each detection touches an overlap strip of its tile_origin"""
+        if len(detections) == 0:
+            return np.zeros(0, dtype=bool)
+        
+        tile_origin = detections.columns['tile_origin']
+        on_seam = np.zeros(len(detections), dtype=bool)
+        
+        for axis in (0, 1):
+            positions = np.unique(origins[:, axis])
+            k = np.searchsorted(positions, tile_origin[:, axis])
+            
+            # Strip shared with the previous tile ends where that tile ends;
+            # strip shared with the next tile starts where that tile starts
+            prev_end = np.where(k > 0, positions[np.maximum(k - 1, 0)] + tile_size, -np.inf)
+            next_start = np.where(k < len(positions) - 1, positions[np.minimum(k + 1, len(positions) - 1)], np.inf)
+            
+            low, high = detections.bbox[:, axis], detections.bbox[:, axis + 2]
+            on_seam |= (low < prev_end) | (high > next_start)
+        
+        return on_seam
+    
+    def _predict_tiles(
+        self,
+        tiles: List[np.ndarray],
+        origins: np.ndarray
+    ) -> DetectionBatch:
+        """Single predict() call over a list of tiles, offset to global coordinates"""
+        results = self.backend.predict(
+            tiles,
+            conf=self.conf_threshold,
+            iou=self.iou_threshold,
+            max_det=self.max_det
+        )
+        
+        batch = DetectionBatch.concatenate([
+            self._parse_batch(result, tile.shape)
+            for result, tile in zip(results, tiles)
+        ])
+        
+        counts = [len(result) for result in results]
+        tile_origin = np.repeat(np.asarray(origins, dtype=np.int32), counts, axis=0)
+        
+        # Transform coordinates to global space
+        batch.translate(tile_origin)
+        batch.columns['tile_origin'] = tile_origin
+        
+        return batch
+    
     def _parse_results(
         self,
         result,
         image_shape: tuple
     ) -> List[Dict[str, Any]]:
         """Parse YOLO results into structured format"""
-        detections = []
+        return self._parse_batch(result, image_shape).to_dicts()
+    
+    def _parse_batch(
+        self,
+        result,
+        image_shape: tuple
+    ) -> DetectionBatch:
+        """
+        Parse YOLO results into a columnar DetectionBatch
         
-        if result.boxes is None or len(result.boxes) == 0:
-            return detections
+        Accepts an ultralytics result or the (n, 6) x1, y1, x2, y2,
+        confidence, class_id array every inference backend returns.
+        """
+        if not isinstance(result, np.ndarray):
+            result = (
+                result.boxes.data.cpu().numpy()
+                if result.boxes is not None
+                else np.zeros((0, 6), dtype=np.float32)
+            )
         
-        boxes = result.boxes.data.cpu().numpy()
+        if len(result) == 0:
+            return DetectionBatch.empty(
+                image_shape=image_shape,
+                source='yolov8',
+                class_names=self.classes
+            )
         
-        for box in boxes:
-            x1, y1, x2, y2, conf, cls = box
-            
-            detection = {
-                'bbox': [float(x1), float(y1), float(x2), float(y2)],
-                'confidence': float(conf),
-                'class_id': int(cls),
-                'class_name': self.classes.get(int(cls), 'unknown'),
-                'area': float((x2 - x1) * (y2 - y1)),
-                'center': [float((x1 + x2) / 2), float((y1 + y2) / 2)],
-                'image_shape': image_shape,
-                'detection_source': 'yolov8'
-            }
-            
-            detections.append(detection)
+        boxes = result
         
-        return detections
+        return DetectionBatch(
+            bbox=boxes[:, :4],
+            confidence=boxes[:, 4],
+            class_id=boxes[:, 5].astype(np.int32),
+            image_shape=image_shape,
+            source='yolov8',
+            class_names=self.classes
+        )
     
     def _global_nms(
         self,
@@ -341,28 +632,16 @@ class YOLODetector:
         scores = np.array([det['confidence'] for det in detections])
         classes = np.array([det['class_id'] for det in detections])
         
-        # Apply NMS per class
-        keep_indices = []
-        
-        for class_id in np.unique(classes):
-            class_mask = classes == class_id
-            class_boxes = boxes[class_mask]
-            class_scores = scores[class_mask]
-            class_indices = np.where(class_mask)[0]
-            
-            # NMS using OpenCV
-            keep = cv2.dnn.NMSBoxes(
-                class_boxes.tolist(),
-                class_scores.tolist(),
-                self.conf_threshold,
-                iou_threshold
-            )
-            
-            if len(keep) > 0:
-                keep_indices.extend(class_indices[keep.flatten()].tolist())
+        # Per-class NMS (class-offset, vectorized) on boxes above conf_threshold
+        candidates = np.flatnonzero(scores >= self.conf_threshold)
+        keep = TileMergeEngine(iou_threshold=iou_threshold).nms_indices(
+            boxes[candidates],
+            scores[candidates],
+            classes[candidates]
+        )
         
         # Return filtered detections
-        filtered = [detections[i] for i in keep_indices]
+        filtered = [detections[i] for i in candidates[keep]]
         
         logger.debug(f"NMS: {len(detections)} -> {len(filtered)} detections")
         
@@ -381,3 +660,71 @@ class YOLODetector:
         }
         
         return color_map.get(class_name, (128, 128, 128))  # Gray default
+
+
+class _MosaicTileReader:
+    """
+    Reads square tiles from a mosaic on disk without loading it whole
+    
+    .npy files are memory-mapped (tiles are views). Other formats go
+    through rasterio windowed reads with one dataset handle per thread,
+    since rasterio datasets are not safe to share between threads.
+    """
+    
+    def __init__(self, image_path: str, tile_size: int):
+        self.image_path = str(image_path)
+        self.tile_size = tile_size
+        self._local = threading.local()
+        self._datasets = []
+        self._lock = threading.Lock()
+        self._array = None
+        
+        if Path(self.image_path).suffix.lower() == '.npy':
+            self._array = np.load(self.image_path, mmap_mode='r')
+            self.height, self.width = self._array.shape[:2]
+        else:
+            dataset = self._dataset()
+            self.height, self.width = dataset.height, dataset.width
+            self._bands = [1, 2, 3] if dataset.count >= 3 else [1, 1, 1]
+    
+    def read_tile(self, x: int, y: int) -> np.ndarray:
+        """(tile, tile, 3) RGB tile with top-left corner at x, y"""
+        if self._array is not None:
+            return self._array[y:y + self.tile_size, x:x + self.tile_size]
+        
+        from rasterio.windows import Window
+        
+        window = Window(
+            x,
+            y,
+            min(self.tile_size, self.width - x),
+            min(self.tile_size, self.height - y)
+        )
+        
+        # (bands, rows, cols) -> (rows, cols, bands) view
+        return self._dataset().read(self._bands, window=window).transpose(1, 2, 0)
+    
+    def close(self):
+        """Close all per-thread raster handles"""
+        with self._lock:
+            for dataset in self._datasets:
+                dataset.close()
+            self._datasets = []
+        
+        self._array = None
+    
+    def _dataset(self):
+        """Raster handle owned by the calling thread"""
+        dataset = getattr(self._local, 'dataset', None)
+        
+        if dataset is None:
+            # rasterio (GDAL) is only needed for non-.npy mosaics
+            import rasterio
+            
+            dataset = rasterio.open(self.image_path)
+            self._local.dataset = dataset
+            
+            with self._lock:
+                self._datasets.append(dataset)
+        
+        return dataset